@@ -1,44 +1,61 @@
 import dash
 from dash import (
     html, dcc, Input, Output, State, callback, dash_table,
-    callback_context, ALL, MATCH, no_update
+    callback_context, ALL, MATCH, no_update, ClientsideFunction
 )
 import dash_bootstrap_components as dbc
 import dash_ag_grid as dag
 import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
+import hashlib
 import json
 import os
 import time
 import warnings
 from datetime import datetime
-import numpy as np
 from dash.exceptions import PreventUpdate
 from config import *
 import secrets
 from dotenv import load_dotenv
-from functools import lru_cache
-from cache_manager import cache_manager, load_dados_indicador_cached, preload_related_indicators
-from flask import session, redirect, send_from_directory, request, jsonify
-import bcrypt
-from generate_password import generate_password_hash, generate_secret_key, update_env_file, check_password
+from functools import lru_cache, partial
+from cache_manager import (
+    cache_manager, load_dados_indicador_cached, prefetch_queue, preload_related_indicators, submit_preload,
+    visualization_flight
+)
+from filter_index import FilterBitmapIndex, FilterLattice, select_rows
+from grid_rows import apply_filter_model, apply_sort_model, page_rows
+from navigation import NavigationTree, get_data_version
+from health import Readiness, worker_stats
+import metrics
+import offload
+from logging_setup import parse_levels, setup_logging
+import profiling
+import tracing
+from http_cache import AssetManifest, ConditionalCache, PrerenderedResponse, compress_response
+from figures import (
+    annotation_figure, choropleth_figure, format_br, message_figure, ranking_figure, series_figure
+)
+from exports import (
+    EXPORT_FORMATS, build_export_url, export_filename, full_export_path, order_export_columns,
+    parse_export_args, remove_old_exports, save_export_file, to_csv_bytes, to_excel_bytes
+)
+from flask import (
+    session, redirect, send_from_directory, send_file, request, jsonify, Response, abort, after_this_request
+)
 from flask_cors import CORS
 import constants 
 import logging
 import math
-import io
 
 load_dotenv()
 
-# Configuração do tema do Plotly
-import plotly.io as pio
-
-pio.templates.default = "plotly_white"
+# O tema do Plotly (plotly_white) é aplicado pelas figuras (figures.PLOTLY_TEMPLATE)
 
 from config import (
     DEBUG, USE_RELOADER, PORT, HOST, DASH_CONFIG, SERVER_CONFIG,
-    MAINTENANCE_PASSWORD
+    MAINTENANCE_PASSWORD, MAINTENANCE_PASSWORD_HASH, PROFILE_MAX_SECONDS, CLIENTSIDE_YEAR_SWITCH,
+    COMPRESSION_ENABLED, COMPRESSION_MIN_SIZE, COMPRESSION_LEVEL,
+    BACKGROUND_CACHE_DIR, EXPORTS_DIR, EXPORT_MAX_JOBS, TAB_PREFETCH, STATIC_BUILD_DIR,
+    TRACE_FILE, LOG_LEVELS, LOG_DEBUG_RATE, LOG_QUEUE_SIZE, WARMUP_MAX_INDICATORS
 )
 from constants import COLUMN_NAMES, UF_NAMES
 
@@ -53,15 +70,12 @@ log_formatter = logging.Formatter(
     datefmt='%Y-%m-%d %H:%M:%S'
 )
 
-file_handler = logging.FileHandler(log_filename, encoding='utf-8')
-file_handler.setFormatter(log_formatter)
-
-# Configura o logger raiz
-root_logger = logging.getLogger()
-root_logger.setLevel(log_level)
-root_logger.addHandler(file_handler)
+# Configura o logger raiz: as requisições só enfileiram os registros; formatação e escrita no
+# arquivo ficam com uma thread própria (logging_setup.py)
+setup_logging(log_level, log_filename, log_formatter, levels=parse_levels(LOG_LEVELS), debug_rate=LOG_DEBUG_RATE,
+              queue_size=LOG_QUEUE_SIZE, routes={tracing.SPANS_LOGGER: TRACE_FILE})
 
-logging.info(f"Iniciando aplicação. Nível de log: {logging.getLevelName(log_level)}. Logando em: {log_filename}")
+logging.info("Iniciando aplicação. Nível de log: %s. Logando em: %s", logging.getLevelName(log_level), log_filename)
 
 # Variável global para controle do modo de manutenção
 MAINTENANCE_MODE = os.getenv('MAINTENANCE_MODE', 'false').lower() == 'true'
@@ -73,6 +87,10 @@ def maintenance_middleware():
     if MAINTENANCE_MODE and request.remote_addr not in ['127.0.0.1']:
         if request.path.startswith('/assets/') or '_dash-component-suites' in request.path:
             return None
+        # As sondas do Kubernetes, a coleta de métricas e o diagnóstico (com senha) continuam
+        # respondendo durante a manutenção
+        if request.path in ('/healthz', '/readyz', '/metrics') or request.path.startswith('/admin/profile/'):
+            return None
         return send_from_directory('assets', 'maintenance.html')
     return None
 
@@ -81,6 +99,17 @@ def capitalize_words(text):
     return ' '.join(word.capitalize() for word in text.split())
 
 
+# Callbacks em segundo plano (exportações completas): fila e resultados em disco (SQLite do diskcache),
+# executados em processos separados dos workers do gunicorn
+try:
+    import diskcache
+
+    background_cache = diskcache.Cache(BACKGROUND_CACHE_DIR)
+    background_manager = dash.DiskcacheManager(background_cache, expire=3600)
+except ImportError:
+    background_cache = background_manager = None
+    logging.warning("diskcache/multiprocess/psutil não instalados: exportações completas serão geradas na requisição")
+
 # Inicializa o aplicativo Dash com tema Bootstrap
 app = dash.Dash(
     __name__,
@@ -95,12 +124,45 @@ app = dash.Dash(
     assets_url_path='/assets/',
     serve_locally=True,
     suppress_callback_exceptions=True,  # Suprimir exceções de callbacks para componentes dinâmicos
+    background_callback_manager=background_manager,
     **DASH_CONFIG
 )
 
 # Registra o middleware de manutenção
 app.server.before_request(maintenance_middleware)
 
+# Compressão das respostas (callbacks com figuras, rowData e GeoJSON, layout e exportações)
+if COMPRESSION_ENABLED:
+    app.server.after_request(
+        lambda response: compress_response(response, COMPRESSION_MIN_SIZE, COMPRESSION_LEVEL)
+    )
+
+# As dependências só mudam com os dados: ETag/Last-Modified para responder 304 a quem já as tem.
+# Registrado depois da compressão porque o Flask executa os after_request na ordem inversa
+# (a ETag é calculada sobre o corpo ainda não comprimido).
+conditional_cache = ConditionalCache(('/_dash-dependencies',), get_data_version)
+app.server.before_request(conditional_cache.before_request)
+app.server.after_request(conditional_cache.after_request)
+
+# O layout é estático: serializado e comprimido uma vez por versão dos dados e servido da memória
+layout_response = PrerenderedResponse(
+    '/_dash-layout', lambda: app.serve_layout().get_data(), get_data_version
+)
+app.server.before_request(layout_response.before_request)
+
+# Tamanho das respostas dos callbacks (antes da compressão)
+app.server.after_request(metrics.after_request)
+
+# Etapas que precisam terminar antes de o worker ser considerado pronto (/readyz)
+readiness = Readiness(('metadados', 'manifesto', 'layout', 'aquecimento'))
+
+# Assets com hash no nome (build_assets.py): a página referencia os nomes com hash, que podem
+# ficar em cache por um ano; registrado depois da compressão para trocar os links antes dela
+asset_manifest = AssetManifest(STATIC_BUILD_DIR)
+app.server.before_request(asset_manifest.before_request)
+app.server.after_request(asset_manifest.after_request)
+readiness.mark('manifesto', files=len(asset_manifest.manifest))
+
 # Configurações de cache
 for key, value in SERVER_CONFIG.items():
     app.server.config[key] = value
@@ -109,42 +171,40 @@ for key, value in SERVER_CONFIG.items():
 app.server.secret_key = SERVER_CONFIG['SECRET_KEY']
 
 
-@app.server.route('/assets/<path:path>')
-def serve_static(path):
-    return send_from_directory('assets', path)
+CORS(app.server)
 
 
-CORS(app.server)
+# Erros do navegador aceitos por requisição (o script do index_string envia em lotes)
+LOG_BATCH_MAX_ENTRIES = 50
 
 
 @app.server.route('/log', methods=['POST'])
 def log_message():
+    """
+    Registra um lote de erros do navegador: {"entries": [{"message", "stack", "count"}, ...]}
+    (também aceita um único erro, {"message", "stack"}). Erros repetidos no lote viram um
+    único registro com a contagem.
+    """
     if not app.server.debug:
         return '', 204
     try:
         data = request.get_json(force=True)
-        # print("\n====================== ERRO DO NAVEGADOR ======================")
-        # print(f"Mensagem: {data.get('message', 'Sem mensagem')}")
-        # print(f"Stack: {data.get('stack', 'Sem stack')}")
-        # print("===============================================================\n")
-        # Usamos logging.error para registrar o erro do navegador no backend
-        # Corrigido: Removida a quebra de linha dentro da string de formatação
-        logging.error("Erro do navegador recebido: Mensagem: %s Stack: %s",
-                      data.get('message', 'Sem mensagem'),
-                      data.get('stack', 'Sem stack'))
-        return jsonify({"status": "logged", "success": True})
+        entries = data.get('entries') if isinstance(data.get('entries'), list) else [data]
+        contagens = {}
+        for entry in entries[:LOG_BATCH_MAX_ENTRIES]:
+            chave = (str(entry.get('message', 'Sem mensagem')), str(entry.get('stack', 'Sem stack')))
+            contagens[chave] = contagens.get(chave, 0) + max(int(entry.get('count', 1)), 1)
+        for (mensagem, stack), quantidade in contagens.items():
+            logging.error("Erro do navegador recebido (%dx): Mensagem: %s Stack: %s", quantidade, mensagem, stack)
+        if len(entries) > LOG_BATCH_MAX_ENTRIES:
+            logging.warning("Lote de erros do navegador truncado: %d de %d", LOG_BATCH_MAX_ENTRIES, len(entries))
+        return '', 204
     except Exception as e:
-        # print(f"Erro ao processar log do cliente: {str(e)}")
         # Usamos logging.exception para capturar o erro e o traceback
         logging.exception("Erro ao processar log do cliente:")
         return jsonify({"status": "error", "message": str(e)}), 500
 
 
-@app.server.route('/_dash-component-suites/<path:path>')
-def serve_dash_files(path):
-    return send_from_directory('_dash-component-suites', path)
-
-
 # Função original para carregar dados do indicador (sem cache)
 def _load_dados_indicador_original(indicador_id):
     """Função original para carregar dados do indicador (sem cache)."""
@@ -155,7 +215,10 @@ def _load_dados_indicador_original(indicador_id):
             logging.warning("Arquivo parquet não encontrado para %s: %s", indicador_id, arquivo_parquet)
             return pd.DataFrame()
         try:
-            df_load = pd.read_parquet(arquivo_parquet)
+            inicio = time.perf_counter()
+            df_load = offload.run(offload.read_parquet, arquivo_parquet)
+            metrics.PARQUET_LOAD.observe(time.perf_counter() - inicio)
+            metrics.PARQUET_BYTES.inc(os.path.getsize(arquivo_parquet))
             if df_load.empty:
                 logging.warning("Arquivo parquet vazio para %s: %s", indicador_id, arquivo_parquet)
                 return pd.DataFrame()
@@ -181,6 +244,110 @@ def limpar_cache_indicadores():
     # Limpa o cache LRU da função original (se ainda estiver sendo usado em algum lugar)
     if hasattr(load_dados_indicador_cache, 'cache_clear'):
         load_dados_indicador_cache.cache_clear()
+    # Os índices de filtros são derivados dos dados e precisam ser recalculados
+    get_filter_lattice.cache_clear()
+    get_filter_index.cache_clear()
+    get_table_frame.cache_clear()
+    get_table_view.cache_clear()
+    get_export_file.cache_clear()
+    get_navigation_tree.cache_clear()
+    render_meta_section.cache_clear()
+    get_indicator_content.cache_clear()
+    get_visualization.cache_clear()
+    layout_response.clear()
+    # Arquivos das exportações completas de versões anteriores dos dados (o diretório é compartilhado
+    # com os outros workers e com os callbacks em segundo plano, que podem estar gravando ou servindo)
+    remove_old_exports(EXPORTS_DIR, get_data_version())
+
+
+@app.server.route('/healthz')
+def healthz():
+    """Liveness: o processo está atendendo (não toca em dados, sessão nem cache)."""
+    return Response('ok', mimetype='text/plain', headers={'Cache-Control': 'no-store'})
+
+
+@app.server.route('/readyz')
+def readyz():
+    """
+    Readiness: 200 depois que metadados, manifesto de assets, layout pré-renderizado e aquecimento
+    do cache foram carregados neste worker (503 antes), com as estatísticas de cache e do worker em JSON.
+    """
+    pronto = readiness.is_ready()
+    response = jsonify({
+        'status': 'ready' if pronto else 'starting',
+        'checks': readiness.report(),
+        'cache': cache_manager.get_stats(),
+        'coalescing': visualization_flight.get_stats(),
+        'worker': worker_stats(),
+    })
+    response.status_code = 200 if pronto else 503
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+
+@app.server.route('/metrics')
+def prometheus_metrics():
+    """Métricas no formato do Prometheus (somadas entre os workers do gunicorn)."""
+    corpo, status, content_type = metrics.render()
+    return Response(corpo, status=status, content_type=content_type, headers={'Cache-Control': 'no-store'})
+
+
+def admin_authorized():
+    """Confere a senha de manutenção (HTTP Basic, qualquer usuário) com o hash bcrypt do .env."""
+    from generate_password import check_password  # bcrypt só é importado quando a rota é usada
+
+    auth = request.authorization
+    return bool(MAINTENANCE_PASSWORD_HASH and auth and auth.password
+                and check_password(auth.password, MAINTENANCE_PASSWORD_HASH))
+
+
+def admin_profile_response(gerar):
+    """
+    Executa um diagnóstico das rotas /admin/profile/* (senha, duração e concorrência).
+
+    Args:
+        gerar: Função que recebe a duração em segundos e devolve o relatório em texto
+
+    Returns:
+        Response em texto (401 sem senha, 409 com outro diagnóstico em andamento)
+    """
+    if not MAINTENANCE_PASSWORD_HASH:
+        return Response('MAINTENANCE_PASSWORD_HASH não configurado\n', status=503, mimetype='text/plain')
+    if not admin_authorized():
+        logging.warning("Acesso negado a %s de %s", request.path, request.remote_addr)
+        return Response('Senha de manutenção necessária\n', status=401, mimetype='text/plain',
+                        headers={'WWW-Authenticate': 'Basic realm="painel-ods-admin"'})
+    segundos = min(max(request.args.get('segundos', 10, type=float), 0.1), PROFILE_MAX_SECONDS)
+    logging.info("Diagnóstico %s por %.1f s solicitado por %s", request.path, segundos, request.remote_addr)
+    try:
+        relatorio = gerar(segundos)
+    except profiling.ProfilerBusy:
+        return Response('Outro diagnóstico em andamento neste worker\n', status=409, mimetype='text/plain')
+    return Response(relatorio, mimetype='text/plain', headers={
+        'Cache-Control': 'no-store', 'X-Worker-Pid': str(os.getpid())})
+
+
+@app.server.route('/admin/profile/cpu')
+def admin_profile_cpu():
+    """
+    Pilhas amostradas das threads deste worker por ?segundos=N (padrão 10), no formato collapsed
+    (flamegraph.pl, speedscope). ?intervalo_ms= define o intervalo entre amostras (padrão 10).
+    """
+    intervalo = min(max(request.args.get('intervalo_ms', 10, type=float), 1), 1000) / 1000
+    return admin_profile_response(lambda segundos: profiling.sample_stacks(segundos, intervalo))
+
+
+@app.server.route('/admin/profile/memory')
+def admin_profile_memory():
+    """
+    Diferença das alocações deste worker em ?segundos=N (padrão 10) com as estatísticas do cache
+    antes e depois. ?limite= define as linhas do relatório (padrão 30) e ?quadros= a profundidade
+    das pilhas guardadas (padrão 1).
+    """
+    limite = min(max(request.args.get('limite', 30, type=int), 1), 500)
+    quadros = min(max(request.args.get('quadros', 1, type=int), 1), 50)
+    return admin_profile_response(
+        lambda segundos: profiling.memory_diff(segundos, cache_manager.get_stats, limite, quadros))
 
 
 @app.server.route('/limpar-cache')
@@ -198,6 +365,13 @@ def limpar_cache():
 def view_cache_stats():
     """Exibe estatísticas do cache."""
     stats = cache_manager.get_stats()
+    flight_stats = visualization_flight.get_stats()
+    # Requisições idênticas simultâneas atendidas por uma única geração (por tipo)
+    flight_rows = ''.join(
+        f'<div class="stat-item"><span class="stat-label">{tipo}:</span> '
+        f'{dados["coalesced"]} de {dados["calls"]} agrupadas ({dados["coalescing_rate"]:.2%})</div>'
+        for tipo, dados in sorted(flight_stats['by_kind'].items())
+    ) or '<div class="stat-item">Nenhuma requisição registrada.</div>'
     html = f"""
     <!DOCTYPE html>
     <html>
@@ -244,6 +418,14 @@ def view_cache_stats():
             </div>
         </div>
 
+        <h2>Agrupamento de Requisições</h2>
+        <div class="stats">
+            {flight_rows}
+            <div class="stat-item">
+                <span class="stat-label">Em andamento:</span> {flight_stats['in_flight']}
+            </div>
+        </div>
+
         <div class="actions">
             <a href="/limpar-cache" class="btn btn-danger">Limpar Cache</a>
             <a href="/" class="btn">Voltar para o Painel</a>
@@ -263,7 +445,6 @@ app.index_string = '''
         <link rel="icon" type="image/x-icon" href="/assets/favicon.ico">
         {%favicon%}
         {%css%}
-        <meta http-equiv="Cache-Control" content="max-age=31536000">
     </head>
     <body>
         {%app_entry%}
@@ -274,19 +455,34 @@ app.index_string = '''
         </footer>
         <script>
         (function() {
+            // Erros acumulados e enviados em lote (no máximo um envio a cada 5 s e ao sair da página);
+            // erros repetidos são contados em vez de reenviados
+            var pendentes = {};
+            var quantidade = 0;
+            var agendado = null;
+            function enviarLote() {
+                agendado = null;
+                if (!quantidade) return;
+                var corpo = JSON.stringify({entries: Object.keys(pendentes).map(function(k) { return pendentes[k]; })});
+                pendentes = {};
+                quantidade = 0;
+                if (navigator.sendBeacon && navigator.sendBeacon('/log', new Blob([corpo], {type: 'application/json'}))) return;
+                fetch('/log', {method: 'POST', headers: {'Content-Type': 'application/json'}, body: corpo, keepalive: true})
+                    .catch(err => console.log("Erro ao enviar log:", err));
+            }
             function enviarLog(mensagem, stack) {
-                fetch('/log', {
-                    method: 'POST',
-                    headers: {'Content-Type': 'application/json'},
-                    body: JSON.stringify({
-                        message: typeof mensagem === 'object' ? JSON.stringify(mensagem) : String(mensagem),
-                        stack: stack || new Error().stack
-                    })
-                })
-                .then(response => response.ok ? response.json() : Promise.reject('Falha na requisição: ' + response.status))
-                .then(data => console.log("Log enviado:", data))
-                .catch(err => console.log("Erro ao enviar log:", err));
+                var message = typeof mensagem === 'object' ? JSON.stringify(mensagem) : String(mensagem);
+                stack = stack || new Error().stack;
+                var chave = message + '\\n' + stack;
+                if (pendentes[chave]) {
+                    pendentes[chave].count += 1;
+                } else if (quantidade < 50) {
+                    pendentes[chave] = {message: message, stack: stack, count: 1};
+                    quantidade += 1;
+                }
+                if (!agendado) agendado = setTimeout(enviarLote, 5000);
             }
+            window.addEventListener('pagehide', enviarLote);
             const originalConsoleError = console.error;
             console.error = function() {
                 const args = Array.from(arguments);
@@ -413,6 +609,11 @@ df_indicadores = load_indicadores()
 df_unidade_medida = load_unidade_medida()
 df_variavel = load_variavel()
 
+if df.empty or df_metas.empty or df_indicadores.empty:
+    logging.error("Tabelas de metadados não carregadas: o worker não ficará pronto (/readyz)")
+else:
+    readiness.mark('metadados', objetivos=len(df), metas=len(df_metas), indicadores=len(df_indicadores))
+
 if not df.empty:
     row_objetivo_0 = df.iloc[(0,)]
     initial_header = row_objetivo_0['RES_OBJETIVO']
@@ -475,53 +676,322 @@ def identify_filter_columns(df):
     return sorted(filter_cols)
 
 
-# Função auxiliar para formatar número no padrão brasileiro (pt-BR)
-def format_br(value):
-    """Formats a number to Brazilian standard (dot for thousands, comma for decimal).
-       Shows integer if no significant decimal part, otherwise shows up to 2 decimals,
-       removing trailing zeros.
+@lru_cache(maxsize=64)
+def get_filter_lattice(indicador_id, data_version):
     """
-    if pd.isna(value) or value is None:
-        return ""
-    try:
-        f_value = float(value)
-        # Check if it's effectively an integer
-        if f_value == int(f_value):
-            # Format as integer with thousands separators
-            int_str = f"{int(f_value):,}".replace(",", ".")
-            return int_str
+    Retorna o reticulado de combinações de filtros do indicador (calculado uma vez por versão dos dados).
+
+    Args:
+        indicador_id: ID do indicador
+        data_version: Versão dos dados (get_data_version), parte da chave do cache
+
+    Returns:
+        FilterLattice do indicador ou None se não houver dados
+    """
+    df_dados = load_dados_indicador_cache(indicador_id)
+    if df_dados is None or df_dados.empty:
+        return None
+    return FilterLattice(df_dados, identify_filter_columns(df_dados))
+
+
+@lru_cache(maxsize=64)
+def get_filter_index(indicador_id, data_version):
+    """
+    Retorna o índice bitmap (valor → linhas) dos filtros do indicador.
+
+    Args:
+        indicador_id: ID do indicador
+        data_version: Versão dos dados (get_data_version), parte da chave do cache
+
+    Returns:
+        FilterBitmapIndex do indicador ou None se não houver dados
+    """
+    df_dados = load_dados_indicador_cache(indicador_id)
+    if df_dados is None or df_dados.empty:
+        return None
+    return FilterBitmapIndex(df_dados, identify_filter_columns(df_dados))
+
+
+def filter_indicator_data(df, indicador_id=None, selected_var=None, selected_filters=None):
+    """
+    Filtra os dados do indicador pela variável e pelos filtros dinâmicos sem copiar o DataFrame em cache.
+
+    O DataFrame recebido não é alterado: a seleção vira um vetor de posições (via índice bitmap)
+    e apenas as linhas selecionadas são materializadas.
+
+    Args:
+        df: DataFrame com os dados do indicador (em cache, tratado como imutável)
+        indicador_id: ID do indicador (usado para obter o índice bitmap)
+        selected_var: Código da variável selecionada
+        selected_filters: Dicionário {coluna: valor} dos filtros dinâmicos
+
+    Returns:
+        Tupla (DataFrame com as linhas selecionadas, coluna que esvaziou a seleção ou None)
+    """
+    selections = []
+    if selected_var and 'CODG_VAR' in df.columns:
+        selections.append(('CODG_VAR', selected_var))
+    for col_code, selected_value in (selected_filters or {}).items():
+        if selected_value is not None and col_code in df.columns:
+            selections.append((col_code, selected_value))
+
+    index = get_filter_index(indicador_id, get_data_version()) if indicador_id else None
+    positions, failed_col = select_rows(df, selections, index)
+    return df.take(positions), failed_col
+
+
+def make_filters_key(selected_filters):
+    """Normaliza os filtros selecionados em uma tupla ordenada (coluna, valor) usável como chave de cache."""
+    return tuple(sorted(
+        (col, str(val).strip()) for col, val in (selected_filters or {}).items() if val is not None
+    ))
+
+
+def make_selection_key(selected_var, filters_key):
+    """
+    Chave canônica (hash) de uma seleção: variável e filtros normalizados.
+
+    Args:
+        selected_var: Código da variável selecionada
+        filters_key: Tupla ordenada de pares (coluna, valor) (ver make_filters_key)
+
+    Returns:
+        str: Hash curto, igual para seleções equivalentes
+    """
+    var = None if selected_var is None else str(selected_var).strip()
+    canonical = json.dumps([var, [list(pair) for pair in filters_key]], separators=(',', ':'))
+    return hashlib.sha1(canonical.encode('utf-8')).hexdigest()[:16]
+
+
+def build_table_frame(df_selected, df, indicador_id=None):
+    """
+    Monta o DataFrame da tabela de detalhes a partir das linhas selecionadas.
+
+    Adiciona as descrições (filtros dinâmicos, UF, variável e unidade de medida) somente quando
+    ausentes, sem alterar df_selected nem os DataFrames em cache.
+
+    Args:
+        df_selected: Linhas selecionadas (resultado de filter_indicator_data)
+        df: DataFrame completo do indicador (fonte das descrições dos filtros)
+        indicador_id: ID do indicador
+
+    Returns:
+        DataFrame da tabela com índice sequencial
+    """
+    # Cópia rasa: as atribuições de colunas abaixo substituem (não alteram) os arrays compartilhados
+    df_table = df_selected.copy(deep=False)
+
+    for filter_col_code in identify_filter_columns(df):
+        desc_col = 'DESC_' + filter_col_code[5:]
+        if desc_col in df_table.columns or filter_col_code not in df_table.columns:
+            continue
+        if desc_col in df.columns:
+            mapping = df[[filter_col_code, desc_col]].drop_duplicates(subset=filter_col_code)
+            code_to_desc = pd.Series(mapping[desc_col].values, index=mapping[filter_col_code].astype(str))
+            df_table[filter_col_code] = df_table[filter_col_code].astype(str)
+            df_table[desc_col] = df_table[filter_col_code].map(code_to_desc).fillna('N/D')
+        else:
+            df_table[desc_col] = 'N/D'
+
+    if 'DESC_UND_FED' not in df_table.columns:
+        if 'CODG_UND_FED' in df_table.columns:
+            df_table['DESC_UND_FED'] = df_table['CODG_UND_FED'].astype(str).map(constants.UF_NAMES).fillna('N/D')
         else:
-            # Format as float with 2 decimal places first for consistent rounding
-            formatted_str = f"{f_value:.2f}"  # e.g., "1459.89", "15.00", "4.90"
-            int_part, dec_part = formatted_str.split('.')
+            df_table['DESC_UND_FED'] = 'N/D'
 
-            # Format integer part with dots
-            int_part_formatted = f"{int(int_part):,}".replace(",", ".")
+    lookups = [('CODG_VAR', 'DESC_VAR', load_variavel()), ('CODG_UND_MED', 'DESC_UND_MED', load_unidade_medida())]
+    for code_col, desc_col, df_lookup in lookups:
+        if desc_col in df_table.columns:
+            continue
+        if code_col in df_table.columns and not df_lookup.empty:
+            code_to_desc = pd.Series(df_lookup[desc_col].values, index=df_lookup[code_col])
+            df_table[code_col] = df_table[code_col].astype(str)
+            df_table[desc_col] = df_table[code_col].map(code_to_desc).fillna('N/D')
+        else:
+            df_table[desc_col] = 'N/D'
 
-            # Only add decimal part if it's not "00"
-            if dec_part == "00":
-                return int_part_formatted
-            else:
-                # Remove trailing zeros from decimal part *before* combining
-                dec_part = dec_part.rstrip('0')  # "89" -> "89", "90" -> "9"
-                # Handle cases like "4.0" which become "4," -> should be "4"
-                if not dec_part:  # If rstrip removed everything (e.g., was "00")
-                    return int_part_formatted  # Return only integer part
-                return f"{int_part_formatted},{dec_part}"
+    if indicador_id and 'ID_INDICADOR' not in df_table.columns:
+        df_table['ID_INDICADOR'] = indicador_id
+
+    return df_table.reset_index(drop=True)
+
+
+@lru_cache(maxsize=32)
+def get_table_frame(indicador_id, selected_var=None, filters_key=(), data_version=None):
+    """
+    Retorna (memoizado) o DataFrame da tabela de detalhes para uma seleção.
+
+    Args:
+        indicador_id: ID do indicador
+        selected_var: Código da variável selecionada
+        filters_key: Tupla ordenada de pares (coluna, valor) dos filtros dinâmicos
+        data_version: Versão dos dados (get_data_version), parte da chave do cache
+
+    Returns:
+        DataFrame da tabela (vazio se não houver dados)
+    """
+    df = load_dados_indicador_cache(indicador_id)
+    if df is None or df.empty:
+        return pd.DataFrame()
+    df_selected, _ = filter_indicator_data(df, indicador_id, selected_var, dict(filters_key))
+    if 'CODG_VAR' in df_selected.columns and selected_var:
+        df_selected['CODG_VAR'] = df_selected['CODG_VAR'].astype(str).str.strip()
+    return build_table_frame(df_selected, df, indicador_id)
+
+
+@lru_cache(maxsize=64)
+def get_table_view(indicador_id, selected_var, filters_key, sort_key, filter_key, data_version):
+    """Tabela de detalhes ordenada/filtrada conforme o AG Grid (chaves em JSON e versão dos dados para o memo)."""
+    df_table = get_table_frame(indicador_id, selected_var, filters_key, data_version)
+    df_table = apply_filter_model(df_table, json.loads(filter_key))
+    return apply_sort_model(df_table, json.loads(sort_key))
+
+
+@lru_cache(maxsize=16)
+def get_export_file(indicador_id, formato, selected_var=None, filters_key=(), data_version=None):
+    """
+    Gera (memoizado) o arquivo de exportação da tabela de detalhes para uma seleção.
+
+    Args:
+        indicador_id: ID do indicador
+        formato: 'csv' ou 'xlsx'
+        selected_var: Código da variável selecionada
+        filters_key: Tupla ordenada de pares (coluna, valor) dos filtros dinâmicos
+        data_version: Versão dos dados (get_data_version), parte da chave do cache
+
+    Returns:
+        bytes do arquivo, ou None se não houver dados
+    """
+    df_table = get_table_frame(indicador_id, selected_var, filters_key, data_version)
+    if df_table.empty:
+        return None
+    df_export = order_export_columns(df_table)
+    logging.info("Campos disponíveis na exportação %s de %s: %s", formato, indicador_id, df_export.columns.tolist())
+    inicio = time.perf_counter()
+    content = offload.run(to_csv_bytes if formato == 'csv' else to_excel_bytes, df_export)
+    metrics.observe_export(formato, 'selecao', inicio, content)
+    return content
+
+
+def build_full_export(indicador_id, formato, data_version, set_progress=None):
+    """
+    Gera (ou reaproveita) o arquivo com todos os dados do indicador no diretório de exportações.
+
+    O arquivo fica em disco por versão dos dados e é compartilhado entre workers e processos.
+
+    Args:
+        indicador_id: ID do indicador
+        formato: 'csv' ou 'xlsx'
+        data_version: Versão dos dados (get_data_version)
+        set_progress: Função de progresso do callback em segundo plano, chamada com (etapa, rótulo)
+
+    Returns:
+        Caminho do arquivo, ou None se não houver dados
+    """
+    def progresso(etapa, rotulo):
+        if set_progress is not None:
+            set_progress((etapa, rotulo))
+
+    path = full_export_path(EXPORTS_DIR, indicador_id, formato, data_version)
+    if os.path.exists(path):
+        return path
+
+    inicio = time.perf_counter()
+    progresso(25, "Carregando dados")
+    # A tabela precisa ser da mesma versão dos dados que dá nome ao arquivo
+    df_table = get_table_frame(indicador_id, data_version=data_version)
+    if df_table.empty:
+        return None
+    progresso(50, "Gerando arquivo")
+    df_export = order_export_columns(df_table)
+    content = offload.run(to_csv_bytes if formato == 'csv' else to_excel_bytes, df_export)
+    progresso(90, "Salvando")
+    save_export_file(path, content)
+    metrics.observe_export(formato, 'completo', inicio, content)
+    logging.info("Exportação completa %s de %s gerada: %s (%d bytes)", formato, indicador_id, path, len(content))
+    return path
+
+
+@app.server.route('/exportar/<formato>')
+def exportar_dados(formato):
+    """Serve o CSV/Excel da tabela de detalhes a partir da seleção normalizada (query string)."""
+    if formato not in EXPORT_FORMATS:
+        abort(404)
+    try:
+        indicador_id, selected_var, filters_key, completo = parse_export_args(request.args)
+    except ValueError as e:
+        logging.warning("Parâmetros de exportação inválidos: %s", e)
+        abort(400)
+    if completo:
+        if background_manager is not None:
+            # Com a fila em disco o arquivo só é gerado pelo callback em segundo plano (limitado a
+            # EXPORT_MAX_JOBS); aqui apenas é servido, sem ocupar o worker com a geração
+            path = full_export_path(EXPORTS_DIR, indicador_id, formato, get_data_version())
+        else:
+            # Sem diskcache não há callback em segundo plano: gera na própria requisição
+            try:
+                path = build_full_export(indicador_id, formato, get_data_version())
+            except Exception:
+                logging.exception("Erro ao gerar exportação completa %s para %s", formato, indicador_id)
+                abort(500)
+        if path is None:
+            logging.warning("Sem dados para exportar: %s", indicador_id)
+            abort(404)
+        try:
+            return send_file(os.path.abspath(path), mimetype=EXPORT_FORMATS[formato], as_attachment=True,
+                             download_name=export_filename(indicador_id, formato, completo))
+        except FileNotFoundError:
+            # Ainda não gerado (ou substituído por uma versão mais nova dos dados)
+            logging.info("Exportação completa %s de %s não disponível: %s", formato, indicador_id, path)
+            abort(404)
+    try:
+        content = get_export_file(indicador_id, formato, selected_var, filters_key, get_data_version())
+    except Exception:
+        logging.exception("Erro ao gerar exportação %s para %s", formato, indicador_id)
+        abort(500)
+    if content is None:
+        logging.warning("Sem dados para exportar: %s (var=%s, filtros=%s)", indicador_id, selected_var, filters_key)
+        abort(404)
+    filename = export_filename(indicador_id, formato, completo)
+    return Response(content, mimetype=EXPORT_FORMATS[formato],
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+
+def build_year_values_table(df_filtered, ranking_ordem=0):
+    """
+    Monta a tabela compacta de valores por ano usada na troca de ano feita no navegador.
+
+    Args:
+        df_filtered: DataFrame já filtrado, com DESC_UND_FED, DESC_UND_MED, CODG_ANO e VLR_VAR
+        ranking_ordem: Ordem do ranking do indicador (0 = maior para menor, 1 = menor para maior)
 
-    except (ValueError, TypeError):
-        logging.warning(f"Could not format value '{value}' to Brazilian standard.")
-        return str(value)  # Fallback
+    Returns:
+        Dicionário {'ranking_ordem': int, 'anos': {ano: {...}}} serializável em JSON
+    """
+    anos = {}
+    for ano, df_ano in df_filtered.dropna(subset=['DESC_UND_FED']).groupby('CODG_ANO', sort=True):
+        anos[str(ano)] = {
+            # Ranking e mapa exigem um único valor por UF no ano
+            'unico': not df_ano['DESC_UND_FED'].duplicated().any(),
+            'ufs': df_ano['DESC_UND_FED'].tolist(),
+            'valores': df_ano['VLR_VAR'].tolist(),
+            'textos': df_ano['VLR_VAR'].apply(format_br).tolist(),
+            'unidades': df_ano['DESC_UND_MED'].fillna('N/D').tolist(),
+        }
+    return {'ranking_ordem': ranking_ordem, 'anos': anos}
 
 
+@tracing.traced('create_visualization')
 def create_visualization(df, indicador_id=None, selected_var=None, selected_filters=None):
     """Cria uma visualização (gráfico principal, ranking, mapa e tabela) com os dados do DataFrame, aplicando filtros."""
+    tracing.set_attributes(indicador=indicador_id, variavel=selected_var,
+                           filtros=json.dumps(selected_filters, sort_keys=True, default=str))
     if df is None or df.empty:
         return dbc.Alert("Nenhum dado disponível para este indicador.", color="warning", className="textCenter p-3")
 
     try:
         # Log para debug dos filtros recebidos
-        logging.debug(f"create_visualization para {indicador_id} - Var: {selected_var}, Filtros: {selected_filters}")
+        logging.debug("create_visualization para %s - Var: %s, Filtros: %s", indicador_id, selected_var, selected_filters)
 
         colunas_necessarias = ['CODG_ANO', 'VLR_VAR']
         if not all(col in df.columns for col in colunas_necessarias):
@@ -529,41 +999,29 @@ def create_visualization(df, indicador_id=None, selected_var=None, selected_filt
             return dbc.Alert(f"Dados incompletos. Colunas faltando: {', '.join(missing)}", color="warning",
                              className="textCenter p-3")
 
-        df_filtered = df.copy()
+        # Seleciona as linhas sem copiar o DataFrame em cache (somente o resultado é materializado)
+        tracing.stage('filtro')
+        df_filtered, failed_col = filter_indicator_data(df, indicador_id, selected_var, selected_filters)
+        logging.debug("Filtros aplicados em %s - Registros restantes: %d", indicador_id, len(df_filtered))
+
+        if failed_col == 'CODG_VAR':
+            selected_var_str = str(selected_var).strip()
+            var_name = selected_var_str
+            df_var_desc = load_variavel()
+            if not df_var_desc.empty:
+                var_info = df_var_desc[df_var_desc['CODG_VAR'] == selected_var_str]
+                if not var_info.empty:
+                    var_name = var_info['DESC_VAR'].iloc[0]
+            return dbc.Alert(f"Nenhum dado encontrado para a variável '{var_name}'.", color="warning")
+        if failed_col is not None:
+            filter_name = constants.COLUMN_NAMES.get(failed_col, failed_col)
+            selected_value_str = str(selected_filters[failed_col]).strip()
+            return dbc.Alert(
+                f"Nenhum dado encontrado para o filtro '{filter_name}' = '{selected_value_str}'.",
+                color="warning")
 
-        # Aplica filtro de VARIÁVEL PRINCIPAL
         if 'CODG_VAR' in df_filtered.columns and selected_var:
             df_filtered['CODG_VAR'] = df_filtered['CODG_VAR'].astype(str).str.strip()
-            selected_var_str = str(selected_var).strip()
-            df_filtered = df_filtered[df_filtered['CODG_VAR'] == selected_var_str]
-            logging.debug(f"Aplicando filtro de variável {selected_var_str} - Registros restantes: {len(df_filtered)}")
-            if df_filtered.empty:
-                var_name = selected_var_str
-                df_var_desc = load_variavel()
-                if not df_var_desc.empty:
-                    var_info = df_var_desc[df_var_desc['CODG_VAR'] == selected_var_str]
-                    if not var_info.empty:
-                        var_name = var_info['DESC_VAR'].iloc[0]
-                return dbc.Alert(f"Nenhum dado encontrado para a variável '{var_name}'.", color="warning")
-
-        # Aplica FILTROS DINÂMICOS
-        if selected_filters:
-            for col_code, selected_value in selected_filters.items():
-                if selected_value is not None and col_code in df_filtered.columns:
-                    # Convert selected value to string for comparison
-                    selected_value_str = str(selected_value).strip()
-                    # Compare using string representation of the column, without changing its type
-                    # Convert column to string *before* filling NA and stripping
-                    logging.debug(f"Aplicando filtro {col_code}={selected_value_str}")
-                    df_filtered = df_filtered[
-                        df_filtered[col_code].astype(str).fillna('').str.strip() == selected_value_str
-                        ]
-                    logging.debug(f"Após filtro {col_code} - Registros restantes: {len(df_filtered)}")
-                    if df_filtered.empty:
-                        filter_name = constants.COLUMN_NAMES.get(col_code, col_code)
-                        return dbc.Alert(
-                            f"Nenhum dado encontrado para o filtro '{filter_name}' = '{selected_value_str}'.",
-                            color="warning")
 
         if df_filtered.empty:
             return dbc.Alert("Nenhum dado encontrado após aplicar os filtros.", color="warning")
@@ -600,9 +1058,12 @@ def create_visualization(df, indicador_id=None, selected_var=None, selected_filt
             )
             return dbc.Alert(message, color="info", className="textCenter p-3")
 
-        df_original_for_table = df_filtered.copy()
+        # Tabela de detalhes: linhas selecionadas (sem descartar UFs) com as descrições
+        tracing.stage('tabela')
+        df_original_for_table = build_table_frame(df_filtered, df, indicador_id)
 
         # --- Adiciona/Garante Colunas de Descrição ---
+        tracing.stage('merges')
         # Descrição UF
         if 'CODG_UND_FED' in df_filtered.columns:
             df_filtered['DESC_UND_FED'] = df_filtered['CODG_UND_FED'].astype(str).map(constants.UF_NAMES)
@@ -613,7 +1074,6 @@ def create_visualization(df, indicador_id=None, selected_var=None, selected_filt
         df_variavel_loaded = load_variavel()
         if 'CODG_VAR' in df_filtered.columns and not df_variavel_loaded.empty:
             df_filtered['CODG_VAR'] = df_filtered['CODG_VAR'].astype(str)
-            df_variavel_loaded['CODG_VAR'] = df_variavel_loaded['CODG_VAR'].astype(str)
 
             # Merge para obter as descrições das variáveis
             df_filtered = df_filtered.merge(df_variavel_loaded[['CODG_VAR', 'DESC_VAR']], on='CODG_VAR', how='left')
@@ -625,7 +1085,6 @@ def create_visualization(df, indicador_id=None, selected_var=None, selected_filt
         df_unidade_medida_loaded = load_unidade_medida()
         if 'CODG_UND_MED' in df_filtered.columns and not df_unidade_medida_loaded.empty:
             df_filtered['CODG_UND_MED'] = df_filtered['CODG_UND_MED'].astype(str)
-            df_unidade_medida_loaded['CODG_UND_MED'] = df_unidade_medida_loaded['CODG_UND_MED'].astype(str)
             df_filtered = df_filtered.merge(df_unidade_medida_loaded[['CODG_UND_MED', 'DESC_UND_MED']],
                                             on='CODG_UND_MED', how='left')
             df_filtered['DESC_UND_MED'] = df_filtered['DESC_UND_MED'].fillna('N/D')
@@ -656,46 +1115,6 @@ def create_visualization(df, indicador_id=None, selected_var=None, selected_filt
                 df_filtered[desc_col_code] = df_filtered[desc_col_code].fillna('N/D')
             processed_desc_cols.add(desc_col_code)
 
-        # Garante que df_original_for_table também tenha as descrições dinâmicas
-        for desc_col in processed_desc_cols:
-            if desc_col not in df_original_for_table.columns and desc_col in df_filtered.columns:
-                # Pega o código correspondente
-                filter_col_code = 'CODG' + desc_col[4:]
-                if filter_col_code in df_original_for_table.columns:
-                    try:
-                        merge_data_orig = df_filtered[[filter_col_code, desc_col]].drop_duplicates().copy()
-                        df_original_for_table[filter_col_code] = df_original_for_table[filter_col_code].astype(str)
-                        merge_data_orig[filter_col_code] = merge_data_orig[filter_col_code].astype(str)
-                        df_original_for_table = pd.merge(df_original_for_table, merge_data_orig, on=filter_col_code,
-                                                         how='left')
-                        df_original_for_table[desc_col] = df_original_for_table[desc_col].fillna('N/D')
-                    except Exception:
-                        df_original_for_table[desc_col] = 'N/D'
-
-        # Adiciona colunas faltantes no df_original_for_table se necessário (UF, Var, UndMed)
-        if 'DESC_UND_FED' not in df_original_for_table.columns and 'DESC_UND_FED' in df_filtered.columns:
-            df_original_for_table['DESC_UND_FED'] = df_original_for_table['CODG_UND_FED'].astype(str).map(
-                constants.UF_NAMES).fillna('N/D')
-        if 'DESC_VAR' not in df_original_for_table.columns and 'DESC_VAR' in df_filtered.columns:
-            if 'CODG_VAR' in df_original_for_table.columns and not df_variavel_loaded.empty:
-                df_original_for_table['CODG_VAR'] = df_original_for_table['CODG_VAR'].astype(str)
-                df_variavel_loaded['CODG_VAR'] = df_variavel_loaded['CODG_VAR'].astype(str)
-                df_original_for_table = pd.merge(df_original_for_table, df_variavel_loaded[['CODG_VAR', 'DESC_VAR']],
-                                                 on='CODG_VAR', how='left')
-                df_original_for_table['DESC_VAR'] = df_original_for_table['DESC_VAR'].fillna('N/D')
-            else:
-                df_original_for_table['DESC_VAR'] = 'N/D'
-        if 'DESC_UND_MED' not in df_original_for_table.columns and 'DESC_UND_MED' in df_filtered.columns:
-            if 'CODG_UND_MED' in df_original_for_table.columns and not df_unidade_medida_loaded.empty:
-                df_original_for_table['CODG_UND_MED'] = df_original_for_table['CODG_UND_MED'].astype(str)
-                df_unidade_medida_loaded['CODG_UND_MED'] = df_unidade_medida_loaded['CODG_UND_MED'].astype(str)
-                df_original_for_table = pd.merge(df_original_for_table,
-                                                 df_unidade_medida_loaded[['CODG_UND_MED', 'DESC_UND_MED']],
-                                                 on='CODG_UND_MED', how='left')
-                df_original_for_table['DESC_UND_MED'] = df_original_for_table['DESC_UND_MED'].fillna('N/D')
-            else:
-                df_original_for_table['DESC_UND_MED'] = 'N/D'
-
         # Ordena e limpa dados numéricos
         df_filtered['CODG_ANO'] = df_filtered['CODG_ANO'].astype(str)
         df_filtered = df_filtered.sort_values('CODG_ANO')
@@ -708,6 +1127,7 @@ def create_visualization(df, indicador_id=None, selected_var=None, selected_filt
                              className="textCenter p-3")
 
         # --- Definição Dinâmica das Colunas da Tabela AG Grid ---
+        tracing.stage('colunas_tabela')
         base_col_defs = [
             {"field": 'ID_INDICADOR', "headerName": 'ID Indicador', "hide": True},
             {"field": 'DESC_UND_FED', "headerName": 'Unidade Federativa'},
@@ -741,8 +1161,10 @@ def create_visualization(df, indicador_id=None, selected_var=None, selected_filt
         for col_def in final_col_defs:
             field_name = col_def['field']
             if field_name in present_columns_in_table:  # Verifica novamente no DF da tabela
-                base_props = {"sortable": True, "filter": True, "minWidth": 100, "resizable": True, "wrapText": True,
-                              "autoHeight": True, "cellStyle": {"whiteSpace": "normal"}}
+                # Altura de linha fixa (modelo infinito): textos longos aparecem completos no tooltip
+                base_props = {"sortable": True, "minWidth": 100, "resizable": True,
+                              "filter": "agNumberColumnFilter" if field_name == 'VLR_VAR' else "agTextColumnFilter",
+                              "filterParams": {"maxNumConditions": 1}, "tooltipField": field_name}
                 
                 # Se a coluna deve ser oculta, adiciona essa propriedade
                 if col_def.get('hide', False):
@@ -764,18 +1186,10 @@ def create_visualization(df, indicador_id=None, selected_var=None, selected_filt
                 columnDefs.append(
                     {**base_props, "field": field_name, "headerName": col_def['headerName'], "flex": flex_value})
         defaultColDef = {
-            "minWidth": 100, "resizable": True, "wrapText": True, "autoHeight": True,
-            "cellStyle": {"whiteSpace": "normal", 'textAlign': 'left'}
+            "minWidth": 100, "resizable": True, "cellStyle": {'textAlign': 'left'}
         }
 
-        # Adiciona o ID_INDICADOR ao DataFrame para exportação
-        if indicador_id and 'ID_INDICADOR' not in df_original_for_table.columns:
-            df_original_for_table['ID_INDICADOR'] = indicador_id
-
         # --- Criação das Figuras dos Gráficos ---
-        main_fig = go.Figure()  # Inicializa a figura principal
-        fig_map = go.Figure()  # Inicializa a figura do mapa
-
         # Obter anos únicos e ano padrão
         anos_unicos = sorted(df_filtered['CODG_ANO'].unique())
         ano_default = anos_unicos[-1] if anos_unicos else None
@@ -800,209 +1214,17 @@ def create_visualization(df, indicador_id=None, selected_var=None, selected_filt
                     except (ValueError, TypeError):
                         pass  # Mantém padrão 0
 
-        # --- Criação do Gráfico Principal baseado na lógica existente ---
-        if grafico_linha_flag == 1:
-            # --- Lógica do Gráfico de Linha (Refatorado com go.Figure) ---
-            main_fig = go.Figure()  # Reinicializa para garantir que está vazia
-            if 'DESC_UND_FED' in df_filtered.columns:
-                df_line_data = df_filtered.sort_values(['DESC_UND_FED', 'CODG_ANO'])
-                if not df_line_data.empty:
-                    for uf in df_line_data['DESC_UND_FED'].unique():
-                        df_state = df_line_data[df_line_data['DESC_UND_FED'] == uf]
-                        # Adiciona verificação se df_state não está vazio
-                        if df_state.empty: continue
-                        # Modificado: Adiciona valor formatado ao customdata
-                        customdata_state = np.column_stack((
-                            np.full(len(df_state), uf),
-                            df_state['DESC_UND_MED'].values,
-                            df_state['VLR_VAR'].values,  # Original value
-                            df_state['VLR_VAR'].apply(format_br).values  # Formatted value
-                        ))
-                        # Modificado: Usa a função format_br
-                        text_values = df_state['VLR_VAR'].apply(format_br)
-                        trace_name = f"<b>{uf}</b>" if uf == 'Goiás' else uf
-                        color_map = {
-                            'Goiás': '#229846', 'Maranhão': '#D2B48C', 'Distrito Federal': '#636efa',
-                            'Mato Grosso': '#ab63fa', 'Mato Grosso do Sul': '#ffa15a', 'Rondônia': '#19d3f3',
-                            'Tocantins': '#ff6692', 'Brasil': '#FF0000'  # Adiciona Brasil
-                        }
-                        line_color = color_map.get(uf)
-                        line_width = 6 if uf == 'Goiás' else 2
-
-                        main_fig.add_trace(go.Scatter(
-                            x=df_state['CODG_ANO'], y=df_state['VLR_VAR'], name=trace_name,
-                            customdata=customdata_state, text=text_values, mode='lines+markers+text',
-                            texttemplate='%{text}', textposition='top center', textfont=dict(size=10),
-                            marker=dict(size=10, symbol='circle', line=dict(width=1, color='white')),
-                            line=dict(width=line_width, color=line_color),
-                            hovertemplate=(
-                                "<b>%{customdata[0]}</b><br>"  # UF do customdata
-                                "Ano: %{x}<br>"
-                                "Valor: %{customdata[3]}<br>"  # Modificado: Usa customdata[3] (pré-formatado)
-                                "Unidade: %{customdata[1]}<extra></extra>"
-                            )
-                        ))
-
-                    max_y_line = df_line_data['VLR_VAR'].max()
-                    y_range_line = [0, max_y_line * 1.15]
-
-                    layout_updates_line = DEFAULT_LAYOUT.copy()
-                    layout_updates_line.update({
-                        'xaxis': dict(showgrid=True, zeroline=False, tickfont=dict(size=12, color='black'),
-                                      tickangle=45),
-                        'yaxis': dict(showgrid=True, zeroline=False, tickfont=dict(size=12, color='black'), title=None,
-                                      type='linear', tickformat='d', range=y_range_line)
-                    })
-                    unique_years_line = sorted(df_line_data['CODG_ANO'].unique())
-                    layout_updates_line['xaxis']['ticktext'] = [f"<b>{x}</b>" for x in unique_years_line]
-                    layout_updates_line['xaxis']['tickvals'] = unique_years_line
-                    main_fig.update_layout(layout_updates_line)
-                else:
-                    main_fig = go.Figure().update_layout(title='Dados insuficientes para o gráfico de linha.',
-                                                         xaxis={'visible': False}, yaxis={'visible': False})
-
-            else:  # Gráfico de linha sem UF (e.g., só 'Brasil')
-                df_line_data = df_filtered.sort_values('CODG_ANO')
-                if not df_line_data.empty:
-                    # Adapta customdata para não ter UF, adiciona valor formatado
-                    customdata_line_no_uf = np.column_stack((
-                        df_line_data['DESC_UND_MED'].values,
-                        df_line_data['VLR_VAR'].values,  # Original value
-                        df_line_data['VLR_VAR'].apply(format_br).values  # Formatted value
-                    ))
-                    # Modificado: Usa a função format_br
-                    text_values = df_line_data['VLR_VAR'].apply(format_br)
-                    main_fig.add_trace(go.Scatter(
-                        x=df_line_data['CODG_ANO'], y=df_line_data['VLR_VAR'], name='Valor',
-                        customdata=customdata_line_no_uf, text=text_values, mode='lines+markers+text',
-                        line=dict(color='#229846', width=3),  # Cor padrão ou específica
-                        hovertemplate=(
-                            "Ano: %{x}<br>"
-                            "Valor: %{customdata[2]}<br>"  # Modificado: Usa customdata[2] (pré-formatado)
-                            "Unidade: %{customdata[0]}<extra></extra>"
-                        )
-                    ))
-
-                    max_y_line_no_uf = df_line_data['VLR_VAR'].max()
-                    y_range_line_no_uf = [0, max_y_line_no_uf * 1.15]
-
-                    layout_updates_line_no_uf = DEFAULT_LAYOUT.copy()
-                    layout_updates_line_no_uf.update({
-                        'showlegend': False,
-                        'xaxis': dict(showgrid=True, zeroline=False, tickfont=dict(size=12, color='black'),
-                                      tickangle=45),
-                        'yaxis': dict(showgrid=True, zeroline=False, tickfont=dict(size=12, color='black'), title=None,
-                                      type='linear', tickformat='d', range=y_range_line_no_uf)
-                    })
-                    unique_years_line_no_uf = sorted(df_line_data['CODG_ANO'].unique())
-                    layout_updates_line_no_uf['xaxis']['ticktext'] = [f"<b>{x}</b>" for x in unique_years_line_no_uf]
-                    layout_updates_line_no_uf['xaxis']['tickvals'] = unique_years_line_no_uf
-                    main_fig.update_layout(layout_updates_line_no_uf)
-                else:
-                    main_fig = go.Figure().update_layout(title='Dados insuficientes para o gráfico de linha.',
-                                                         xaxis={'visible': False}, yaxis={'visible': False})
-
-        else:  # grafico_linha_flag == 0
-            # --- Lógica do Gráfico de Barras AGRUPADO POR ANO (Refatorado com go.Figure) ---
-            main_fig = go.Figure()
-            if 'DESC_UND_FED' in df_filtered.columns and 'CODG_ANO' in df_filtered.columns:
-                df_bar_grouped_data = df_filtered.sort_values(['CODG_ANO', 'DESC_UND_FED'])
-                if not df_bar_grouped_data.empty:
-                    color_map = {
-                        'Goiás': '#229846', 'Maranhão': '#D2B48C', 'Distrito Federal': '#636efa',
-                        'Mato Grosso': '#ab63fa', 'Mato Grosso do Sul': '#ffa15a', 'Rondônia': '#19d3f3',
-                        'Tocantins': '#ff6692', 'Brasil': '#FF0000'  # Adiciona Brasil
-                    }
-                    for uf in df_bar_grouped_data['DESC_UND_FED'].unique():
-                        df_state = df_bar_grouped_data[df_bar_grouped_data['DESC_UND_FED'] == uf]
-                        if df_state.empty: continue  # Pula UF sem dados
-                        # Modificado: Adiciona valor formatado ao customdata
-                        customdata_state = np.column_stack((
-                            np.full(len(df_state), uf),
-                            df_state['DESC_UND_MED'].values,
-                            df_state['VLR_VAR'].values,  # Original value
-                            df_state['VLR_VAR'].apply(format_br).values  # Formatted value
-                        ))
-                        # Modificado: Usa a função format_br
-                        text_values = df_state['VLR_VAR'].apply(format_br)
-                        trace_name = f"<b>{uf}</b>" if uf == 'Goiás' else uf
-                        bar_color = color_map.get(uf)
-
-                        main_fig.add_trace(go.Bar(
-                            x=df_state['CODG_ANO'], y=df_state['VLR_VAR'], name=trace_name,
-                            customdata=customdata_state, text=text_values, texttemplate='%{text}',
-                            textposition='outside', marker_color=bar_color, marker_line_width=1.5,
-                            hovertemplate=(
-                                "<b>%{customdata[0]}</b><br>"  # UF do customdata
-                                "Ano: %{x}<br>"
-                                "Valor: %{customdata[3]}<br>"  # Modificado: Usa customdata[3] (pré-formatado)
-                                "Unidade: %{customdata[1]}<extra></extra>"
-                            )
-                        ))
-
-                    max_y_grouped = df_bar_grouped_data['VLR_VAR'].max()
-                    y_range_grouped = [0, max_y_grouped * 1.15]
-
-                    layout_updates_bar_grouped = DEFAULT_LAYOUT.copy()
-                    layout_updates_bar_grouped.update({
-                        'barmode': 'group',
-                        'xaxis': dict(showgrid=True, tickfont=dict(size=12, color='black'), tickangle=45, title=None),
-                        'yaxis': dict(showgrid=True, tickfont=dict(size=12, color='black'), title=None, type='linear',
-                                      tickformat='d', range=y_range_grouped)
-                    })
-                    unique_years_bar = sorted(df_bar_grouped_data['CODG_ANO'].unique())
-                    layout_updates_bar_grouped['xaxis']['ticktext'] = [f"<b>{x}</b>" for x in unique_years_bar]
-                    layout_updates_bar_grouped['xaxis']['tickvals'] = unique_years_bar
-                    main_fig.update_layout(layout_updates_bar_grouped)
-                else:
-                    main_fig = go.Figure().update_layout(title='Dados insuficientes para o gráfico de barras agrupado.',
-                                                         xaxis={'visible': False}, yaxis={'visible': False})
-            else:
-                # Caso sem UF mas com série temporal -> Barras simples por ano
-                df_bar_no_uf = df_filtered.sort_values('CODG_ANO')
-                if not df_bar_no_uf.empty:
-                    # Modificado: Adiciona valor formatado ao customdata
-                    customdata_bar_no_uf = np.column_stack((
-                        df_bar_no_uf['DESC_UND_MED'].values,
-                        df_bar_no_uf['VLR_VAR'].values,  # Original value
-                        df_bar_no_uf['VLR_VAR'].apply(format_br).values  # Formatted value
-                    ))
-                    # Modificado: Usa a função format_br
-                    text_values = df_bar_no_uf['VLR_VAR'].apply(format_br)
-                    main_fig.add_trace(go.Bar(
-                        x=df_bar_no_uf['CODG_ANO'],
-                        y=df_bar_no_uf['VLR_VAR'],
-                        marker_color='#229846',  # Cor padrão ou específica
-                        hovertemplate=(
-                            "Ano: %{x}<br>"
-                            "Valor: %{customdata[2]}<br>"  # Modificado: Usa customdata[2] (pré-formatado)
-                            "Unidade: %{customdata[0]}<extra></extra>"
-                        )
-                    ))
-
-                    max_y_bar_no_uf = df_bar_no_uf['VLR_VAR'].max()
-                    y_range_bar_no_uf = [0, max_y_bar_no_uf * 1.15]
-                    layout_updates_bar_no_uf = DEFAULT_LAYOUT.copy()
-                    layout_updates_bar_no_uf.update({
-                        'showlegend': False,
-                        'xaxis': dict(showgrid=True, tickfont=dict(size=12, color='black'), tickangle=45, title=None),
-                        'yaxis': dict(showgrid=True, tickfont=dict(size=12, color='black'), title=None, type='linear',
-                                      tickformat='d', range=y_range_bar_no_uf)
-                    })
-                    unique_years_bar_no_uf = sorted(df_bar_no_uf['CODG_ANO'].unique())
-                    layout_updates_bar_no_uf['xaxis']['ticktext'] = [f"<b>{x}</b>" for x in unique_years_bar_no_uf]
-                    layout_updates_bar_no_uf['xaxis']['tickvals'] = unique_years_bar_no_uf
-                    main_fig.update_layout(layout_updates_bar_no_uf)
-                else:
-                    main_fig = go.Figure().update_layout(title='Dados insuficientes para o gráfico de barras.',
-                                                         xaxis={'visible': False}, yaxis={'visible': False})
+        # --- Criação do Gráfico Principal (linha ou barras agrupadas por ano) ---
+        tracing.stage('grafico_principal')
+        main_fig = series_figure(df_filtered, 'line' if grafico_linha_flag == 1 else 'bar')
 
         # --- Criação do Gráfico de Ranking (se houver UF e ano) ---
+        tracing.stage('ranking')
         ranking_content = dbc.Alert("Ranking não disponível (requer dados por Unidade Federativa).", color="info",
                                     className="textCenter p-3")
         if 'DESC_UND_FED' in df_filtered.columns and ano_default:
             # Filtra dados para o ano padrão (será atualizado pelo dropdown)
-            df_ranking_data_initial = df_filtered[df_filtered['CODG_ANO'] == ano_default].copy()
+            df_ranking_data_initial = df_filtered[df_filtered['CODG_ANO'] == ano_default]
 
             # Verifica se há dados para o ano padrão antes de prosseguir
             if not df_ranking_data_initial.empty:
@@ -1018,47 +1240,7 @@ def create_visualization(df, indicador_id=None, selected_var=None, selected_filt
                     ascending_rank = (ranking_ordem == 0)  # True se for maior para menor
                     df_ranking_data_initial = df_ranking_data_initial.sort_values('VLR_VAR', ascending=ascending_rank)
 
-                    # Define cores e opacidade
-                    goias_color = 'rgba(34, 152, 70, 1)'  # '#229846' opaco
-                    other_color = 'rgba(34, 152, 70, 0.2)'  # Define como 0.2 para consistência
-
-                    # Cria o gráfico de ranking com go.Figure e go.Bar
-                    fig_ranking_updated = go.Figure()
-                    for _, row in df_ranking_data_initial.iterrows():
-                        uf = row['DESC_UND_FED']
-                        valor = row['VLR_VAR']
-                        und_med = row.get('DESC_UND_MED', 'N/D')  # Usa .get() para segurança
-                        bar_color = goias_color if uf == 'Goiás' else other_color
-                        # Modificado: Usa a função format_br
-                        text_value = format_br(valor)
-
-                        fig_ranking_updated.add_trace(go.Bar(
-                            y=[uf],  # Estados no eixo Y
-                            x=[valor],  # Valores no eixo X
-                            name=uf,
-                            orientation='h',  # Barras horizontais
-                            marker_color=bar_color,
-                            text=text_value,
-                            textposition='outside',  # Texto fora da barra
-                            hovertemplate=(
-                                f"<b>{uf}</b><br>"
-                                f"Valor: {text_value}<br>"  # Usa o texto formatado
-                                f"Unidade: {und_med}<extra></extra>"
-                            )
-                        ))
-
-                    max_x_ranking = df_ranking_data_initial['VLR_VAR'].max() if not df_ranking_data_initial.empty else 0
-                    x_range_ranking = [0, max_x_ranking * 1.15]
-
-                    # Atualiza layout para gráfico de barras horizontal
-                    fig_ranking_updated.update_layout(
-                        xaxis_title=None, yaxis_title=None,
-                        yaxis=dict(showgrid=False, tickfont=dict(size=12, color='black'), categoryorder='array',
-                                   categoryarray=df_ranking_data_initial['DESC_UND_FED'].tolist()),
-                        xaxis=dict(showgrid=True, zeroline=False, tickfont=dict(size=12, color='black'),
-                                   range=x_range_ranking, tickformat='d'),
-                        showlegend=False, margin=dict(l=150, r=20, t=30, b=30), bargap=0.1
-                    )
+                    fig_ranking_updated = ranking_figure(df_ranking_data_initial)
 
                     # Define o conteúdo do ranking como o dropdown e o gráfico
                     ranking_content = html.Div([
@@ -1090,13 +1272,13 @@ def create_visualization(df, indicador_id=None, selected_var=None, selected_filt
                 ])
 
         # --- Criação do Mapa (se houver UF e ano) ---
+        tracing.stage('mapa')
         map_content = dbc.Alert("Mapa não disponível (requer dados por Unidade Federativa).", color="info",
                                 className="textCenter p-3")
-        map_center = {'lat': -12.95984198, 'lon': -53.27299730}  # Inicializa fora do try
 
         if 'DESC_UND_FED' in df_filtered.columns and ano_default:
             # Filtra dados para o ano padrão (será atualizado pelo dropdown)
-            df_map_data_initial = df_filtered[df_filtered['CODG_ANO'] == ano_default].copy()
+            df_map_data_initial = df_filtered[df_filtered['CODG_ANO'] == ano_default]
 
             # Verifica se há dados e unicidade por UF para o ano padrão
             if not df_map_data_initial.empty:
@@ -1108,49 +1290,7 @@ def create_visualization(df, indicador_id=None, selected_var=None, selected_filt
                     )
                 else:
                     try:
-                        with open('db/br_geojson.json', 'r', encoding='utf-8') as f:
-                            geojson = json.load(f)
-                        # Tenta obter unidade de medida de forma segura
-                        und_med_map = df_map_data_initial['DESC_UND_MED'].dropna().iloc[0] if not df_map_data_initial[
-                            'DESC_UND_MED'].dropna().empty else ''
-                        # Modificado: Adiciona coluna formatada para hover
-                        df_map_data_initial['VLR_VAR_FORMATADO'] = df_map_data_initial['VLR_VAR'].apply(format_br)
-
-                        fig_map = px.choropleth(
-                            df_map_data_initial,
-                            geojson=geojson,
-                            locations='DESC_UND_FED',
-                            featureidkey='properties.name',
-                            color='VLR_VAR',
-                            color_continuous_scale=[  # Escala baseada no Ranking
-                                [0.0, 'rgba(34, 152, 70, 0.2)'],
-                                [1.0, 'rgba(34, 152, 70, 1)']
-                            ],
-                        )
-
-                        # --- Atualizar Geos com Centroide FIXO 
-                        map_center = {'lat': -12.95984198, 'lon': -53.27299730}
-                        geos_update = dict(
-                            visible=False, showcoastlines=True, coastlinecolor="White",
-                            showland=True, landcolor="white", showframe=False,
-                            projection=dict(type='mercator', scale=15),
-                            center=map_center
-                        )
-
-                        # Aplica a atualização geo
-                        fig_map.update_geos(**geos_update)
-                        # ----------------------------------
-
-                        fig_map.update_traces(
-                            marker_line_color='white', marker_line_width=1,
-                            customdata=df_map_data_initial[['VLR_VAR_FORMATADO']],
-                            hovertemplate="<b>%{location}</b><br>Valor: %{customdata[0]}" + (
-                                f" {und_med_map}" if und_med_map else "") + "<extra></extra>"
-                        )
-
-                        # --- Remove o título da barra de cores ---
-                        fig_map.update_layout(coloraxis_colorbar_title_text='')
-                        # -----------------------------------------
+                        fig_map = choropleth_figure(df_map_data_initial)
 
                         # Define o conteúdo do mapa como o dropdown e o gráfico
                         map_content = html.Div([
@@ -1185,6 +1325,7 @@ def create_visualization(df, indicador_id=None, selected_var=None, selected_filt
                 ])
 
         # --- Monta o Layout da Visualização com Abas ---
+        tracing.stage('componentes')
         graph_layout = []
 
         # Conteúdo do gráfico principal (sempre exibido)
@@ -1229,11 +1370,24 @@ def create_visualization(df, indicador_id=None, selected_var=None, selected_filt
         ]))
 
         # --- Adiciona Tabela Detalhada sempre
+        # Exportações servidas pelo endpoint /exportar a partir da seleção normalizada
+        filters_key = make_filters_key(selected_filters)
+        export_urls = {}
+        for formato in EXPORT_FORMATS:
+            export_urls[formato] = build_export_url(indicador_id, formato, selected_var, filters_key)
+            # Com o gerenciador em segundo plano, o arquivo completo é gerado pelo callback
+            # export_full_background e o link só é usado depois de pronto
+            export_urls[f'{formato}_full'] = (
+                None if background_manager is not None else build_export_url(indicador_id, formato, completo=True)
+            )
         graph_layout.append(dbc.Row([
             dbc.Col(dbc.Card([
                 html.Div([
                     html.H5("Dados Detalhados", className="mt-4 d-inline-block", style={'marginLeft': '20px'}),
                     html.Div([
+                        # Link do arquivo completo gerado em segundo plano (ver export_full_background)
+                        dcc.Store(id={'type': 'export-file-url', 'index': indicador_id}),
+                        html.A(id={'type': 'export-file-link', 'index': indicador_id}, style={'display': 'none'}),
                         # Substitui os botões simples por dropdowns
                         dbc.DropdownMenu(
                             id={'type': 'dropdown-csv', 'index': indicador_id},
@@ -1242,9 +1396,9 @@ def create_visualization(df, indicador_id=None, selected_var=None, selected_filt
                             size="sm",
                             className="me-2 d-inline-block",
                             children=[
-                                dbc.DropdownMenuItem("Dados filtrados", 
+                                dbc.DropdownMenuItem("Dados filtrados", href=export_urls['csv'], external_link=True,
                                                     id={'type': 'btn-csv-filtered', 'index': indicador_id}),
-                                dbc.DropdownMenuItem("Dados completos", 
+                                dbc.DropdownMenuItem("Dados completos", href=export_urls['csv_full'], external_link=True,
                                                     id={'type': 'btn-csv-full', 'index': indicador_id}),
                             ]
                         ),
@@ -1255,106 +1409,49 @@ def create_visualization(df, indicador_id=None, selected_var=None, selected_filt
                             size="sm",
                             className="d-inline-block",
                             children=[
-                                dbc.DropdownMenuItem("Dados filtrados", 
+                                dbc.DropdownMenuItem("Dados filtrados", href=export_urls['xlsx'], external_link=True,
                                                     id={'type': 'btn-excel-filtered', 'index': indicador_id}),
-                                dbc.DropdownMenuItem("Dados completos", 
+                                dbc.DropdownMenuItem("Dados completos", href=export_urls['xlsx_full'], external_link=True,
                                                     id={'type': 'btn-excel-full', 'index': indicador_id}),
                             ]
                         ),
-                        # Componentes de download
-                        dcc.Download(id={'type': 'download-csv', 'index': indicador_id}),
-                        dcc.Download(id={'type': 'download-excel', 'index': indicador_id})
                     ], className="float-end me-3 mt-4 d-flex")
                 ], className="d-flex justify-content-between w-100"),
                 dbc.CardBody([
+                    # Modelo infinito: as linhas são pedidas ao servidor por página
+                    # (ordenação e filtros aplicados no servidor, ver serve_detail_table_rows)
                     dag.AgGrid(
                         id={'type': 'detail-table', 'index': indicador_id},
-                        # Usa df_original_for_table para a tabela AG Grid
-                        rowData=df_original_for_table.to_dict('records'),
+                        rowModelType="infinite",
                         columnDefs=columnDefs,
                         defaultColDef=defaultColDef,
                         dashGridOptions={
                             "pagination": True, "paginationPageSize": 10,
                             "paginationPageSizeSelector": [5, 10, 20, 50, 100],
-                            "domLayout": "autoHeight", "suppressMovableColumns": True,
-                            "animateRows": True, "suppressColumnVirtualisation": True
+                            "cacheBlockSize": 10, "maxBlocksInCache": 20,
+                            "suppressMovableColumns": True, "tooltipShowDelay": 300
                         },
-                        style={"width": "100%"}
+                        style={"width": "100%", "height": "520px"}
                     ),
                 ])
             ]), className="mt-4")
         ]))
         
-        # Preparar dados para exportação - garantindo todos os campos CODG
-        export_data = df_original_for_table.copy()
-        
-        # Verificar campos CODG_ no DataFrame original e garantir que são incluídos na exportação
-        if df is not None and not df.empty:
-            codg_cols = [col for col in df.columns if col.startswith('CODG_')]
-            for col in codg_cols:
-                if col not in export_data.columns and col in df.columns:
-                    export_data[col] = df[col]
-        
-        # Adicionar ID_INDICADOR se ainda não existir
-        if indicador_id and 'ID_INDICADOR' not in export_data.columns:
-            export_data['ID_INDICADOR'] = indicador_id
-        
-        # Reordenar colunas para agrupar campos relacionados (CODG e DESC correspondentes)
-        # Primeiro identificamos todas as colunas disponíveis
-        all_columns = list(export_data.columns)
-        
-        # Definimos a ordem desejada de pares de colunas
-        ordered_pairs = [
-            # Primeiro o ID_INDICADOR
-            ['ID_INDICADOR'],
-            # Depois campos de UF
-            ['CODG_UND_FED', 'DESC_UND_FED'],
-            # Depois campos de ANO
-            ['CODG_ANO'],
-            # Depois campos de VAR
-            ['CODG_VAR', 'DESC_VAR'],
-            # Depois VLR_VAR 
-            ['VLR_VAR'],
-            # Depois campos de UND_MED
-            ['CODG_UND_MED', 'DESC_UND_MED']
-        ]
-        
-        # Campos dinâmicos (outros CODG_ e DESC_ correspondentes)
-        dynamic_pairs = []
-        for col in all_columns:
-            if col.startswith('CODG_') and col not in [item for sublist in ordered_pairs for item in sublist]:
-                # Verifica se há um DESC correspondente
-                desc_col = 'DESC_' + col[5:]
-                if desc_col in all_columns:
-                    dynamic_pairs.append([col, desc_col])
-                else:
-                    dynamic_pairs.append([col])
-        
-        # Construir a lista final de colunas na ordem desejada
-        ordered_columns = []
-        for pair in ordered_pairs + dynamic_pairs:
-            for col in pair:
-                if col in all_columns:
-                    ordered_columns.append(col)
-        
-        # Adicionar quaisquer colunas restantes que não foram incluídas
-        for col in all_columns:
-            if col not in ordered_columns:
-                ordered_columns.append(col)
-        
-        # Reordenar o DataFrame
-        export_data = export_data[ordered_columns]
-        
-        # Log para debug dos campos na exportação
-        logging.debug(f"Campos para exportação em {indicador_id} (reorganizados): {export_data.columns.tolist()}")
-        
-        # Adicionar Store para dados de download
-        graph_layout.append(html.Div([
+        hidden_stores = [
+            # Seleção usada na tabela de detalhes (o servidor monta as páginas a partir dela)
             dcc.Store(
-                id={'type': 'download-data', 'index': indicador_id}, 
-                data=export_data.to_json(date_format='iso', orient='split')
+                id={'type': 'table-state-store', 'index': indicador_id},
+                data={'selected_var': selected_var, 'selected_filters': selected_filters or {}}
             )
-        ], style={'display': 'none'}))
+        ]
+
+        # Tabela compacta por ano para a troca de ano do ranking/mapa no navegador
+        if CLIENTSIDE_YEAR_SWITCH and 'DESC_UND_FED' in df_filtered.columns and anos_unicos:
+            hidden_stores.append(dcc.Store(
+                id={'type': 'year-values-store', 'index': indicador_id},
+                data=build_year_values_table(df_filtered, ranking_ordem)
+            ))
+        graph_layout.append(html.Div(hidden_stores, style={'display': 'none'}))
         
         return graph_layout
 
@@ -1365,32 +1462,14 @@ def create_visualization(df, indicador_id=None, selected_var=None, selected_filt
         return dbc.Alert(f"Erro ao gerar visualização para {indicador_id}.", color="danger")
 
 
-# Define o layout padrão
-DEFAULT_LAYOUT = {
-    'showlegend': True,
-    'legend': dict(
-        title=None,
-        orientation="h",  # Legenda horizontal
-        yanchor="top",
-        y=1.2,  # Posiciona abaixo do gráfico
-        xanchor="center",
-        x=0.5  # Centraliza horizontalmente
-    ),
-    'margin': dict(l=20, r=20, t=40, b=100),  # Ajusta margens para acomodar a legenda
-    'xaxis': dict(showgrid=False, zeroline=False),
-    'yaxis': dict(showgrid=False, zeroline=False),
-    'xaxis_automargin': True,
-    'yaxis_automargin': True
-}
-
 # Define o layout do aplicativo
 app.layout = dbc.Container([
     # Header com imagens e título
     dbc.Row(dbc.Col(dbc.Card([
         dbc.CardBody(dbc.Row([
-            dbc.Col(html.Img(src='/assets/img/sgg.png', className="img-fluid",
+            dbc.Col(html.Img(src=asset_manifest.url('img/sgg.png'), className="img-fluid",
                              style={'maxWidth': '150px', 'height': 'auto'}), xs=12, sm=6, md=3, className="p-2"),
-            dbc.Col(html.Img(src='/assets/img/imb720.png', className="img-fluid",
+            dbc.Col(html.Img(src=asset_manifest.url('img/imb720.png'), className="img-fluid",
                              style={'maxWidth': '150px', 'height': 'auto'}), xs=12, sm=6, md=3, className="p-2"),
             dbc.Col(html.H1('Instituto Mauro Borges - ODS - Agenda 2030', className="align-middle",
                             style={'margin': '0', 'padding': '0'}), xs=12, sm=12, md=6,
@@ -1426,8 +1505,9 @@ app.layout = dbc.Container([
             dbc.Col(dbc.Card(dbc.CardBody(dbc.Row([
                 dbc.Col(html.Div(
                     html.Img(src=row['BASE64'], style={'width': '100%', 'marginBottom': '10px', 'cursor': 'pointer'},
-                             className="img-fluid", id=f"objetivo{idx}", n_clicks=1 if idx == 0 else 0)), width=4)
-                for idx, row in df.iterrows()
+                             className="img-fluid", id={'type': 'objetivo-button', 'index': idx},
+                             n_clicks=1 if idx == 0 else 0)), width=4)
+                for idx, row in enumerate(df.to_dict('records'))
             ], className="g-2"))), lg=2),
             # Conteúdo Principal (Metas e Indicadores)
             dbc.Col(dbc.Card([
@@ -1440,7 +1520,10 @@ app.layout = dbc.Container([
                     html.Div(id='loading-indicator', children=[]),
                     html.Div(id='indicadores-section', children=initial_indicadores_section),
                     # Componente oculto para acionar o carregamento do primeiro indicador
-                    html.Div(id='trigger-first-tab-load', style={'display': 'none'})
+                    html.Div(id='trigger-first-tab-load', style={'display': 'none'}),
+                    # Último objetivo/meta clicado (preenchidos no navegador, ver assets/clientside.js)
+                    dcc.Store(id='objetivo-selecionado'),
+                    dcc.Store(id='meta-selecionada')
                 ])
             ]), lg=10)
         ]))
@@ -1482,7 +1565,17 @@ app.layout = dbc.Container([
         dbc.ModalFooter(
             dbc.Button("Fechar", id="close-info-modal", className="ms-auto", n_clicks=0)
         ),
-    ], id="info-modal", is_open=False, size="lg")
+    ], id="info-modal", is_open=False, size="lg"),
+
+    # Progresso das exportações completas geradas em segundo plano (visível apenas durante a geração)
+    html.Div(
+        dbc.Card(dbc.CardBody([
+            html.Small("Gerando exportação completa...", className="d-block mb-1"),
+            dbc.Progress(id='export-progress', value=0, striped=True, animated=True, style={'height': '20px'})
+        ], className="p-2"), className="shadow"),
+        id='export-progress-container',
+        style={'display': 'none'}
+    )
 ], fluid=True)
 
 # Callback para abrir/fechar o modal de informações
@@ -1525,77 +1618,95 @@ def load_indicator_on_demand(active_tab, container_id):  # <--- DEFINIÇÃO DA F
         raise PreventUpdate
 
     # Se chegou aqui, é porque este indicador DEVE ser carregado
-    logging.debug(f"Carregando indicador: {indicador_id} (Aba ativa: {active_tab})")
+    logging.debug("Carregando indicador: %s (Aba ativa: %s)", indicador_id, active_tab)
 
-    # --- INÍCIO DO BLOCO TRY...EXCEPT ---
     try:
-        # Carrega os dados do indicador
-        df_dados = load_dados_indicador_cache(indicador_id)
-
-        # Busca informações do indicador (descrição, etc.)
-        indicador_info = df_indicadores[df_indicadores['ID_INDICADOR'] == indicador_id]
-        if indicador_info.empty:
-            logging.error("Erro: Configuração não encontrada para indicador %s", indicador_id)
-            # Oculta spinner, mostra erro
-            return [dbc.Alert(f"Informações de configuração não encontradas para o indicador {indicador_id}.",
-                              color="danger")], {'display': 'none'}
-
-        # Obtém a descrição do indicador (será retornada junto com o conteúdo ou erro, quando necessário)
-        desc_p = html.P(indicador_info.iloc[0]['DESC_INDICADOR'], className="textJustify p-3")
-
-        # Verifica se os dados foram carregados
-        if df_dados is None or df_dados.empty:
-            logging.warning("Dados não disponíveis para indicador %s", indicador_id)
-            # Retorna descrição + alerta de dados não disponíveis
-            return [desc_p, dbc.Alert(f"Dados não disponíveis para {indicador_id}.", color="warning")], {
-                'display': 'none'}  # Oculta spinner
-
-        # Variáveis para montar o conteúdo
-        dynamic_filters_div = []
-        variable_dropdown_div = []
-        valor_inicial_variavel = None
-        df_variavel_filtrado = pd.DataFrame()  # Inicializa vazio
-
-        # --- Identificação das colunas de filtro dinâmico ---
-        filter_cols = identify_filter_columns(df_dados)
-
-        # --- Geração do Dropdown de Variável Principal (PRIMEIRO, pois afeta os filtros) ---
-        has_variable_dropdown = not indicador_info.empty and 'VARIAVEIS' in indicador_info.columns and \
-                                indicador_info['VARIAVEIS'].iloc[0] == '1'
-        
-        # Verifica se o indicador tem variáveis e se a coluna CODG_VAR existe nos dados
-        if has_variable_dropdown and 'CODG_VAR' in df_dados.columns:
-            df_variavel_loaded = load_variavel()
-            variaveis_indicador = df_dados['CODG_VAR'].astype(str).unique()
-            if not df_variavel_loaded.empty:
-                df_variavel_filtrado = df_variavel_loaded[
-                    df_variavel_loaded['CODG_VAR'].astype(str).isin(variaveis_indicador)]
-                if not df_variavel_filtrado.empty:
-                    # Usa a função de busca de melhor variável
-                    valor_inicial_variavel = find_best_initial_var(df_dados, df_variavel_filtrado)
-
-                    variable_dropdown_div = [html.Div([
-                        html.Label("Selecione uma Variável:",
-                                   style={'fontWeight': 'bold', 'display': 'block', 'marginBottom': '5px'},
-                                   id={'type': 'var-label', 'index': indicador_id}),
-                        dcc.Dropdown(
-                            id={'type': 'var-dropdown', 'index': indicador_id},
-                            options=[{'label': desc, 'value': cod} for cod, desc in
-                                     zip(df_variavel_filtrado['CODG_VAR'], df_variavel_filtrado['DESC_VAR'])],
-                            value=valor_inicial_variavel, style={'width': '100%'}
-                        )
-                    ], style={'paddingBottom': '20px', 'paddingTop': '20px'},
-                        id={'type': 'var-dropdown-container', 'index': indicador_id})]
-                else:
-                    # Se não há variáveis válidas, renderiza um dropdown oculto
-                    variable_dropdown_div = [html.Div([
-                        dcc.Dropdown(
-                            id={'type': 'var-dropdown', 'index': indicador_id},
-                            options=[], value=None, style={'display': 'none'}, disabled=True
-                        )
-                    ], id={'type': 'var-dropdown-container', 'index': indicador_id}, style={'display': 'none'})]
+        data_version = get_data_version()
+        content = indicator_content(indicador_id, data_version)
+    except Exception as e_load:
+        logging.exception("Erro ao carregar conteúdo para %s", indicador_id)
+        # Retorna apenas o alerta de erro
+        return [dbc.Alert(f"Erro ao carregar dados para {indicador_id}.", color="danger")], {'display': 'none'}
+
+    # Com a aba entregue, pré-calcula as demais abas da meta (opcional, ver TAB_PREFETCH)
+    meta_id = get_navigation_tree(data_version).meta_por_indicador.get(indicador_id)
+    if meta_id:
+        prefetch_sibling_tabs(meta_id, data_version, exclude=indicador_id)
+    return content
+
+
+def build_indicator_content(indicador_id):
+    """
+    Monta o conteúdo da aba de um indicador com a seleção inicial (variável, filtros e visualização).
+
+    Args:
+        indicador_id: ID do indicador
+
+    Returns:
+        Tupla (conteúdo da aba, estilo do spinner)
+    """
+    # Carrega os dados do indicador
+    df_dados = load_dados_indicador_cache(indicador_id)
+
+    # Busca informações do indicador (descrição, etc.)
+    indicador_info = df_indicadores[df_indicadores['ID_INDICADOR'] == indicador_id]
+    if indicador_info.empty:
+        logging.error("Erro: Configuração não encontrada para indicador %s", indicador_id)
+        # Oculta spinner, mostra erro
+        return [dbc.Alert(f"Informações de configuração não encontradas para o indicador {indicador_id}.",
+                          color="danger")], {'display': 'none'}
+
+    # Obtém a descrição do indicador (será retornada junto com o conteúdo ou erro, quando necessário)
+    desc_p = html.P(indicador_info.iloc[0]['DESC_INDICADOR'], className="textJustify p-3")
+
+    # Verifica se os dados foram carregados
+    if df_dados is None or df_dados.empty:
+        logging.warning("Dados não disponíveis para indicador %s", indicador_id)
+        # Retorna descrição + alerta de dados não disponíveis
+        return [desc_p, dbc.Alert(f"Dados não disponíveis para {indicador_id}.", color="warning")], {
+            'display': 'none'}  # Oculta spinner
+
+    # Variáveis para montar o conteúdo
+    dynamic_filters_div = []
+    variable_dropdown_div = []
+    valor_inicial_variavel = None
+    df_variavel_filtrado = pd.DataFrame()  # Inicializa vazio
+
+    # --- Identificação das colunas de filtro dinâmico ---
+    filter_cols = identify_filter_columns(df_dados)
+    # Reticulado de combinações: seleção inicial e opções sem dados viram consultas em dicionário
+    lattice = get_filter_lattice(indicador_id, get_data_version())
+
+    # --- Geração do Dropdown de Variável Principal (PRIMEIRO, pois afeta os filtros) ---
+    has_variable_dropdown = not indicador_info.empty and 'VARIAVEIS' in indicador_info.columns and \
+                            indicador_info['VARIAVEIS'].iloc[0] == '1'
+    
+    # Verifica se o indicador tem variáveis e se a coluna CODG_VAR existe nos dados
+    if has_variable_dropdown and 'CODG_VAR' in df_dados.columns:
+        df_variavel_loaded = load_variavel()
+        variaveis_indicador = df_dados['CODG_VAR'].astype(str).unique()
+        if not df_variavel_loaded.empty:
+            df_variavel_filtrado = df_variavel_loaded[
+                df_variavel_loaded['CODG_VAR'].astype(str).isin(variaveis_indicador)]
+            if not df_variavel_filtrado.empty:
+                # Usa a função de busca de melhor variável
+                valor_inicial_variavel = find_best_initial_var(df_dados, df_variavel_filtrado, lattice)
+
+                variable_dropdown_div = [html.Div([
+                    html.Label("Selecione uma Variável:",
+                               style={'fontWeight': 'bold', 'display': 'block', 'marginBottom': '5px'},
+                               id={'type': 'var-label', 'index': indicador_id}),
+                    dcc.Dropdown(
+                        id={'type': 'var-dropdown', 'index': indicador_id},
+                        options=[{'label': desc, 'value': cod, 'disabled': not lattice.has_data(cod)}
+                                 for cod, desc in
+                                 zip(df_variavel_filtrado['CODG_VAR'], df_variavel_filtrado['DESC_VAR'])],
+                        value=valor_inicial_variavel, style={'width': '100%'}
+                    )
+                ], style={'paddingBottom': '20px', 'paddingTop': '20px'},
+                    id={'type': 'var-dropdown-container', 'index': indicador_id})]
             else:
-                # Se df_variavel_loaded está vazio, renderiza um dropdown oculto
+                # Se não há variáveis válidas, renderiza um dropdown oculto
                 variable_dropdown_div = [html.Div([
                     dcc.Dropdown(
                         id={'type': 'var-dropdown', 'index': indicador_id},
@@ -1603,794 +1714,653 @@ def load_indicator_on_demand(active_tab, container_id):  # <--- DEFINIÇÃO DA F
                     )
                 ], id={'type': 'var-dropdown-container', 'index': indicador_id}, style={'display': 'none'})]
         else:
-            # Se o indicador não tem variáveis ou a coluna CODG_VAR não existe, renderiza um dropdown oculto
+            # Se df_variavel_loaded está vazio, renderiza um dropdown oculto
             variable_dropdown_div = [html.Div([
                 dcc.Dropdown(
                     id={'type': 'var-dropdown', 'index': indicador_id},
                     options=[], value=None, style={'display': 'none'}, disabled=True
                 )
             ], id={'type': 'var-dropdown-container', 'index': indicador_id}, style={'display': 'none'})]
+    else:
+        # Se o indicador não tem variáveis ou a coluna CODG_VAR não existe, renderiza um dropdown oculto
+        variable_dropdown_div = [html.Div([
+            dcc.Dropdown(
+                id={'type': 'var-dropdown', 'index': indicador_id},
+                options=[], value=None, style={'display': 'none'}, disabled=True
+            )
+        ], id={'type': 'var-dropdown-container', 'index': indicador_id}, style={'display': 'none'})]
+
+    # --- Busca a melhor combinação de filtros (usando a variável selecionada) ---
+    best_filters = find_valid_filter_combination(df_dados, filter_cols, valor_inicial_variavel, lattice)
+    initial_dynamic_filters = best_filters.copy()
+
+    # --- Valores iniciais de cada filtro ---
+    filter_codes = {}
+    for filter_col_code in filter_cols:
+        unique_codes = sorted(df_dados[filter_col_code].dropna().astype(str).unique())
+        filter_codes[filter_col_code] = unique_codes
+
+        # Usa o valor da combinação encontrada ou o melhor valor para este filtro
+        if best_filters.get(filter_col_code) is None and unique_codes:
+            # Se não tiver na melhor combinação, usa um valor padrão inteligente
+            prefs = {
+                'CODG_DOM': ['Urbana', 'Rural', 'Total'],  # Situação do domicílio
+                'CODG_SEXO': ['Total', '4'],  # Prefere "Total" ou código 4 (ambos os sexos)
+                'CODG_RACA': ['Total', '6'],  # Prefere "Total" ou código 6 (todas as raças)
+                'CODG_IDADE': ['Total', '1140'],  # Prefere "Total" ou código 1140 (todas as idades)
+                'CODG_INST': ['Total']  # Prefere "Total" para nível de instrução
+            }.get(filter_col_code, ['Total', 'Todos', 'Todas'])
+
+            initial_dynamic_filters[filter_col_code] = find_best_initial_value(unique_codes, prefs)
+
+    # --- Geração de Filtros Dinâmicos ---
+    filter_index = get_filter_index(indicador_id, get_data_version())
+    for idx, filter_col_code in enumerate(filter_cols):
+        desc_col_code = 'DESC_' + filter_col_code[5:]
+        code_to_desc = {}
+        if desc_col_code in df_dados.columns:
+            try:
+                mapping_df = df_dados[[filter_col_code, desc_col_code]].dropna().drop_duplicates()
+                code_to_desc = pd.Series(mapping_df[desc_col_code].astype(str).values,
+                                         index=mapping_df[filter_col_code].astype(str)).to_dict()
+            except Exception as map_err:
+                logging.error("Erro ao mapear código/descrição para filtro %s em %s: %s", filter_col_code,
+                              indicador_id, map_err)
+
+        # Opções sem dados dadas a variável e as demais seleções iniciais ficam desabilitadas
+        valid_codes = filter_index.valid_values(filter_col_code, valor_inicial_variavel, initial_dynamic_filters)
+        col_options = [
+            {'label': str(code_to_desc.get(code, code)), 'value': code,
+             'disabled': code.strip() not in valid_codes}
+            for code in filter_codes[filter_col_code]
+        ]
+        filter_label = constants.COLUMN_NAMES.get(filter_col_code, filter_col_code)
+        md_width = 7 if idx % 2 == 0 else 5
+
+        dynamic_filters_div.append(dbc.Col([
+            html.Label(f"{filter_label}:", style={'fontWeight': 'bold', 'display': 'block', 'marginBottom': '5px'}),
+            dcc.Dropdown(
+                id={'type': 'dynamic-filter-dropdown', 'index': indicador_id, 'filter_col': filter_col_code},
+                options=col_options, value=initial_dynamic_filters.get(filter_col_code),
+                style={'marginBottom': '10px', 'width': '100%'}
+            )
+        ], md=md_width, xs=12))
 
-        # --- Busca a melhor combinação de filtros (usando a variável selecionada) ---
-        best_filters = find_valid_filter_combination(df_dados, filter_cols, valor_inicial_variavel)
-        initial_dynamic_filters = best_filters.copy()
+    # Adiciona log para debug dos filtros iniciais
+    logging.debug("Indicador %s: Filtros iniciais definidos como %s", indicador_id, initial_dynamic_filters)
+    logging.debug("Indicador %s: Variável inicial definida como %s", indicador_id, valor_inicial_variavel)
 
-        # --- Geração de Filtros Dinâmicos ---
-        for idx, filter_col_code in enumerate(filter_cols):
-            desc_col_code = 'DESC_' + filter_col_code[5:]
-            code_to_desc = {}
-            if desc_col_code in df_dados.columns:
-                try:
-                    mapping_df = df_dados[[filter_col_code, desc_col_code]].dropna().drop_duplicates()
-                    code_to_desc = pd.Series(mapping_df[desc_col_code].astype(str).values,
-                                             index=mapping_df[filter_col_code].astype(str)).to_dict()
-                except Exception as map_err:
-                    logging.error("Erro ao mapear código/descrição para filtro %s em %s: %s", filter_col_code,
-                                  indicador_id, map_err)
-
-            unique_codes = sorted(df_dados[filter_col_code].dropna().astype(str).unique())
-            col_options = [{'label': str(code_to_desc.get(code, code)), 'value': code} for code in unique_codes]
-            filter_label = constants.COLUMN_NAMES.get(filter_col_code, filter_col_code)
-            md_width = 7 if idx % 2 == 0 else 5
-
-            # Usa o valor da combinação encontrada ou o melhor valor para este filtro
-            initial_value = best_filters.get(filter_col_code)
-            if initial_value is None and unique_codes:
-                # Se não tiver na melhor combinação, usa um valor padrão inteligente
-                prefs = {
-                    'CODG_DOM': ['Urbana', 'Rural', 'Total'],  # Situação do domicílio
-                    'CODG_SEXO': ['Total', '4'],  # Prefere "Total" ou código 4 (ambos os sexos)
-                    'CODG_RACA': ['Total', '6'],  # Prefere "Total" ou código 6 (todas as raças)
-                    'CODG_IDADE': ['Total', '1140'],  # Prefere "Total" ou código 1140 (todas as idades)
-                    'CODG_INST': ['Total']  # Prefere "Total" para nível de instrução
-                }.get(filter_col_code, ['Total', 'Todos', 'Todas'])
-
-                initial_value = find_best_initial_value(unique_codes, prefs)
-                initial_dynamic_filters[filter_col_code] = initial_value
-
-            dynamic_filters_div.append(dbc.Col([
-                html.Label(f"{filter_label}:", style={'fontWeight': 'bold', 'display': 'block', 'marginBottom': '5px'}),
-                dcc.Dropdown(
-                    id={'type': 'dynamic-filter-dropdown', 'index': indicador_id, 'filter_col': filter_col_code},
-                    options=col_options, value=initial_value, style={'marginBottom': '10px', 'width': '100%'}
-                )
-            ], md=md_width, xs=12))
+    # Gera a visualização inicial com os filtros definidos
+    initial_visualization = create_visualization(
+        df_dados, indicador_id, valor_inicial_variavel, initial_dynamic_filters
+    )
 
-        # Adiciona log para debug dos filtros iniciais
-        logging.debug(f"Indicador {indicador_id}: Filtros iniciais definidos como {initial_dynamic_filters}")
-        logging.debug(f"Indicador {indicador_id}: Variável inicial definida como {valor_inicial_variavel}")
+    # --- Monta o conteúdo dinâmico final ---
+    dynamic_content = []
+    # Nota: A descrição do indicador já está presente na tab, não precisamos adicioná-la novamente aqui
+    dynamic_content.extend(variable_dropdown_div)
+    if dynamic_filters_div:
+        dynamic_content.append(dbc.Row(dynamic_filters_div))
 
-        # Gera a visualização inicial com os filtros definidos
-        initial_visualization = create_visualization(
-            df_dados, indicador_id, valor_inicial_variavel, initial_dynamic_filters
-        )
+    # Adiciona o container do gráfico com a visualização inicial
+    dynamic_content.append(html.Div(
+        id={'type': 'graph-container', 'index': indicador_id},
+        children=initial_visualization
+    ))
 
-        # --- Monta o conteúdo dinâmico final ---
-        dynamic_content = []
-        # Nota: A descrição do indicador já está presente na tab, não precisamos adicioná-la novamente aqui
-        dynamic_content.extend(variable_dropdown_div)
-        if dynamic_filters_div:
-            dynamic_content.append(dbc.Row(dynamic_filters_div))
+    # Retorna conteúdo dinâmico e oculta o spinner
+    return dynamic_content, {'display': 'none'}
 
-        # Adiciona o container do gráfico com a visualização inicial
-        dynamic_content.append(html.Div(
-            id={'type': 'graph-container', 'index': indicador_id},
-            children=initial_visualization
-        ))
 
-        # Retorna conteúdo dinâmico e oculta o spinner
-        return dynamic_content, {'display': 'none'}
+@lru_cache(maxsize=32)
+def get_indicator_content(indicador_id, data_version):
+    """Conteúdo (memoizado) da aba de um indicador para a versão dos dados; ver build_indicator_content."""
+    return build_indicator_content(indicador_id)
 
-    # --- FIM DO BLOCO TRY...EXCEPT ---
-    except Exception as e_load:
-        logging.exception("Erro ao carregar conteúdo para %s", indicador_id)
-        # Retorna apenas o alerta de erro
-        return [dbc.Alert(f"Erro ao carregar dados para {indicador_id}.", color="danger")], {'display': 'none'}
 
+def indicator_content(indicador_id, data_version):
+    """Conteúdo da aba do indicador; requisições simultâneas (e o pré-cálculo) compartilham a geração."""
+    return visualization_flight.do(('conteudo', indicador_id, data_version),
+                                   lambda: get_indicator_content(indicador_id, data_version))
 
-# Callback para atualizar o conteúdo do card principal (metas, indicadores)
-@app.callback(
-    [
-        Output('card-header', 'children'),
-        Output('card-content', 'children'),
-        Output('metas-nav', 'children'),
-        Output('meta-description', 'children'),
-        Output('indicadores-section', 'children')
-    ],
-    [Input(f"objetivo{i}", "n_clicks") for i in range(len(df))] +
-    [Input({'type': 'meta-button', 'index': ALL}, 'n_clicks')],
-    prevent_initial_call=True  # Impede execução inicial
-)
-def update_card_content(*args):
-    ctx = callback_context
-    if not ctx.triggered:
-        raise PreventUpdate
 
-    triggered_id_str = ctx.triggered[0]['prop_id']
-    triggered_value = ctx.triggered[0]['value']
+def prefetch_owner():
+    """Identificador da sessão para a fila de pré-cálculo (criado no primeiro uso)."""
+    if 'prefetch_id' not in session:
+        session['prefetch_id'] = secrets.token_hex(8)
+    return session['prefetch_id']
 
-    # Ignora cliques iniciais ou cliques sem valor (n_clicks=0)
-    if triggered_value is None or triggered_value == 0:
-        raise PreventUpdate
 
-    try:
-        # --- Clique em uma META ---
-        if 'meta-button' in triggered_id_str:
-            # Forma mais robusta de obter o ID usando o contexto
-            if isinstance(ctx.triggered_id, dict):
-                meta_id = ctx.triggered_id.get('index')
-            else:  # Fallback (menos provável de ser necessário agora)
-                try:
-                    meta_id = json.loads(triggered_id_str.split('.')[0])['index']
-                except (json.JSONDecodeError, IndexError, KeyError):
-                    logging.error("Erro ao parsear meta_id de: %s", triggered_id_str)
-                    raise PreventUpdate
-
-            if not meta_id:
-                raise PreventUpdate  # Não conseguiu obter o meta_id
-            logging.debug("Atualizando conteúdo - Clique na Meta ID: %s", meta_id)  # Log de Debug
-
-            meta_filtrada = df_metas[df_metas['ID_META'] == meta_id]
-            if meta_filtrada.empty:
-                return no_update, no_update, no_update, "Meta não encontrada.", []  # Atualiza descrição
-
-            meta_desc = meta_filtrada['DESC_META'].iloc[0]
-            objetivo_id = meta_filtrada['ID_OBJETIVO'].iloc[0]
-
-            # Recria a barra de navegação das metas, marcando a ativa
-            metas_obj_filtradas = df_metas[df_metas['ID_OBJETIVO'] == objetivo_id]
-            metas_com_indicadores = []
-            for _, meta in metas_obj_filtradas.iterrows():
-                indicadores_meta = df_indicadores[df_indicadores['ID_META'] == meta['ID_META']]
-                if not indicadores_meta.empty:
-                    # Verifica se pelo menos um indicador tem dados
-                    for _, row_ind in indicadores_meta.iterrows():
-                        indicador_id = row_ind['ID_INDICADOR']
-                        nome_arquivo = indicador_id.lower().replace("indicador ", "")
-                        arquivo_parquet = f'db/resultados/indicador{nome_arquivo}.parquet'
-                        if os.path.exists(arquivo_parquet):
-                            metas_com_indicadores.append(meta)
-                            break
-
-            if not metas_com_indicadores:
-                # Retorna o alerta na seção de indicadores com estilo
-                alert_message = dbc.Alert(
-                    "Não existem metas com indicadores disponíveis para este objetivo.",
-                    color="warning",
-                    className="mt-4",
-                    style={'textAlign': 'center', 'font-weight': 'bold'}  # Adiciona estilo aqui
-                )
-                return header, content, [], "", [alert_message]  # Limpa descrição da meta, mostra alerta
-
-            # Seleciona a primeira meta e gera a navegação
-            meta_selecionada = metas_com_indicadores[0]
-            metas_nav_children = [
-                dbc.NavLink(
-                    meta['ID_META'],
-                    id={'type': 'meta-button', 'index': meta['ID_META']},
-                    href="#",
-                    active=(meta['ID_META'] == meta_id),
-                    className="nav-link",
-                    n_clicks=0  # Reset n_clicks
-                ) for meta in metas_com_indicadores
-            ]
-
-            # Gera a seção de indicadores para a meta clicada
-            indicadores_meta_selecionada = df_indicadores[df_indicadores['ID_META'] == meta_id]
-            tabs_indicadores = []
-
-            # Comentado para desabilitar pré-carregamento
-            # preload_related_indicators(meta_id, df_indicadores, _load_dados_indicador_original)
-
-            if not indicadores_meta_selecionada.empty:
-                valor_inicial_variavel_primeira_aba = None
-
-                # Filtra apenas indicadores que realmente possuem dados disponíveis
-                indicadores_com_dados = []
-                for _, row_ind in indicadores_meta_selecionada.iterrows():
-                    indicador_id_atual = row_ind['ID_INDICADOR']
-                    # Verifica se o arquivo do indicador existe
-                    nome_arquivo = indicador_id_atual.lower().replace("indicador ", "")
-                    arquivo_parquet = f'db/resultados/indicador{nome_arquivo}.parquet'
-                    if os.path.exists(arquivo_parquet):
-                        indicadores_com_dados.append(row_ind)
-
-                # Se não houver indicadores com dados disponíveis, exibe mensagem
-                if not indicadores_com_dados:
-                    return header, content, metas_nav_children, meta_desc, [
-                        html.H5("Indicadores", className="mt-4 mb-3"),
-                        dbc.Alert("Não há dados disponíveis para os indicadores desta meta.", color="warning",
-                                  className="textCenter p-3 mt-3")
-                    ]
-
-                for i, row_ind in enumerate(indicadores_com_dados):
-                    indicador_id_atual = row_ind['ID_INDICADOR']
-                    is_first_indicator = (i == 0)
-
-                    if is_first_indicator:
-                        # Carrega dados e cria conteúdo COMPLETO apenas para o primeiro indicador
-                        df_dados = load_dados_indicador_cache(indicador_id_atual)
-                        tab_content = []
-                        dynamic_filters_div = []
-                        valor_inicial_variavel = None
-
-                        if df_dados is not None and not df_dados.empty:
-                            try:
-                                # Identifica filtros dinâmicos
-                                filter_cols = identify_filter_columns(df_dados)
-                                initial_dynamic_filters = {}  # Dicionário para guardar filtros iniciais
-
-                                # Prepara os filtros dinâmicos
-                                for idx, filter_col_code in enumerate(filter_cols):
-                                    desc_col_code = 'DESC_' + filter_col_code[5:]
-                                    code_to_desc = {}
-                                    if desc_col_code in df_dados.columns:
-                                        try:
-                                            mapping_df = df_dados[
-                                                [filter_col_code, desc_col_code]].dropna().drop_duplicates()
-                                            code_to_desc = pd.Series(mapping_df[desc_col_code].astype(str).values,
-                                                                     index=mapping_df[filter_col_code].astype(
-                                                                         str)).to_dict()
-                                        except Exception as map_err:
-                                            logging.error("Erro ao mapear código/descrição para filtro %s: %s",
-                                                          filter_col_code, map_err)
-                                            # Adiciona log de erro para mapeamento
-                                            logging.error("Erro ao mapear código/descrição para filtro %s: %s",
-                                                          filter_col_code, map_err)
-                                    unique_codes = sorted(df_dados[filter_col_code].dropna().astype(str).unique())
-                                    col_options = [{'label': str(code_to_desc.get(code, code)), 'value': code} for code
-                                                   in unique_codes]
-                                    filter_label = constants.COLUMN_NAMES.get(filter_col_code, filter_col_code)
-                                    md_width = 7 if idx % 2 == 0 else 5
-                                    # Define o valor inicial e armazena
-                                    initial_value = unique_codes[0] if unique_codes else None
-                                    if initial_value is not None:
-                                        initial_dynamic_filters[filter_col_code] = initial_value
-
-                                    dynamic_filters_div.append(dbc.Col([
-                                        html.Label(f"{filter_label}:", style={'fontWeight': 'bold', 'display': 'block',
-                                                                              'marginBottom': '5px'}),
-                                        dcc.Dropdown(
-                                            id={'type': 'dynamic-filter-dropdown', 'index': indicador_id_atual,
-                                                'filter_col': filter_col_code},
-                                            options=col_options,
-                                            value=initial_value,  # Usa o valor inicial definido
-                                            style={'marginBottom': '10px', 'width': '100%'}
-                                        )
-                                    ], md=md_width, xs=12))
-
-                                # Dropdown de variável principal
-                                indicador_info = df_indicadores[df_indicadores['ID_INDICADOR'] == indicador_id_atual]
-                                has_variable_dropdown = not indicador_info.empty and 'VARIAVEIS' in indicador_info.columns and \
-                                                        indicador_info['VARIAVEIS'].iloc[0] == '1'
-                                variable_dropdown_div = []
-                                if has_variable_dropdown:
-                                    df_variavel_loaded = load_variavel()
-                                    if 'CODG_VAR' in df_dados.columns:
-                                        variaveis_indicador = df_dados['CODG_VAR'].astype(str).unique()
-                                        if not df_variavel_loaded.empty:
-                                            df_variavel_filtrado = df_variavel_loaded[
-                                                df_variavel_loaded['CODG_VAR'].astype(str).isin(variaveis_indicador)]
-                                            if not df_variavel_filtrado.empty:
-                                                # Usar o primeiro valor disponível no dropdown
-                                                valor_inicial_variavel = df_variavel_filtrado['CODG_VAR'].iloc[0]
-                                                valor_inicial_variavel_primeira_aba = valor_inicial_variavel  # Salva para o Store
-                                                variable_dropdown_div = [html.Div([
-                                                    html.Label("Selecione uma Variável:",
-                                                               style={'fontWeight': 'bold', 'display': 'block',
-                                                                      'marginBottom': '5px'},
-                                                               id={'type': 'var-label', 'index': indicador_id_atual}),
-                                                    dcc.Dropdown(
-                                                        id={'type': 'var-dropdown', 'index': indicador_id_atual},
-                                                        options=[{'label': row['DESC_VAR'], 'value': row['CODG_VAR']}
-                                                                 for _, row in df_variavel_filtrado.iterrows()],
-                                                        value=valor_inicial_variavel,
-                                                        style={'width': '100%', 'marginBottom': '15px'}
-                                                    )
-                                                ])]
-                                            else: # df_variavel_filtrado está vazio
-                                                variable_dropdown_div = [html.Div([dcc.Dropdown(id={'type': 'var-dropdown', 'index': indicador_id_atual}, options=[], value=None, style={'display': 'none'}, disabled=True)], style={'display': 'none'})]
-                                        else: # df_variavel_loaded está vazio
-                                            variable_dropdown_div = [html.Div([dcc.Dropdown(id={'type': 'var-dropdown', 'index': indicador_id_atual}, options=[], value=None, style={'display': 'none'}, disabled=True)], style={'display': 'none'})]
-                                    else: # 'CODG_VAR' não está em df_dados
-                                        variable_dropdown_div = [html.Div([dcc.Dropdown(id={'type': 'var-dropdown', 'index': indicador_id_atual}, options=[], value=None, style={'display': 'none'}, disabled=True)], style={'display': 'none'})]
-                                else: # has_variable_dropdown é False
-                                    variable_dropdown_div = [html.Div([dcc.Dropdown(id={'type': 'var-dropdown', 'index': indicador_id_atual}, options=[], value=None, style={'display': 'none'}, disabled=True)], style={'display': 'none'})]
-
-                                # Cria a visualização inicial PASSANDO OS FILTROS INICIAIS
-                                initial_visualization = create_visualization(
-                                    df_dados, indicador_id_atual, valor_inicial_variavel, initial_dynamic_filters
-                                )
-                                tab_content = [html.P(row_ind['DESC_INDICADOR'], className="textJustify p-3",
-                                                      style={'marginBottom': '10px'})]
-                                tab_content.extend(variable_dropdown_div)
-                                if dynamic_filters_div:
-                                    tab_content.append(dbc.Row(dynamic_filters_div))
-                                tab_content.append(html.Div(id={'type': 'graph-container', 'index': indicador_id_atual},
-                                                            children=initial_visualization))
-                            except Exception as e_inner:
-                                logging.exception("Erro interno ao gerar conteúdo da aba %s", indicador_id_atual)
-                                tab_content = [
-                                    dbc.Alert(f"Erro ao gerar conteúdo para {indicador_id_atual}.", color="danger")]
-                                # Usamos logging.exception aqui
-                                logging.exception("Erro interno ao gerar conteúdo da aba %s", indicador_id_atual)
-                        else:
-                            tab_content = [
-                                dbc.Alert(f"Dados não disponíveis para {indicador_id_atual}.", color="warning")]
-                    else:
-                        # Para os demais indicadores, cria apenas placeholder (lazy loading)
-                        tab_content = [
-                            html.Div([
-                                html.P(row_ind['DESC_INDICADOR'], className="textJustify",
-                                       style={'display': 'inline-block', 'marginRight': '10px'}),
-                                dbc.Spinner(color="primary", size="sm", type="grow",
-                                            spinner_style={'display': 'inline-block'},
-                                            id={'type': 'spinner-indicator', 'index': indicador_id_atual})
-                            ], className="p-3"),
-                            html.Div(id={'type': 'lazy-load-container', 'index': indicador_id_atual},
-                                     style={'minHeight': '50px'})
-                        ]
-
-                    # Adiciona Store para CADA aba (carregada ou não)
-                    # Para a primeira aba, usa o valor_inicial_variavel encontrado
-                    # Para as outras, o valor inicial da variável será None até serem carregadas
-                    # --- MODIFICADO: Inclui initial_dynamic_filters no Store ---
-                    initial_filters_for_store = {}
-                    if is_first_indicator:
-                        initial_filters_for_store = initial_dynamic_filters  # Usa os filtros coletados
-                    
-                    store_data = {
-                        'selected_var': valor_inicial_variavel_primeira_aba if is_first_indicator else None,
-                        'selected_filters': initial_filters_for_store 
-                    }
-                    tab_content.append(dcc.Store(id={'type': 'visualization-state-store', 'index': indicador_id_atual},
-                                                 data=store_data))
-
-                    # Adiciona a aba
-                    tabs_indicadores.append(
-                        dbc.Tab(tab_content, label=indicador_id_atual, tab_id=f"tab-{indicador_id_atual}",
-                                id={'type': 'tab-indicador', 'index': indicador_id_atual}))
-
-            # Define a primeira aba como ativa
-            first_tab_id = tabs_indicadores[0].tab_id if tabs_indicadores else None
-
-            # Monta a seção de indicadores
-            indicadores_section = [
-                html.H5("Indicadores", className="mt-4 mb-3"),
-                dbc.Card(dbc.CardBody(
-                    dbc.Tabs(id='tabs-indicadores', children=tabs_indicadores, active_tab=first_tab_id)
-                ), className="mt-3")
-            ] if tabs_indicadores else []  # Só mostra seção se houver indicadores
-
-            # Retorna SEM no_update para header/content para permitir voltar ao desc do objetivo se necessário
-            objetivo_row = df[df['ID_OBJETIVO'] == objetivo_id].iloc[0]
-            header_obj = f"{objetivo_row['ID_OBJETIVO']} - {objetivo_row['RES_OBJETIVO']}"
-            content_obj = objetivo_row['DESC_OBJETIVO']
-            return header_obj, content_obj, metas_nav_children, meta_desc, indicadores_section
-
-        # --- Clique em um OBJETIVO ---
-        elif 'objetivo' in triggered_id_str:
-            index = int(triggered_id_str.replace('objetivo', '').split('.')[0])
-            if index >= len(df):
-                return "Erro", "Objetivo não encontrado.", [], "", []
-            row_obj = df.iloc[index]
-            logging.debug("Atualizando conteúdo - Clique no Objetivo ID: %s (Index: %d)", row_obj['ID_OBJETIVO'],
-                          index)  # Log de Debug
-            header = f"{row_obj['ID_OBJETIVO']} - {row_obj['RES_OBJETIVO']}" if index > 0 else row_obj['RES_OBJETIVO']
-            
-            # Usa o texto personalizado para o objetivo 0, caso contrário usa o texto do CSV
-            if index == 0:
-                content = html.Div([
-                    html.P("Os Objetivos de Desenvolvimento Sustentável (ODS) constituem um compromisso global voltado à erradicação da pobreza, à proteção do meio ambiente e do clima, bem como à promoção da paz e da prosperidade para todas as pessoas, em todos os lugares. No Brasil, as Nações Unidas atuam de forma articulada com instituições públicas e privadas, além da sociedade civil, para viabilizar o cumprimento da Agenda 2030 e assegurar um desenvolvimento inclusivo, equitativo e sustentável."),
-                    html.P("Nesse contexto, o Instituto Mauro Borges desenvolveu, para os estados que compõem a Região Brasil Central — Distrito Federal, Goiás, Maranhão, Mato Grosso, Mato Grosso do Sul, Rondônia e Tocantins —, um painel de monitoramento dos ODS. A ferramenta possibilita o acompanhamento da evolução tanto dos objetivos quanto de suas respectivas metas. É importante destacar que, para alguns objetivos e metas, ainda não há disponibilidade de dados que permitam a construção dos indicadores correspondentes. Diante disso, buscou-se maximizar a utilização das bases de dados existentes, de modo a produzir o maior número possível de indicadores com qualidade e consistência.")
-                ])
-            else:
-                content = row_obj['DESC_OBJETIVO']
-
-            # Se for objetivo 0, limpa metas e indicadores
-            if index == 0:
-                return header, content, [], "", []
-
-            # Encontra metas com indicadores para este objetivo
-            metas_obj_filtradas = df_metas[df_metas['ID_OBJETIVO'] == row_obj['ID_OBJETIVO']]
-            metas_com_indicadores = []
-            for _, meta in metas_obj_filtradas.iterrows():
-                indicadores_meta = df_indicadores[df_indicadores['ID_META'] == meta['ID_META']]
-                if not indicadores_meta.empty:
-                    # Verifica se pelo menos um indicador tem dados
-                    for _, row_ind in indicadores_meta.iterrows():
-                        indicador_id = row_ind['ID_INDICADOR']
-                        nome_arquivo = indicador_id.lower().replace("indicador ", "")
-                        arquivo_parquet = f'db/resultados/indicador{nome_arquivo}.parquet'
-                        if os.path.exists(arquivo_parquet):
-                            metas_com_indicadores.append(meta)
-                            break
-
-            if not metas_com_indicadores:
-                # Retorna o alerta na seção de indicadores com estilo
-                alert_message = dbc.Alert(
-                    "Não existem metas com indicadores disponíveis para este objetivo.",
-                    color="warning",
-                    className="mt-4",
-                    style={'textAlign': 'center', 'font-weight': 'bold'}  # Adiciona estilo aqui
-                )
-                return header, content, [], "", [alert_message]  # Limpa descrição da meta, mostra alerta
-
-            # Seleciona a primeira meta e gera a navegação
-            meta_selecionada = metas_com_indicadores[0]
-            metas_nav_children = [
-                dbc.NavLink(
-                    meta['ID_META'],
-                    id={'type': 'meta-button', 'index': meta['ID_META']},
-                    href="#",
-                    active=(meta['ID_META'] == meta_selecionada['ID_META']),
-                    className="nav-link",
-                    n_clicks=0  # Reset n_clicks
-                ) for meta in metas_com_indicadores
-            ]
-            meta_description = meta_selecionada['DESC_META']
-
-            # Gera a seção de indicadores para a primeira meta
-            meta_id = meta_selecionada['ID_META']
-            indicadores_primeira_meta = df_indicadores[df_indicadores['ID_META'] == meta_id]
-            tabs_indicadores = []
-
-            # Comentado para desabilitar pré-carregamento
-            # preload_related_indicators(meta_id, df_indicadores, _load_dados_indicador_original)
-
-            if not indicadores_primeira_meta.empty:
-                # Variável para armazenar o valor inicial da variável (usado apenas para o primeiro indicador)
-                valor_inicial_variavel = None
-                initial_dynamic_filters = {}  # Dicionário para guardar filtros iniciais para clique em objetivo
-
-                # Filtra apenas indicadores que realmente possuem dados disponíveis
-                indicadores_com_dados = []
-                for _, row_ind in indicadores_primeira_meta.iterrows():
-                    indicador_id_atual = row_ind['ID_INDICADOR']
-                    # Verifica se o arquivo do indicador existe
-                    nome_arquivo = indicador_id_atual.lower().replace("indicador ", "")
-                    arquivo_parquet = f'db/resultados/indicador{nome_arquivo}.parquet'
-                    if os.path.exists(arquivo_parquet):
-                        indicadores_com_dados.append(row_ind)
-
-                # Se não houver indicadores com dados disponíveis, exibe mensagem
-                if not indicadores_com_dados:
-                    return header, content, metas_nav_children, meta_description, [
-                        html.H5("Indicadores", className="mt-4 mb-3"),
-                        dbc.Alert("Não há dados disponíveis para os indicadores desta meta.", color="warning",
-                                  className="textCenter p-3 mt-3")
-                    ]
-
-                # Cria abas para todos os indicadores da primeira meta
-                for i, row_ind in enumerate(indicadores_com_dados):
-                    # Apenas o primeiro indicador é carregado completamente
-                    is_first_indicator = (i == 0)
-
-                    if is_first_indicator:
-                        # Carrega dados apenas para o primeiro indicador
-                        df_dados = load_dados_indicador_cache(row_ind['ID_INDICADOR'])
-                        tab_content = []
-                        dynamic_filters_div = []
-                        valor_inicial_variavel = None
-                        initial_dynamic_filters = {}  # Reseta para este indicador
-
-                        if df_dados is not None and not df_dados.empty:
-                            try:
-                                # Identifica filtros dinâmicos
-                                filter_cols = identify_filter_columns(df_dados)
-                                initial_dynamic_filters = {}  # Dicionário para filtros iniciais
-
-                                # Prepara os filtros dinâmicos
-                                for idx, filter_col_code in enumerate(filter_cols):
-                                    desc_col_code = 'DESC_' + filter_col_code[5:]
-                                    code_to_desc = {}
-                                    if desc_col_code in df_dados.columns:
-                                        try:
-                                            mapping_df = df_dados[
-                                                [filter_col_code, desc_col_code]].dropna().drop_duplicates()
-                                            code_to_desc = pd.Series(mapping_df[desc_col_code].astype(str).values,
-                                                                     index=mapping_df[filter_col_code].astype(
-                                                                         str)).to_dict()
-                                        except Exception as map_err:
-                                            logging.error("Erro ao mapear código/descrição para filtro %s: %s",
-                                                          filter_col_code, map_err)
-                                            # Adiciona log de erro para mapeamento
-                                            logging.error("Erro ao mapear código/descrição para filtro %s: %s",
-                                                          filter_col_code, map_err)
-                                    unique_codes = sorted(df_dados[filter_col_code].dropna().astype(str).unique())
-                                    col_options = [{'label': str(code_to_desc.get(code, code)), 'value': code} for code
-                                                   in unique_codes]
-                                    filter_label = constants.COLUMN_NAMES.get(filter_col_code, filter_col_code)
-
-                                    # Define larguras alternadas para os filtros
-                                    md_width = 7 if idx % 2 == 0 else 5
-                                    # Define o valor inicial e armazena
-                                    initial_value = unique_codes[0] if unique_codes else None
-                                    if initial_value is not None:
-                                        initial_dynamic_filters[filter_col_code] = initial_value
-
-                                    dynamic_filters_div.append(
-                                        dbc.Col([
-                                            html.Label(f"{filter_label}:",
-                                                       style={'fontWeight': 'bold', 'display': 'block',
-                                                              'marginBottom': '5px'}),
-                                            dcc.Dropdown(
-                                                id={'type': 'dynamic-filter-dropdown', 'index': row_ind['ID_INDICADOR'],
-                                                    'filter_col': filter_col_code},
-                                                options=col_options,
-                                                value=initial_value,  # Usa o valor inicial definido
-                                                style={'marginBottom': '10px', 'width': '100%'}
-                                            )
-                                        ], md=md_width, xs=12)
-                                    )
-
-                                # Dropdown de variável principal
-                                indicador_info = df_indicadores[
-                                    df_indicadores['ID_INDICADOR'] == row_ind['ID_INDICADOR']]
-                                has_variable_dropdown = not indicador_info.empty and 'VARIAVEIS' in indicador_info.columns and \
-                                                        indicador_info['VARIAVEIS'].iloc[0] == '1'
-                                variable_dropdown_div = []
-                                if has_variable_dropdown:
-                                    df_variavel_loaded = load_variavel()
-                                    if 'CODG_VAR' in df_dados.columns:
-                                        variaveis_indicador = df_dados['CODG_VAR'].astype(str).unique()
-                                        if not df_variavel_loaded.empty:
-                                            df_variavel_filtrado = df_variavel_loaded[
-                                                df_variavel_loaded['CODG_VAR'].astype(str).isin(variaveis_indicador)]
-                                            if not df_variavel_filtrado.empty:
-                                                # Usar o primeiro valor disponível no dropdown
-                                                valor_inicial_variavel = df_variavel_filtrado['CODG_VAR'].iloc[0]
-                                                variable_dropdown_div = [html.Div([
-                                                    html.Label("Selecione uma Variável:",
-                                                               style={'fontWeight': 'bold', 'display': 'block',
-                                                                      'marginBottom': '5px'},
-                                                               id={'type': 'var-label',
-                                                                   'index': row_ind['ID_INDICADOR']}),
-                                                    dcc.Dropdown(
-                                                        id={'type': 'var-dropdown', 'index': row_ind['ID_INDICADOR']},
-                                                        options=[{'label': row['DESC_VAR'], 'value': row['CODG_VAR']}
-                                                                 for _, row in df_variavel_filtrado.iterrows()],
-                                                        value=valor_inicial_variavel,
-                                                        style={'width': '100%', 'marginBottom': '15px'}
-                                                    )
-                                                ])]
-                                            else: # df_variavel_filtrado está vazio
-                                                variable_dropdown_div = [html.Div([dcc.Dropdown(id={'type': 'var-dropdown', 'index': row_ind['ID_INDICADOR']}, options=[], value=None, style={'display': 'none'}, disabled=True)], style={'display': 'none'})]
-                                        else: # df_variavel_loaded está vazio
-                                            variable_dropdown_div = [html.Div([dcc.Dropdown(id={'type': 'var-dropdown', 'index': row_ind['ID_INDICADOR']}, options=[], value=None, style={'display': 'none'}, disabled=True)], style={'display': 'none'})]
-                                    else: # 'CODG_VAR' não está em df_dados
-                                        variable_dropdown_div = [html.Div([dcc.Dropdown(id={'type': 'var-dropdown', 'index': row_ind['ID_INDICADOR']}, options=[], value=None, style={'display': 'none'}, disabled=True)], style={'display': 'none'})]
-                                else: # has_variable_dropdown é False
-                                    variable_dropdown_div = [html.Div([dcc.Dropdown(id={'type': 'var-dropdown', 'index': row_ind['ID_INDICADOR']}, options=[], value=None, style={'display': 'none'}, disabled=True)], style={'display': 'none'})]
-
-                                # Cria a visualização inicial PASSANDO OS FILTROS INICIAIS
-                                initial_visualization = create_visualization(
-                                    df_dados, row_ind['ID_INDICADOR'], valor_inicial_variavel, initial_dynamic_filters
-                                )
-                                tab_content = [html.P(row_ind['DESC_INDICADOR'], className="textJustify p-3",
-                                                      style={'marginBottom': '10px'})]
-                                tab_content.extend(variable_dropdown_div)
-                                if dynamic_filters_div:
-                                    tab_content.append(dbc.Row(dynamic_filters_div))
-                                tab_content.append(
-                                    html.Div(id={'type': 'graph-container', 'index': row_ind['ID_INDICADOR']},
-                                             children=initial_visualization))
-
-                            except Exception as e_inner:
-                                logging.exception("Erro interno ao gerar conteúdo da aba %s (clique objetivo)",
-                                                  row_ind['ID_INDICADOR'])
-                                tab_content = [dbc.Alert(f"Erro ao gerar conteúdo para {row_ind['ID_INDICADOR']}.",
-                                                         color="danger")]
-                                logging.exception("Erro interno ao gerar conteúdo da aba %s (clique objetivo)",
-                                                  row_ind['ID_INDICADOR'])
-                        else:
-                            tab_content = [
-                                dbc.Alert(f"Dados não disponíveis para {row_ind['ID_INDICADOR']}.", color="warning")]
-                    else:
-                        # Para os demais indicadores, cria apenas um placeholder que será carregado sob demanda
-                        tab_content = [
-                            # Coloca o spinner ao lado do título para economizar espaço
-                            html.Div([
-                                html.P(row_ind['DESC_INDICADOR'], className="textJustify",
-                                       style={'display': 'inline-block', 'marginRight': '10px'}),
-                                dbc.Spinner(color="primary", size="sm", type="grow",
-                                            spinner_style={'display': 'inline-block'},
-                                            id={'type': 'spinner-indicator', 'index': row_ind['ID_INDICADOR']})
-                            ], className="p-3"),
-                            # Div oculta que será substituída pelo conteúdo quando carregado
-                            html.Div(id={'type': 'lazy-load-container', 'index': row_ind['ID_INDICADOR']},
-                                     style={'minHeight': '50px'})
-                        ]
-
-                    # Adiciona Store para esta aba
-                    # Para o primeiro indicador (is_first_indicator = True), valor_inicial_variavel e 
-                    # initial_dynamic_filters já foram calculados.
-                    # Para os outros (lazy-loaded), o store é inicializado com None/vazio,
-                    # e a callback load_indicator_on_demand preencherá os valores corretos.
-                    current_indicador_store_data = {
-                        'selected_var': valor_inicial_variavel if is_first_indicator else None,
-                        'selected_filters': initial_dynamic_filters if is_first_indicator else {} # Garante um dict vazio
-                    }
-                    tab_content.append(
-                        dcc.Store(id={'type': 'visualization-state-store', 'index': row_ind['ID_INDICADOR']},
-                                  data=current_indicador_store_data)
-                    )
+def prefetch_sibling_tabs(meta_id, data_version, exclude=None):
+    """
+    Agenda o pré-cálculo da visualização padrão das abas da meta que ainda não foram abertas.
 
-                    # Adiciona a aba ao conjunto de abas
-                    tabs_indicadores.append(dbc.Tab(tab_content,
-                                                    label=row_ind['ID_INDICADOR'],
-                                                    tab_id=f"tab-{row_ind['ID_INDICADOR']}",
-                                                    id={'type': 'tab-indicador', 'index': row_ind['ID_INDICADOR']}))
+    O lote começa depois que a resposta atual é enviada e substitui o lote pendente da mesma
+    sessão, de modo que navegar para outra meta cancela o que ainda não começou. Não faz nada
+    se TAB_PREFETCH estiver desligado.
 
-            # Adiciona um trigger para carregar o primeiro indicador automaticamente
-            first_tab_id = tabs_indicadores[0].tab_id if tabs_indicadores else None
+    Args:
+        meta_id: ID da meta
+        data_version: Versão dos dados (chave do cache de visualizações)
+        exclude: ID do indicador já carregado
+    """
+    if not TAB_PREFETCH:
+        return
+    meta = get_navigation_tree(data_version).metas.get(meta_id)
+    if meta is None:
+        return
+    owner = prefetch_owner()
+    # Cancela já o lote anterior da sessão, sem esperar a resposta atual
+    prefetch_queue.cancel(owner)
+    tasks = [
+        (indicador['ID_INDICADOR'], partial(indicator_content, indicador['ID_INDICADOR'], data_version))
+        for indicador in meta['indicadores'][1:] if indicador['ID_INDICADOR'] != exclude
+    ]
 
-            indicadores_section = [
-                html.H5("Indicadores", className="mt-4 mb-3"),
-                dbc.Card(dbc.CardBody(
-                    dbc.Tabs(id='tabs-indicadores', children=tabs_indicadores, active_tab=first_tab_id)
-                ), className="mt-3")
-            ] if tabs_indicadores else []
+    @after_this_request
+    def agendar_apos_resposta(response):
+        response.call_on_close(lambda: prefetch_queue.submit(owner, tasks))
+        return response
 
-            return header, content, metas_nav_children, meta_description, indicadores_section
-        else:
-            # Caso ID não seja nem meta nem objetivo (não deve acontecer)
-            raise PreventUpdate
+
+def cancel_prefetch():
+    """Cancela o pré-cálculo pendente da sessão (navegação para fora da meta)."""
+    if TAB_PREFETCH and 'prefetch_id' in session:
+        prefetch_queue.cancel(session['prefetch_id'])
+
+
+@lru_cache(maxsize=1)
+def get_navigation_tree(data_version):
+    """Árvore de navegação (objetivo → meta → indicador) compilada para a versão atual dos dados."""
+    return NavigationTree(df, df_metas, df_indicadores, intro_content=initial_content)
+
+
+# Compila a navegação na inicialização (recompilada apenas quando a versão dos dados muda)
+get_navigation_tree(get_data_version())
+
+
+def warm_up():
+    """
+    Em segundo plano: pré-renderiza o layout (o primeiro acesso já é servido da memória) e carrega
+    os dados do primeiro indicador de cada meta (os exibidos ao abrir uma meta), até
+    WARMUP_MAX_INDICATORS; conclui as etapas 'layout' e 'aquecimento' do /readyz ao terminar.
+
+    Só envia as etapas pendentes: no worker (post_fork), refaz o que o master não concluiu a tempo.
+    """
+    pendentes = readiness.pending()
+    # A compressão do layout libera o GIL e corre junto com o restante da importação do app
+    if 'layout' in pendentes:
+        readiness.track('layout', submit_preload(layout_response.render))
+    if 'aquecimento' not in pendentes:
+        return
+    primeiros = [meta['indicadores'][0]['ID_INDICADOR']
+                 for meta in get_navigation_tree(get_data_version()).metas.values()]
+    primeiros = primeiros[:max(WARMUP_MAX_INDICATORS, 0)]
+    if not primeiros:
+        readiness.mark('aquecimento', indicators=0)
+        return
+    # Pelo cache de dois níveis: o que já está em disco (outro worker) sobe para a memória
+    future = submit_preload(lambda: [load_dados_indicador_cache(i) for i in primeiros])
+    logging.info("Aquecimento iniciado para %d indicadores", len(primeiros))
+    readiness.track('aquecimento', future, indicators=len(primeiros))
+
+
+warm_up()
+
+
+def build_first_indicator_tab(indicador):
+    """
+    Monta a aba do primeiro indicador da meta, já carregada (filtros, variável e visualização inicial).
+
+    Args:
+        indicador: Registro do indicador na árvore de navegação (ID_INDICADOR, DESC_INDICADOR, VARIAVEIS)
+
+    Returns:
+        dbc.Tab com o conteúdo e o store da seleção inicial
+    """
+    indicador_id = indicador['ID_INDICADOR']
+    df_dados = load_dados_indicador_cache(indicador_id)
+    tab_content = []
+    dynamic_filters_div = []
+    valor_inicial_variavel = None
+    initial_dynamic_filters = {}  # Dicionário para guardar filtros iniciais
+
+    if df_dados is not None and not df_dados.empty:
+        try:
+            # Identifica filtros dinâmicos
+            filter_cols = identify_filter_columns(df_dados)
+
+            # Prepara os filtros dinâmicos
+            for idx, filter_col_code in enumerate(filter_cols):
+                desc_col_code = 'DESC_' + filter_col_code[5:]
+                code_to_desc = {}
+                if desc_col_code in df_dados.columns:
+                    try:
+                        mapping_df = df_dados[[filter_col_code, desc_col_code]].dropna().drop_duplicates()
+                        code_to_desc = pd.Series(mapping_df[desc_col_code].astype(str).values,
+                                                 index=mapping_df[filter_col_code].astype(str)).to_dict()
+                    except Exception as map_err:
+                        logging.error("Erro ao mapear código/descrição para filtro %s: %s",
+                                      filter_col_code, map_err)
+                unique_codes = sorted(df_dados[filter_col_code].dropna().astype(str).unique())
+                col_options = [{'label': str(code_to_desc.get(code, code)), 'value': code} for code in unique_codes]
+                filter_label = constants.COLUMN_NAMES.get(filter_col_code, filter_col_code)
+
+                # Define larguras alternadas para os filtros
+                md_width = 7 if idx % 2 == 0 else 5
+                # Define o valor inicial e armazena
+                initial_value = unique_codes[0] if unique_codes else None
+                if initial_value is not None:
+                    initial_dynamic_filters[filter_col_code] = initial_value
+
+                dynamic_filters_div.append(dbc.Col([
+                    html.Label(f"{filter_label}:", style={'fontWeight': 'bold', 'display': 'block',
+                                                          'marginBottom': '5px'}),
+                    dcc.Dropdown(
+                        id={'type': 'dynamic-filter-dropdown', 'index': indicador_id, 'filter_col': filter_col_code},
+                        options=col_options,
+                        value=initial_value,  # Usa o valor inicial definido
+                        style={'marginBottom': '10px', 'width': '100%'}
+                    )
+                ], md=md_width, xs=12))
+
+            # Dropdown de variável principal (oculto quando o indicador não tem variáveis)
+            variable_dropdown_div = [html.Div([dcc.Dropdown(
+                id={'type': 'var-dropdown', 'index': indicador_id}, options=[], value=None,
+                style={'display': 'none'}, disabled=True
+            )], style={'display': 'none'})]
+            if indicador.get('VARIAVEIS') == '1' and 'CODG_VAR' in df_dados.columns:
+                df_variavel_loaded = load_variavel()
+                if not df_variavel_loaded.empty:
+                    variaveis_indicador = df_dados['CODG_VAR'].astype(str).unique()
+                    df_variavel_filtrado = df_variavel_loaded[df_variavel_loaded['CODG_VAR'].isin(variaveis_indicador)]
+                    if not df_variavel_filtrado.empty:
+                        # Usar o primeiro valor disponível no dropdown
+                        valor_inicial_variavel = df_variavel_filtrado['CODG_VAR'].iloc[0]
+                        variable_dropdown_div = [html.Div([
+                            html.Label("Selecione uma Variável:",
+                                       style={'fontWeight': 'bold', 'display': 'block', 'marginBottom': '5px'},
+                                       id={'type': 'var-label', 'index': indicador_id}),
+                            dcc.Dropdown(
+                                id={'type': 'var-dropdown', 'index': indicador_id},
+                                options=[{'label': desc, 'value': cod} for cod, desc in zip(
+                                    df_variavel_filtrado['CODG_VAR'], df_variavel_filtrado['DESC_VAR'])],
+                                value=valor_inicial_variavel,
+                                style={'width': '100%', 'marginBottom': '15px'}
+                            )
+                        ])]
+
+            # Cria a visualização inicial PASSANDO OS FILTROS INICIAIS
+            initial_visualization = create_visualization(
+                df_dados, indicador_id, valor_inicial_variavel, initial_dynamic_filters
+            )
+            tab_content = [html.P(indicador['DESC_INDICADOR'], className="textJustify p-3",
+                                  style={'marginBottom': '10px'})]
+            tab_content.extend(variable_dropdown_div)
+            if dynamic_filters_div:
+                tab_content.append(dbc.Row(dynamic_filters_div))
+            tab_content.append(html.Div(id={'type': 'graph-container', 'index': indicador_id},
+                                        children=initial_visualization))
+        except Exception:
+            logging.exception("Erro interno ao gerar conteúdo da aba %s", indicador_id)
+            tab_content = [dbc.Alert(f"Erro ao gerar conteúdo para {indicador_id}.", color="danger")]
+    else:
+        tab_content = [dbc.Alert(f"Dados não disponíveis para {indicador_id}.", color="warning")]
+
+    # Store com a seleção inicial usada pelos callbacks de filtros e visualização
+    tab_content.append(dcc.Store(
+        id={'type': 'visualization-state-store', 'index': indicador_id},
+        data={'selected_var': valor_inicial_variavel, 'selected_filters': initial_dynamic_filters}
+    ))
+    return dbc.Tab(tab_content, label=indicador_id, tab_id=f"tab-{indicador_id}",
+                   id={'type': 'tab-indicador', 'index': indicador_id})
+
+
+def build_indicadores_section(meta):
+    """Seção de indicadores de uma meta: primeira aba carregada e as demais sob demanda."""
+    tabs_indicadores = [build_first_indicator_tab(meta['indicadores'][0])] + meta['lazy_tabs']
+    return [
+        html.H5("Indicadores", className="mt-4 mb-3"),
+        dbc.Card(dbc.CardBody(
+            dbc.Tabs(id='tabs-indicadores', children=tabs_indicadores, active_tab=tabs_indicadores[0].tab_id)
+        ), className="mt-3")
+    ]
+
+
+@lru_cache(maxsize=64)
+def render_meta_section(meta_id, data_version):
+    """
+    Renderiza (memoizado) a navegação de metas, a descrição e a seção de indicadores de uma meta.
+
+    Usado tanto no clique no objetivo (primeira meta) quanto no clique na meta; o resultado é
+    compartilhado entre usuários e sessões enquanto a versão dos dados não mudar.
+
+    Args:
+        meta_id: ID da meta
+        data_version: Versão dos dados (get_data_version), parte da chave do cache
+
+    Returns:
+        Tupla (objetivo, barra de metas, descrição da meta, seção de indicadores) ou None se a
+        meta não tiver indicadores com dados
+    """
+    tree = get_navigation_tree(data_version)
+    meta = tree.metas.get(meta_id)
+    if meta is None:
+        return None
+    objetivo = tree.objetivos_por_id[meta['objetivo_id']]
+    return objetivo, meta['nav'], meta['desc'], build_indicadores_section(meta)
+
+
+def meta_section(meta_id, data_version):
+    """Seção da meta (ver render_meta_section); cliques simultâneos na mesma meta compartilham a renderização."""
+    return visualization_flight.do(('meta', meta_id, data_version),
+                                   lambda: render_meta_section(meta_id, data_version))
+
+
+# Cliques nos objetivos e nas metas: o navegador identifica o botão clicado e envia ao
+# servidor apenas o seu índice (o payload não cresce com a quantidade de botões)
+app.clientside_callback(
+    ClientsideFunction(namespace='ods', function_name='botaoClicado'),
+    Output('objetivo-selecionado', 'data'),
+    Input({'type': 'objetivo-button', 'index': ALL}, 'n_clicks'),
+    prevent_initial_call=True
+)
+app.clientside_callback(
+    ClientsideFunction(namespace='ods', function_name='botaoClicado'),
+    Output('meta-selecionada', 'data'),
+    Input({'type': 'meta-button', 'index': ALL}, 'n_clicks'),
+    prevent_initial_call=True
+)
+
+
+# Callback para atualizar o conteúdo do card principal ao clicar em um objetivo
+@app.callback(
+    [
+        Output('card-header', 'children'),
+        Output('card-content', 'children'),
+        Output('metas-nav', 'children'),
+        Output('meta-description', 'children'),
+        Output('indicadores-section', 'children')
+    ],
+    Input('objetivo-selecionado', 'data'),
+    prevent_initial_call=True  # Impede execução inicial
+)
+def update_objetivo_content(selecao):
+    if not selecao or selecao.get('index') is None:
+        raise PreventUpdate
+
+    try:
+        # Estrutura pré-compilada: o clique só seleciona e marca o elemento ativo
+        data_version = get_data_version()
+        tree = get_navigation_tree(data_version)
+        index = int(selecao['index'])
+        if index >= len(tree.objetivos):
+            return "Erro", "Objetivo não encontrado.", [], "", []
+        objetivo = tree.objetivos[index]
+        logging.debug("Atualizando conteúdo - Clique no Objetivo ID: %s (Index: %d)", objetivo['id'],
+                      index)  # Log de Debug
+
+        # Se for objetivo 0, limpa metas e indicadores
+        if index == 0:
+            cancel_prefetch()
+            return objetivo['header'], objetivo['content'], [], "", []
+
+        if not objetivo['meta_ids']:
+            cancel_prefetch()
+            # Retorna o alerta na seção de indicadores com estilo
+            alert_message = dbc.Alert(
+                "Não existem metas com indicadores disponíveis para este objetivo.",
+                color="warning",
+                className="mt-4",
+                style={'textAlign': 'center', 'font-weight': 'bold'}  # Adiciona estilo aqui
+            )
+            # Limpa descrição da meta, mostra alerta
+            return objetivo['header'], objetivo['content'], [], "", [alert_message]
+
+        # Seleciona a primeira meta do objetivo
+        _, metas_nav, meta_desc, indicadores_section = meta_section(objetivo['meta_ids'][0], data_version)
+        prefetch_sibling_tabs(objetivo['meta_ids'][0], data_version)
+        return objetivo['header'], objetivo['content'], metas_nav, meta_desc, indicadores_section
 
     except Exception as e:
-        logging.exception("Erro geral em update_card_content:")
+        logging.exception("Erro geral em update_objetivo_content:")
         # Retorna um estado seguro em caso de erro inesperado
         return initial_header, initial_content, [], "Ocorreu um erro.", []
 
 
-# --- Novas Callbacks para Atualizar o Store ---
-# Callback para atualizar o store quando a VARIÁVEL PRINCIPAL muda
+# Callback para atualizar o conteúdo do card principal ao clicar em uma meta
 @app.callback(
-    Output({'type': 'visualization-state-store', 'index': MATCH}, 'data', allow_duplicate=True),
-    Input({'type': 'var-dropdown', 'index': MATCH}, 'value'),
-    State({'type': 'dynamic-filter-dropdown', 'index': MATCH, 'filter_col': ALL}, 'value'), # <-- ADICIONADO STATE DOS FILTROS
-    State({'type': 'dynamic-filter-dropdown', 'index': MATCH, 'filter_col': ALL}, 'id'),    # <-- ADICIONADO STATE DOS IDs DOS FILTROS
-    State({'type': 'visualization-state-store', 'index': MATCH}, 'data'),
-    prevent_initial_call=True
+    [
+        Output('card-header', 'children', allow_duplicate=True),
+        Output('card-content', 'children', allow_duplicate=True),
+        Output('metas-nav', 'children', allow_duplicate=True),
+        Output('meta-description', 'children', allow_duplicate=True),
+        Output('indicadores-section', 'children', allow_duplicate=True)
+    ],
+    Input('meta-selecionada', 'data'),
+    prevent_initial_call=True  # Impede execução inicial
 )
-def update_store_from_variable(selected_var, current_filter_values, current_filter_ids, current_store_data):
-    """Atualiza o store com a variável selecionada e os filtros atuais dos dropdowns."""
-    if not callback_context.triggered:
+def update_meta_content(selecao):
+    meta_id = (selecao or {}).get('index')
+    if not meta_id:
         raise PreventUpdate
+    logging.debug("Atualizando conteúdo - Clique na Meta ID: %s", meta_id)  # Log de Debug
 
-    # Constrói o dicionário de filtros atuais a partir dos valores e IDs dos dropdowns de filtro
-    actual_current_filters = {}
-    if current_filter_ids and current_filter_values:
-        for i, filter_id_dict in enumerate(current_filter_ids):
-            if filter_id_dict and i < len(current_filter_values) and current_filter_values[i] is not None: 
-                filter_col = filter_id_dict.get('filter_col')
-                if filter_col:
-                    actual_current_filters[filter_col] = current_filter_values[i]
-
-    new_store_data = {
-        'selected_var': selected_var,
-        'selected_filters': actual_current_filters  # Usa os filtros lidos diretamente dos dropdowns
-    }
+    try:
+        data_version = get_data_version()
+        rendered = meta_section(meta_id, data_version)
+        if rendered is None:
+            return no_update, no_update, no_update, "Meta não encontrada.", []  # Atualiza descrição
+        prefetch_sibling_tabs(meta_id, data_version)
 
-    # Só atualiza se o novo estado combinado for diferente do armazenado
-    if new_store_data != (current_store_data or {}):
-        logging.debug(
-            f"Store Update (Var): Indicador {callback_context.inputs_list[0]['id']['index']} - Novo Store: {new_store_data}")
-        return new_store_data
-    else:
-        raise PreventUpdate
+        # Retorna o cabeçalho do objetivo para permitir voltar à sua descrição se necessário
+        objetivo, metas_nav, meta_desc, indicadores_section = rendered
+        return objetivo['header'], objetivo['content'], metas_nav, meta_desc, indicadores_section
+
+    except Exception as e:
+        logging.exception("Erro geral em update_meta_content:")
+        # Retorna um estado seguro em caso de erro inesperado
+        return initial_header, initial_content, [], "Ocorreu um erro.", []
 
 
-# Callback para atualizar o store quando os FILTROS DINÂMICOS mudam
+# Callback único da seleção: variável ou filtros mudam -> store e visualização na mesma resposta
 @app.callback(
-    Output({'type': 'visualization-state-store', 'index': MATCH}, 'data', allow_duplicate=True),
+    Output({'type': 'graph-container', 'index': MATCH}, 'children'),
+    Output({'type': 'visualization-state-store', 'index': MATCH}, 'data'),
+    Input({'type': 'var-dropdown', 'index': MATCH}, 'value'),
     Input({'type': 'dynamic-filter-dropdown', 'index': MATCH, 'filter_col': ALL}, 'value'),
     State({'type': 'dynamic-filter-dropdown', 'index': MATCH, 'filter_col': ALL}, 'id'),
-    State({'type': 'var-dropdown', 'index': MATCH}, 'value'),  # READICIONADO este state para preservar seleção de variável
     State({'type': 'visualization-state-store', 'index': MATCH}, 'data'),
+    State({'type': 'graph-container', 'index': MATCH}, 'id'),
     prevent_initial_call=True
 )
-def update_store_from_filters(filter_values, filter_ids, var_value, current_store_data):
-    """Atualiza o store com os filtros selecionados e a variável atual do dropdown."""
-    if not callback_context.triggered:
-        raise PreventUpdate
+def update_visualization(var_value, filter_values, filter_ids, store_data, container_id):
+    """
+    Atualiza o store da seleção e a visualização a partir dos dropdowns.
 
-    # Remonta o dicionário de filtros a partir dos inputs atuais
-    actual_current_filters = {}
-    if filter_ids and filter_values:
-        for i, filter_id_dict in enumerate(filter_ids):
-            if filter_id_dict and i < len(filter_values) and filter_values[i] is not None: 
-                filter_col = filter_id_dict.get('filter_col')
-                if filter_col:
-                    actual_current_filters[filter_col] = filter_values[i]
-    
-    # Prioriza variável do dropdown, mas mantém valor do store se dropdown retornar None
-    selected_var_from_store = current_store_data.get('selected_var') if current_store_data else None
-    final_var_value = var_value if var_value is not None else selected_var_from_store
-    
-    # Preserva filtros existentes no store para quaisquer filtros não atualizados
-    previous_filters = current_store_data.get('selected_filters', {}) if current_store_data else {}
-    
-    # Combina os filtros atuais com os anteriores (atuais têm precedência)
-    combined_filters = {**previous_filters, **actual_current_filters}
+    A seleção é normalizada em uma chave canônica (hash): se for a mesma já armazenada, nada é
+    enviado; senão a visualização vem do cache por (indicador, versão dos dados, seleção).
+    """
+    if not callback_context.triggered or not container_id:
+        raise PreventUpdate
 
-    new_store_data = {
-        'selected_var': final_var_value,
-        'selected_filters': combined_filters  # Usa a combinação de filtros
+    indicador_id = container_id['index']
+    store_data = store_data or {}
+    var_triggered = any(t['prop_id'].endswith('.value') and '"var-dropdown"' in t['prop_id']
+                        for t in callback_context.triggered)
+
+    # Filtros atuais dos dropdowns (os vazios são ignorados)
+    current_filters = {
+        filter_id['filter_col']: value for filter_id, value in zip(filter_ids or [], filter_values or [])
+        if value is not None and filter_id.get('filter_col')
     }
-
-    # Só atualiza se o novo estado combinado for diferente do armazenado
-    if new_store_data != (current_store_data or {}):
-        try:
-            indicador_id_str = callback_context.inputs_list[0][0]['id']['index'] 
-        except (IndexError, KeyError, TypeError):
-            indicador_id_str = "Desconhecido"
-        logging.debug(f"Store Update (Filters): Indicador {indicador_id_str} - Novo Store: {new_store_data}")
-        return new_store_data
+    if var_triggered:
+        selected_var = var_value
+        selected_filters = current_filters
     else:
+        # Mudança de filtro: mantém a variável e os filtros do store que não vieram dos dropdowns
+        selected_var = var_value if var_value is not None else store_data.get('selected_var')
+        selected_filters = {**(store_data.get('selected_filters') or {}), **current_filters}
+
+    filters_key = make_filters_key(selected_filters)
+    selection_key = make_selection_key(selected_var, filters_key)
+    stored_key = store_data.get('selection_key') or make_selection_key(
+        store_data.get('selected_var'), make_filters_key(store_data.get('selected_filters')))
+    if selection_key == stored_key:
         raise PreventUpdate
 
+    new_store_data = {'selected_var': selected_var, 'selected_filters': selected_filters,
+                      'selection_key': selection_key}
+    logging.debug("Seleção de %s: %s (chave %s)", indicador_id, new_store_data, selection_key)
+
+    try:
+        data_version = get_data_version()
+        # Sessões pedindo a mesma seleção ao mesmo tempo compartilham uma única geração
+        visualization = visualization_flight.do(
+            ('visualizacao', indicador_id, data_version, selection_key),
+            lambda: get_visualization(indicador_id, data_version, selection_key, selected_var, filters_key)
+        )
+    except Exception as e:
+        logging.exception("Erro ao atualizar visualização para %s: %s", indicador_id, e)
+        visualization = dbc.Alert(f"Erro ao atualizar visualização: {str(e)}", color="danger")
+    return visualization, new_store_data
+
+
+@lru_cache(maxsize=64)
+def get_visualization(indicador_id, data_version, selection_key, selected_var, filters_key):
+    """
+    Visualização (memoizada) de uma seleção do indicador.
+
+    Args:
+        indicador_id: ID do indicador
+        data_version: Versão dos dados (get_data_version)
+        selection_key: Chave canônica da seleção (make_selection_key)
+        selected_var: Código da variável selecionada
+        filters_key: Tupla ordenada de pares (coluna, valor) dos filtros
+
+    Returns:
+        Componentes da visualização, ou alerta se não houver dados
+    """
+    df_dados = load_dados_indicador_cache(indicador_id)
+    if df_dados is None or df_dados.empty:
+        return dbc.Alert(f"Dados não disponíveis para {indicador_id}.", color="warning")
+    return create_visualization(df_dados, indicador_id, selected_var, dict(filters_key))
 
-# Callback ATUALIZADA para gerar visualização QUANDO O STORE MUDA
+
+# Callback que entrega as páginas da tabela de detalhes (modelo infinito do AG Grid)
 @app.callback(
-    Output({'type': 'graph-container', 'index': MATCH}, 'children'),
-    [
-        Input({'type': 'visualization-state-store', 'index': MATCH}, 'data')  # <-- INPUT AGORA É O STORE
-    ],
-    [
-        State({'type': 'graph-container', 'index': MATCH}, 'id'),  # Mantém ID do container para logs
-    ],
-    prevent_initial_call=True  # Mantém prevent_initial_call
+    Output({'type': 'detail-table', 'index': MATCH}, 'getRowsResponse'),
+    Input({'type': 'detail-table', 'index': MATCH}, 'getRowsRequest'),
+    State({'type': 'table-state-store', 'index': MATCH}, 'data'),
+    State({'type': 'detail-table', 'index': MATCH}, 'id'),
 )
-def update_visualization_from_store(store_data, container_id):  # <-- Argumentos modificados
-    """Atualiza diretamente a visualização lendo o estado (var/filtros) do store."""
-    ctx = callback_context
-    # Não precisa checar ctx.triggered explicitamente aqui, pois o Input do store garante trigger
-    if not store_data or not container_id:
-        logging.debug("Vis Update from Store: Preventido (sem store_data ou container_id)")
+def serve_detail_table_rows(request_data, table_state, table_id):
+    """Entrega ao AG Grid apenas o bloco de linhas pedido, com ordenação e filtros aplicados no servidor."""
+    if not request_data or table_state is None or not table_id:
         raise PreventUpdate
 
-    indicador_id = container_id['index']
+    df_view = get_table_view(
+        table_id['index'],
+        table_state.get('selected_var'),
+        make_filters_key(table_state.get('selected_filters')),
+        json.dumps(request_data.get('sortModel') or [], sort_keys=True),
+        json.dumps(request_data.get('filterModel') or {}, sort_keys=True),
+        get_data_version(),
+    )
+    return {
+        'rowData': page_rows(df_view, request_data.get('startRow'), request_data.get('endRow')),
+        'rowCount': len(df_view)
+    }
 
-    # ---- Obter filtros e variável do STORE (Input) ----
-    var_value = store_data.get('selected_var')
-    selected_filters = store_data.get('selected_filters', {})  # Pega dict vazio se chave não existir
-    if selected_filters is None:  # Garante que seja um dict
-        selected_filters = {}
-    # -------------------------------------------------
 
-    logging.debug(
-        f"Atualizando visualização from store para {indicador_id}. Var: {var_value}, Filtros: {selected_filters}")
+if background_manager is not None:
+    # Exportação completa em segundo plano: o worker só enfileira o trabalho, que roda em outro
+    # processo com progresso na barra; o arquivo fica em disco por versão dos dados
+    @app.callback(
+        Output({'type': 'export-file-url', 'index': MATCH}, 'data'),
+        Input({'type': 'btn-csv-full', 'index': MATCH}, 'n_clicks'),
+        Input({'type': 'btn-excel-full', 'index': MATCH}, 'n_clicks'),
+        background=True,
+        # Progresso e estado em ids fixos: callbacks em segundo plano não aceitam ids com padrão nesses campos
+        progress=[Output('export-progress', 'value'), Output('export-progress', 'label')],
+        running=[
+            (Output('export-progress-container', 'style'),
+             {'position': 'fixed', 'bottom': '20px', 'right': '20px', 'width': '280px', 'zIndex': 1050},
+             {'display': 'none'}),
+        ],
+        prevent_initial_call=True
+    )
+    def export_full_background(set_progress, n_clicks_csv, n_clicks_excel):
+        """Gera o arquivo completo do indicador e retorna o link para o download."""
+        triggered_id = callback_context.triggered_id
+        if not triggered_id or not (n_clicks_csv or n_clicks_excel):
+            raise PreventUpdate
+        indicador_id = triggered_id['index']
+        formato = 'csv' if triggered_id['type'] == 'btn-csv-full' else 'xlsx'
+
+        def progresso(valor_rotulo):
+            valor, rotulo = valor_rotulo
+            set_progress((valor, f"{indicador_id}: {rotulo}"))
+
+        progresso((5, "Na fila"))
+        # Limita as exportações simultâneas entre todos os workers (semáforo no próprio diskcache)
+        with diskcache.BoundedSemaphore(background_cache, 'exportacoes-completas',
+                                        value=EXPORT_MAX_JOBS, expire=600):
+            path = build_full_export(indicador_id, formato, get_data_version(), progresso)
+        if path is None:
+            logging.warning("Sem dados para a exportação completa de %s", indicador_id)
+            raise PreventUpdate
+        progresso((100, "Pronto"))
+        # O horário garante o novo download mesmo quando o link é o mesmo
+        return {'url': build_export_url(indicador_id, formato, completo=True), 'time': time.time()}
+
+    # Dispara o download no navegador quando o arquivo fica pronto
+    app.clientside_callback(
+        ClientsideFunction(namespace='ods', function_name='baixarArquivo'),
+        Output({'type': 'export-file-link', 'index': MATCH}, 'href'),
+        Input({'type': 'export-file-url', 'index': MATCH}, 'data'),
+        prevent_initial_call=True
+    )
 
-    try:
-        # Carrega dados do indicador
-        df_dados = load_dados_indicador_cache(indicador_id)
-        if df_dados is None or df_dados.empty:
-            return dbc.Alert(f"Dados não disponíveis para {indicador_id}.",
-                             color="warning")  # Não precisa retornar store
-
-        # Gera nova visualização
-        visualization = create_visualization(
-            df_dados, indicador_id, var_value, selected_filters
-        )
 
-        return visualization  # <-- RETORNA APENAS VISUALIZAÇÃO
+# Callback para manter as opções dos filtros coerentes com as seleções (não redesenha os gráficos)
+@app.callback(
+    Output({'type': 'dynamic-filter-dropdown', 'index': MATCH, 'filter_col': ALL}, 'options'),
+    Input({'type': 'dynamic-filter-dropdown', 'index': MATCH, 'filter_col': ALL}, 'value'),
+    Input({'type': 'var-dropdown', 'index': MATCH}, 'value'),
+    State({'type': 'dynamic-filter-dropdown', 'index': MATCH, 'filter_col': ALL}, 'id'),
+    State({'type': 'dynamic-filter-dropdown', 'index': MATCH, 'filter_col': ALL}, 'options'),
+    prevent_initial_call=True
+)
+def update_filter_options(filter_values, var_value, filter_ids, current_options):
+    """Desabilita as opções de filtro que não têm dados dadas a variável e as demais seleções."""
+    if not filter_ids:
+        raise PreventUpdate
 
-    except Exception as e:
-        logging.exception(f"Erro ao atualizar visualização from store para {indicador_id}: {str(e)}")
-        return dbc.Alert(f"Erro ao atualizar visualização: {str(e)}", color="danger")  # Não precisa retornar store
+    filter_index = get_filter_index(filter_ids[0]['index'], get_data_version())
+    if filter_index is None:
+        raise PreventUpdate
+
+    selections = {
+        filter_id['filter_col']: value for filter_id, value in zip(filter_ids, filter_values)
+        if value is not None
+    }
+
+    new_options = []
+    for filter_id, options in zip(filter_ids, current_options):
+        valid_codes = filter_index.valid_values(filter_id['filter_col'], var_value, selections)
+        new_options.append([
+            {**option, 'disabled': str(option['value']).strip() not in valid_codes}
+            for option in (options or [])
+        ])
+
+    if new_options == current_options:
+        raise PreventUpdate
+    return new_options
 
 
 # Callback para atualizar o ranking quando o ano é alterado
-@app.callback(
-    Output({'type': 'ranking-chart', 'index': MATCH}, 'figure'),
-    [Input({'type': 'year-dropdown-ranking', 'index': MATCH}, 'value')],
-    [
-        State({'type': 'ranking-chart', 'index': MATCH}, 'id'),
-        State({'type': 'visualization-state-store', 'index': MATCH}, 'data')  # <-- ADICIONADO ESTADO DO STORE
-    ],
-    prevent_initial_call=True
-)
+# (registrado no servidor apenas quando a troca de ano no navegador está desativada)
 def update_ranking_chart(selected_year, chart_id, store_data):  # <-- Argumentos modificados
     """Atualiza o gráfico de ranking quando o ano é alterado, lendo filtros do store"""
     ctx = callback_context
@@ -2411,46 +2381,46 @@ def update_ranking_chart(selected_year, chart_id, store_data):  # <-- Argumentos
 
     # Log para debugging
     logging.debug(
-        f"Atualizando ranking para {indicador_id}, Ano: {selected_year}, Var Store: {selected_var_value}, Filtros Store: {selected_filters}")
+        "Atualizando ranking para %s, Ano: %s, Var Store: %s, Filtros Store: %s", indicador_id, selected_year, selected_var_value, selected_filters)
+
+    tracing.set_attributes(indicador=indicador_id, ano=selected_year, variavel=selected_var_value,
+                           filtros=json.dumps(selected_filters, sort_keys=True, default=str))
 
     # Carrega os dados do indicador
+    tracing.stage('carga')
     df_ranking_base = load_dados_indicador_cache(indicador_id)
     if df_ranking_base is None or df_ranking_base.empty:
-        logging.warning(f"Dados não disponíveis para o ranking de {indicador_id}")
+        logging.warning("Dados não disponíveis para o ranking de %s", indicador_id)
         # Retorna figura vazia com aviso se não houver dados
-        return go.Figure().update_layout(title='Dados não disponíveis para ranking.', xaxis={'visible': False},
-                                         yaxis={'visible': False})
+        return message_figure('Dados não disponíveis para ranking.')
 
     logging.debug(
-        f"Ranking - df_ranking_base inicial - Colunas: {df_ranking_base.columns.tolist()}, Registros: {len(df_ranking_base)}")
+        "Ranking - df_ranking_base inicial - Colunas: %s, Registros: %s", df_ranking_base.columns, len(df_ranking_base))
 
-    # --- INÍCIO: Aplicar filtro de VARIÁVEL PRINCIPAL ---
-    df_filtered_ranking = df_ranking_base.copy()
-    if selected_var_value and 'CODG_VAR' in df_filtered_ranking.columns:
+    # --- INÍCIO: Aplicar filtro de VARIÁVEL PRINCIPAL e filtros dinâmicos (sem copiar o DataFrame em cache) ---
+    tracing.stage('filtro')
+    df_filtered_ranking, failed_col = filter_indicator_data(df_ranking_base, indicador_id, selected_var_value, selected_filters)
+    logging.debug(
+        "Ranking - Após filtros (variável e dinâmicos) - Registros: %s", len(df_filtered_ranking))
+    if failed_col == 'CODG_VAR':
         selected_var_str = str(selected_var_value).strip()
-        df_filtered_ranking['CODG_VAR'] = df_filtered_ranking['CODG_VAR'].astype(str).str.strip()
-        df_filtered_ranking = df_filtered_ranking[df_filtered_ranking['CODG_VAR'] == selected_var_str]
-        logging.debug(
-            f"Ranking - Após filtro de variável principal ({selected_var_str}) - Registros: {len(df_filtered_ranking)}")
-        if df_filtered_ranking.empty:
-            var_name = selected_var_str
-            df_var_desc = load_variavel()
-            if not df_var_desc.empty:
-                var_info = df_var_desc[df_var_desc['CODG_VAR'] == selected_var_str]
-                if not var_info.empty:
-                    var_name = var_info['DESC_VAR'].iloc[0]
-            return go.Figure().update_layout(title=f'Ranking: Nenhum dado para variável \'{var_name}\'.',
-                                             xaxis={'visible': False}, yaxis={'visible': False})
-    # --- FIM: Aplicar filtro de VARIÁVEL PRINCIPAL ---
+        var_name = selected_var_str
+        df_var_desc = load_variavel()
+        if not df_var_desc.empty:
+            var_info = df_var_desc[df_var_desc['CODG_VAR'] == selected_var_str]
+            if not var_info.empty:
+                var_name = var_info['DESC_VAR'].iloc[0]
+        return message_figure(f'Ranking: Nenhum dado para variável \'{var_name}\'.')
+    # --- FIM: Aplicar filtros ---
 
     # Garante que a coluna DESC_UND_MED exista desde o início (AGORA EM df_filtered_ranking)
+    tracing.stage('merges')
     if 'DESC_UND_MED' not in df_filtered_ranking.columns:
-        logging.debug(f"Ranking - Adicionando coluna DESC_UND_MED ao df_filtered_ranking (não existia)")
+        logging.debug("Ranking - Adicionando coluna DESC_UND_MED ao df_filtered_ranking (não existia)")
         if 'CODG_UND_MED' in df_filtered_ranking.columns:
             df_unidade_medida_loaded = load_unidade_medida()
             if not df_unidade_medida_loaded.empty:
                 df_filtered_ranking['CODG_UND_MED'] = df_filtered_ranking['CODG_UND_MED'].astype(str)
-                df_unidade_medida_loaded['CODG_UND_MED'] = df_unidade_medida_loaded['CODG_UND_MED'].astype(str)
                 df_filtered_ranking = pd.merge(df_filtered_ranking,
                                                df_unidade_medida_loaded[['CODG_UND_MED', 'DESC_UND_MED']],
                                                on='CODG_UND_MED', how='left')
@@ -2460,99 +2430,68 @@ def update_ranking_chart(selected_year, chart_id, store_data):  # <-- Argumentos
         else:
             df_filtered_ranking['DESC_UND_MED'] = 'N/D'
         logging.debug(
-            f"Ranking - df_filtered_ranking após DESC_UND_MED - Colunas: {df_filtered_ranking.columns.tolist()}")
+            "Ranking - df_filtered_ranking após DESC_UND_MED - Colunas: %s", df_filtered_ranking.columns)
     elif 'DESC_UND_MED' in df_filtered_ranking.columns:  # Garante fillna se já existir
         df_filtered_ranking['DESC_UND_MED'] = df_filtered_ranking['DESC_UND_MED'].fillna('N/D')
 
     # Verificar se temos dados de UF (AGORA EM df_filtered_ranking)
     if 'DESC_UND_FED' not in df_filtered_ranking.columns and 'CODG_UND_FED' not in df_filtered_ranking.columns:
         logging.warning(
-            f"Ranking - Colunas de UF (DESC_UND_FED ou CODG_UND_FED) não encontradas em df_filtered_ranking para {indicador_id}")
-        return go.Figure().update_layout(title='Dados não incluem informações por UF para ranking.',
-                                         xaxis={'visible': False}, yaxis={'visible': False})
-
-    # Filtros Dinâmicos (AGORA EM df_filtered_ranking)
-    if selected_filters:
-        for col_code, selected_value in selected_filters.items():
-            if selected_value is not None and col_code in df_filtered_ranking.columns:
-                df_filtered_ranking[col_code] = df_filtered_ranking[col_code].astype(str).fillna('').str.strip()
-                selected_value_str = str(selected_value).strip()
-                df_filtered_ranking = df_filtered_ranking[df_filtered_ranking[col_code] == selected_value_str]
-        logging.debug(
-            f"Ranking - df_filtered_ranking após filtros dinâmicos - Colunas: {df_filtered_ranking.columns.tolist()}, Registros: {len(df_filtered_ranking)}")
+            "Ranking - Colunas de UF (DESC_UND_FED ou CODG_UND_FED) não encontradas em df_filtered_ranking para %s", indicador_id)
+        return message_figure('Dados não incluem informações por UF para ranking.')
 
     # IMPORTANTE: Primeiro filtra pelo ANO selecionado, depois verifica unicidade
     if 'CODG_ANO' not in df_filtered_ranking.columns:
         logging.error(
-            f"Ranking - Coluna CODG_ANO não encontrada em df_filtered_ranking para {indicador_id}. Colunas: {df_filtered_ranking.columns.tolist()}")
-        return go.Figure().update_layout(title='Erro interno: Coluna de Ano ausente.', xaxis={'visible': False},
-                                         yaxis={'visible': False})
+            "Ranking - Coluna CODG_ANO não encontrada em df_filtered_ranking para %s. Colunas: %s", indicador_id, df_filtered_ranking.columns)
+        return message_figure('Erro interno: Coluna de Ano ausente.')
 
     df_filtered_ranking['CODG_ANO'] = df_filtered_ranking['CODG_ANO'].astype(str).str.strip()
     df_ranking_ano = df_filtered_ranking[df_filtered_ranking['CODG_ANO'] == str(selected_year).strip()].copy()
     logging.debug(
-        f"Ranking - df_ranking_ano após filtro de ano ({selected_year}) - Colunas: {df_ranking_ano.columns.tolist()}, Registros: {len(df_ranking_ano)}")
+        "Ranking - df_ranking_ano após filtro de ano (%s) - Colunas: %s, Registros: %s", selected_year, df_ranking_ano.columns, len(df_ranking_ano))
 
     if df_ranking_ano.empty:
-        logging.warning(f"Ranking - Sem dados para o ano {selected_year} com os filtros aplicados em {indicador_id}")
-        return go.Figure().update_layout(
-            title=f'Sem dados para o ano {selected_year} com os filtros aplicados.',
-            xaxis={'visible': False}, yaxis={'visible': False}
-        )
+        logging.warning("Ranking - Sem dados para o ano %s com os filtros aplicados em %s", selected_year, indicador_id)
+        return message_figure(f'Sem dados para o ano {selected_year} com os filtros aplicados.')
 
     # Adiciona DESC_UND_FED se necessário
     if 'DESC_UND_FED' not in df_ranking_ano.columns and 'CODG_UND_FED' in df_ranking_ano.columns:
-        logging.debug(f"Ranking - Adicionando DESC_UND_FED a df_ranking_ano para {indicador_id}")
+        logging.debug("Ranking - Adicionando DESC_UND_FED a df_ranking_ano para %s", indicador_id)
         df_ranking_ano['DESC_UND_FED'] = df_ranking_ano['CODG_UND_FED'].astype(str).map(constants.UF_NAMES)
-        # Log antes do dropna
-        logging.debug(
-            f"Ranking - df_ranking_ano ANTES de dropna DESC_UND_FED - Registros: {len(df_ranking_ano)}, NaNs em DESC_UND_FED: {df_ranking_ano['DESC_UND_FED'].isna().sum()}")
+        # Log antes do dropna (a contagem de NaNs só é calculada com DEBUG ativo)
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            logging.debug(
+                "Ranking - df_ranking_ano ANTES de dropna DESC_UND_FED - Registros: %s, NaNs em DESC_UND_FED: %s", len(df_ranking_ano), df_ranking_ano['DESC_UND_FED'].isna().sum())
         df_ranking_ano = df_ranking_ano.dropna(subset=['DESC_UND_FED'])
         logging.debug(
-            f"Ranking - df_ranking_ano APÓS dropna DESC_UND_FED - Colunas: {df_ranking_ano.columns.tolist()}, Registros: {len(df_ranking_ano)}")
+            "Ranking - df_ranking_ano APÓS dropna DESC_UND_FED - Colunas: %s, Registros: %s", df_ranking_ano.columns, len(df_ranking_ano))
 
     # Agora verifica unicidade por UF para o ano selecionado
     if 'DESC_UND_FED' not in df_ranking_ano.columns or df_ranking_ano.empty:
         logging.warning(
-            f"Ranking - DESC_UND_FED não encontrada ou df_ranking_ano vazio após processamento para {indicador_id}, ano {selected_year}")
-        return go.Figure().update_layout(
-            title=f'Ranking não disponível para {selected_year} (dados de UF ausentes/inválidos).',
-            xaxis={'visible': False}, yaxis={'visible': False}
-        )
+            "Ranking - DESC_UND_FED não encontrada ou df_ranking_ano vazio após processamento para %s, ano %s", indicador_id, selected_year)
+        return message_figure(f'Ranking não disponível para {selected_year} (dados de UF ausentes/inválidos).')
 
     # Verifica unicidade por UF para o ano selecionado
     counts_per_uf_ranking = df_ranking_ano['DESC_UND_FED'].value_counts()
     # ---- INÍCIO DA VERIFICAÇÃO DE UNICIDADE ----
     if (counts_per_uf_ranking > 1).any():
         logging.warning(
-            f"Ranking - Múltiplos valores por UF para o ano {selected_year} e filtros aplicados. Indicador: {indicador_id}. Contagens: {counts_per_uf_ranking[counts_per_uf_ranking > 1]}")
-        alert_fig = go.Figure()
-        alert_fig.update_layout(
-            annotations=[
-                go.layout.Annotation(
-                    text="Ranking não pode ser gerado: múltiplos valores por UF para o ano e filtros selecionados.<br>Verifique os filtros ou a configuração do indicador.",
-                    showarrow=False,
-                    xref="paper", yref="paper",
-                    x=0.5, y=0.5,
-                    align="center",
-                    font=dict(size=12)
-                )
-            ],
-            xaxis={'visible': False}, yaxis={'visible': False},
-            margin=dict(t=20, b=20, l=20, r=20),
-            height=200  # Altura menor para o alerta
+            "Ranking - Múltiplos valores por UF para o ano %s e filtros aplicados. Indicador: %s. Contagens: %s", selected_year, indicador_id, counts_per_uf_ranking[counts_per_uf_ranking > 1])
+        return annotation_figure(
+            "Ranking não pode ser gerado: múltiplos valores por UF para o ano e filtros selecionados.<br>"
+            "Verifique os filtros ou a configuração do indicador."
         )
-        return alert_fig
     # ---- FIM DA VERIFICAÇÃO DE UNICIDADE ----
 
     # Adiciona DESC_UND_MED se necessário (agora em df_ranking_ano)
     if 'DESC_UND_MED' not in df_ranking_ano.columns:
-        logging.debug(f"Ranking - Adicionando coluna DESC_UND_MED ao df_ranking_ano (não existia)")
+        logging.debug("Ranking - Adicionando coluna DESC_UND_MED ao df_ranking_ano (não existia)")
         if 'CODG_UND_MED' in df_ranking_ano.columns:
             df_unidade_medida_loaded = load_unidade_medida()
             if not df_unidade_medida_loaded.empty:
                 df_ranking_ano['CODG_UND_MED'] = df_ranking_ano['CODG_UND_MED'].astype(str)
-                df_unidade_medida_loaded['CODG_UND_MED'] = df_unidade_medida_loaded['CODG_UND_MED'].astype(str)
                 df_ranking_ano = pd.merge(df_ranking_ano, df_unidade_medida_loaded[['CODG_UND_MED', 'DESC_UND_MED']],
                                           on='CODG_UND_MED', how='left')
                 df_ranking_ano['DESC_UND_MED'] = df_ranking_ano['DESC_UND_MED'].fillna('N/D')
@@ -2560,7 +2499,7 @@ def update_ranking_chart(selected_year, chart_id, store_data):  # <-- Argumentos
                 df_ranking_ano['DESC_UND_MED'] = 'N/D'
         else:
             df_ranking_ano['DESC_UND_MED'] = 'N/D'
-        logging.debug(f"Ranking - df_ranking_ano após DESC_UND_MED - Colunas: {df_ranking_ano.columns.tolist()}")
+        logging.debug("Ranking - df_ranking_ano após DESC_UND_MED - Colunas: %s", df_ranking_ano.columns)
     elif 'DESC_UND_MED' in df_ranking_ano.columns:  # Garante que não haja NaNs se a coluna já existir
         df_ranking_ano['DESC_UND_MED'] = df_ranking_ano['DESC_UND_MED'].fillna('N/D')
 
@@ -2578,63 +2517,14 @@ def update_ranking_chart(selected_year, chart_id, store_data):  # <-- Argumentos
     ascending = (ranking_ordem == 1)  # True se for menor para maior (1)
     df_ranking_ano = df_ranking_ano.sort_values('VLR_VAR', ascending=ascending)
 
-    # Define cores e opacidade
-    goias_color = 'rgba(34, 152, 70, 1)'
-    other_color = 'rgba(34, 152, 70, 0.2)'
-
-    # Cria o gráfico de ranking com go.Figure e go.Bar
-    fig_ranking_updated = go.Figure()
-    for _, row in df_ranking_ano.iterrows():
-        uf = row['DESC_UND_FED']
-        valor = row['VLR_VAR']
-        und_med = row.get('DESC_UND_MED', 'N/D')  # Usa .get() para segurança
-        bar_color = goias_color if uf == 'Goiás' else other_color
-        # Modificado: Usa a função format_br
-        text_value = format_br(valor)
-
-        fig_ranking_updated.add_trace(go.Bar(
-            y=[uf],  # Estados no eixo Y
-            x=[valor],  # Valores no eixo X
-            name=uf,
-            orientation='h',  # Barras horizontais
-            marker_color=bar_color,
-            text=text_value,
-            textposition='outside',  # Texto fora da barra
-            hovertemplate=(
-                f"<b>{uf}</b><br>"
-                f"Valor: {text_value}<br>"  # Usa o texto formatado
-                f"Unidade: {und_med}<extra></extra>"
-            )
-        ))
-
-    max_x_ranking = df_ranking_ano['VLR_VAR'].max() if not df_ranking_ano.empty else 0
-    x_range_ranking = [0, max_x_ranking * 1.15]
-
-    # Atualiza layout para gráfico de barras horizontal
-    fig_ranking_updated.update_layout(
-        xaxis_title=None, yaxis_title=None,
-        yaxis=dict(showgrid=False, tickfont=dict(size=12, color='black'), categoryorder='array',
-                   categoryarray=df_ranking_ano['DESC_UND_FED'].tolist()),
-        xaxis=dict(showgrid=True, zeroline=False, tickfont=dict(size=12, color='black'), range=x_range_ranking,
-                   tickformat='d'),
-        showlegend=False, margin=dict(l=150, r=20, t=30, b=30), bargap=0.1
-    )
+    tracing.stage('figura')
+    return ranking_figure(df_ranking_ano)
 
-    return fig_ranking_updated
 
-
-@app.callback(
-    Output({'type': 'choropleth-map', 'index': MATCH}, 'figure'),
-    [Input({'type': 'year-dropdown-map', 'index': MATCH}, 'value')],
-    [
-        State({'type': 'choropleth-map', 'index': MATCH}, 'id'),
-        State({'type': 'visualization-state-store', 'index': MATCH}, 'data')  # <-- ADICIONADO ESTADO DO STORE
-    ],
-    prevent_initial_call=True
-)
+# Callback para atualizar o mapa quando o ano é alterado
+# (registrado no servidor apenas quando a troca de ano no navegador está desativada)
 def update_map_on_year_change(selected_year, chart_id, store_data):  # <-- Argumentos modificados
     """Atualiza o mapa coroplético quando o ano é alterado, lendo filtros do store"""
-    import plotly.express as px  # Import local para clareza
     ctx = callback_context
     if not ctx.triggered or not selected_year or not store_data:
         logging.debug("Mapa: Update preventido (sem ano ou store_data)")
@@ -2650,44 +2540,44 @@ def update_map_on_year_change(selected_year, chart_id, store_data):  # <-- Argum
     # -----------------------------------------
 
     logging.debug(
-        f"Atualizando mapa para {indicador_id}, Ano: {selected_year}, Var Store: {selected_var_value}, Filtros Store: {selected_filters}")
+        "Atualizando mapa para %s, Ano: %s, Var Store: %s, Filtros Store: %s", indicador_id, selected_year, selected_var_value, selected_filters)
+
+    tracing.set_attributes(indicador=indicador_id, ano=selected_year, variavel=selected_var_value,
+                           filtros=json.dumps(selected_filters, sort_keys=True, default=str))
 
+    tracing.stage('carga')
     df_map_base = load_dados_indicador_cache(indicador_id)
     if df_map_base is None or df_map_base.empty:
-        logging.warning(f"Dados não disponíveis para o mapa de {indicador_id}")
-        return go.Figure().update_layout(title='Dados não disponíveis para mapa.', xaxis={'visible': False},
-                                         yaxis={'visible': False})
+        logging.warning("Dados não disponíveis para o mapa de %s", indicador_id)
+        return message_figure('Dados não disponíveis para mapa.')
 
     logging.debug(
-        f"Mapa - df_map_base inicial - Colunas: {df_map_base.columns.tolist()}, Registros: {len(df_map_base)}")
+        "Mapa - df_map_base inicial - Colunas: %s, Registros: %s", df_map_base.columns, len(df_map_base))
 
-    # --- INÍCIO: Aplicar filtro de VARIÁVEL PRINCIPAL ---
-    df_filtered_map = df_map_base.copy()
-    if selected_var_value and 'CODG_VAR' in df_filtered_map.columns:
+    # --- INÍCIO: Aplicar filtro de VARIÁVEL PRINCIPAL e filtros dinâmicos (sem copiar o DataFrame em cache) ---
+    tracing.stage('filtro')
+    df_filtered_map, failed_col = filter_indicator_data(df_map_base, indicador_id, selected_var_value, selected_filters)
+    logging.debug(
+        "Mapa - Após filtros (variável e dinâmicos) - Registros: %s", len(df_filtered_map))
+    if failed_col == 'CODG_VAR':
         selected_var_str = str(selected_var_value).strip()
-        df_filtered_map['CODG_VAR'] = df_filtered_map['CODG_VAR'].astype(str).str.strip()
-        df_filtered_map = df_filtered_map[df_filtered_map['CODG_VAR'] == selected_var_str]
-        logging.debug(
-            f"Mapa - Após filtro de variável principal ({selected_var_str}) - Registros: {len(df_filtered_map)}")
-        if df_filtered_map.empty:
-            var_name = selected_var_str
-            df_var_desc = load_variavel()
-            if not df_var_desc.empty:
-                var_info = df_var_desc[df_var_desc['CODG_VAR'] == selected_var_str]
-                if not var_info.empty:
-                    var_name = var_info['DESC_VAR'].iloc[0]
-            return go.Figure().update_layout(title=f'Mapa: Nenhum dado para variável \'{var_name}\'.',
-                                             xaxis={'visible': False}, yaxis={'visible': False})
-    # --- FIM: Aplicar filtro de VARIÁVEL PRINCIPAL ---
+        var_name = selected_var_str
+        df_var_desc = load_variavel()
+        if not df_var_desc.empty:
+            var_info = df_var_desc[df_var_desc['CODG_VAR'] == selected_var_str]
+            if not var_info.empty:
+                var_name = var_info['DESC_VAR'].iloc[0]
+        return message_figure(f'Mapa: Nenhum dado para variável \'{var_name}\'.')
+    # --- FIM: Aplicar filtros ---
 
     # NOVO: Garante que a coluna DESC_UND_MED exista desde o início (AGORA EM df_filtered_map)
+    tracing.stage('merges')
     if 'DESC_UND_MED' not in df_filtered_map.columns:
-        logging.debug(f"Mapa - Adicionando coluna DESC_UND_MED ao df_filtered_map (não existia)")
+        logging.debug("Mapa - Adicionando coluna DESC_UND_MED ao df_filtered_map (não existia)")
         if 'CODG_UND_MED' in df_filtered_map.columns:
             df_unidade_medida_loaded = load_unidade_medida()
             if not df_unidade_medida_loaded.empty:
                 df_filtered_map['CODG_UND_MED'] = df_filtered_map['CODG_UND_MED'].astype(str)
-                df_unidade_medida_loaded['CODG_UND_MED'] = df_unidade_medida_loaded['CODG_UND_MED'].astype(str)
                 df_filtered_map = pd.merge(df_filtered_map, df_unidade_medida_loaded[['CODG_UND_MED', 'DESC_UND_MED']],
                                            on='CODG_UND_MED', how='left')
                 df_filtered_map['DESC_UND_MED'] = df_filtered_map['DESC_UND_MED'].fillna('N/D')
@@ -2695,65 +2585,39 @@ def update_map_on_year_change(selected_year, chart_id, store_data):  # <-- Argum
                 df_filtered_map['DESC_UND_MED'] = 'N/D'
         else:
             df_filtered_map['DESC_UND_MED'] = 'N/D'
-        logging.debug(f"Mapa - df_filtered_map após DESC_UND_MED - Colunas: {df_filtered_map.columns.tolist()}")
+        logging.debug("Mapa - df_filtered_map após DESC_UND_MED - Colunas: %s", df_filtered_map.columns)
     elif 'DESC_UND_MED' in df_filtered_map.columns:  # Garante fillna
         df_filtered_map['DESC_UND_MED'] = df_filtered_map['DESC_UND_MED'].fillna('N/D')
 
-    logging.debug(
-        f"Mapa - df_filtered_map antes de filtros dinâmicos - Colunas: {df_filtered_map.columns.tolist()}, Registros: {len(df_filtered_map)}")
-    logging.debug(
-        f"Mapa - 'DESC_UND_MED' está disponível antes de filtros dinâmicos? {'DESC_UND_MED' in df_filtered_map.columns}")
-
     if 'DESC_UND_FED' not in df_filtered_map.columns and 'CODG_UND_FED' not in df_filtered_map.columns:
         logging.warning(
-            f"Mapa - Colunas de UF (DESC_UND_FED ou CODG_UND_FED) não encontradas em df_filtered_map para {indicador_id}")
-        return go.Figure().update_layout(title='Dados não incluem informações por UF para mapa.',
-                                         xaxis={'visible': False}, yaxis={'visible': False})
-
-    # Aplica filtros dinâmicos (AGORA EM df_filtered_map)
-    if selected_filters:
-        for col_code, selected_value in selected_filters.items():
-            if selected_value is not None and col_code in df_filtered_map.columns:
-                df_filtered_map[col_code] = df_filtered_map[col_code].astype(str).fillna('').str.strip()
-                selected_value_str = str(selected_value).strip()
-                df_filtered_map = df_filtered_map[df_filtered_map[col_code] == selected_value_str]
-                # Removido log repetido aqui
-    logging.debug(
-        f"Mapa - df_filtered_map após filtros dinâmicos - Colunas: {df_filtered_map.columns.tolist()}, Registros: {len(df_filtered_map)}")
-    logging.debug(
-        f"Mapa - 'DESC_UND_MED' está disponível após filtros dinâmicos? {'DESC_UND_MED' in df_filtered_map.columns}")
+            "Mapa - Colunas de UF (DESC_UND_FED ou CODG_UND_FED) não encontradas em df_filtered_map para %s", indicador_id)
+        return message_figure('Dados não incluem informações por UF para mapa.')
 
     # Garante CODG_ANO existe antes de filtrar
     if 'CODG_ANO' not in df_filtered_map.columns:
         logging.error(
-            f"Mapa - Coluna CODG_ANO não encontrada em df_filtered_map para {indicador_id}. Colunas: {df_filtered_map.columns.tolist()}")
-        return go.Figure().update_layout(title='Erro interno: Coluna de Ano ausente.', xaxis={'visible': False},
-                                         yaxis={'visible': False})
+            "Mapa - Coluna CODG_ANO não encontrada em df_filtered_map para %s. Colunas: %s", indicador_id, df_filtered_map.columns)
+        return message_figure('Erro interno: Coluna de Ano ausente.')
 
     df_filtered_map['CODG_ANO'] = df_filtered_map['CODG_ANO'].astype(str).str.strip()
     df_map_ano = df_filtered_map[df_filtered_map['CODG_ANO'] == str(selected_year).strip()].copy()
 
     logging.debug(
-        f"Mapa - df_map_ano após filtro de ano ({selected_year}) - Colunas: {df_map_ano.columns.tolist()}, Registros: {len(df_map_ano)}")
-    logging.debug(f"Mapa - 'DESC_UND_MED' está disponível após filtro de ano? {'DESC_UND_MED' in df_map_ano.columns}")
+        "Mapa - df_map_ano após filtro de ano (%s) - Colunas: %s, Registros: %s", selected_year, df_map_ano.columns, len(df_map_ano))
+    logging.debug("Mapa - 'DESC_UND_MED' está disponível após filtro de ano? %s", 'DESC_UND_MED' in df_map_ano.columns)
 
     if df_map_ano.empty:
-        logging.warning(f"Sem dados para o ano {selected_year} com os filtros aplicados")
-        return go.Figure().update_layout(
-            title=f'Sem dados para o ano {selected_year} com os filtros aplicados.',
-            xaxis={'visible': False}, yaxis={'visible': False}
-        )
+        logging.warning("Sem dados para o ano %s com os filtros aplicados", selected_year)
+        return message_figure(f'Sem dados para o ano {selected_year} com os filtros aplicados.')
 
     if 'DESC_UND_FED' not in df_map_ano.columns and 'CODG_UND_FED' in df_map_ano.columns:
         df_map_ano['DESC_UND_FED'] = df_map_ano['CODG_UND_FED'].astype(str).map(constants.UF_NAMES)
         df_map_ano = df_map_ano.dropna(subset=['DESC_UND_FED'])
 
     if 'DESC_UND_FED' not in df_map_ano.columns or df_map_ano.empty:
-        logging.warning(f"Dados de UF não encontrados para o ano {selected_year}")
-        return go.Figure().update_layout(
-            title=f'Mapa não disponível para {selected_year}.',
-            xaxis={'visible': False}, yaxis={'visible': False}
-        )
+        logging.warning("Dados de UF não encontrados para o ano %s", selected_year)
+        return message_figure(f'Mapa não disponível para {selected_year}.')
 
     counts_per_uf_map = df_map_ano['DESC_UND_FED'].value_counts()
 
@@ -2762,7 +2626,6 @@ def update_map_on_year_change(selected_year, chart_id, store_data):  # <-- Argum
         df_unidade_medida_loaded = load_unidade_medida()
         if not df_unidade_medida_loaded.empty:
             df_map_ano['CODG_UND_MED'] = df_map_ano['CODG_UND_MED'].astype(str)
-            df_unidade_medida_loaded['CODG_UND_MED'] = df_unidade_medida_loaded['CODG_UND_MED'].astype(str)
             df_map_ano = pd.merge(df_map_ano, df_unidade_medida_loaded[['CODG_UND_MED', 'DESC_UND_MED']],
                                   on='CODG_UND_MED', how='left')
             df_map_ano['DESC_UND_MED'] = df_map_ano['DESC_UND_MED'].fillna('N/D')
@@ -2772,63 +2635,54 @@ def update_map_on_year_change(selected_year, chart_id, store_data):  # <-- Argum
         logging.debug("DESC_UND_MED e CODG_UND_MED não estão disponíveis, criando com valor padrão")
         df_map_ano['DESC_UND_MED'] = 'N/D'
 
-    # Formata os valores para o hover
-    df_map_ano['VLR_VAR_FORMATADO'] = df_map_ano['VLR_VAR'].apply(format_br)
-
-    # Tenta obter unidade de medida de forma segura
-    und_med_map = df_map_ano['DESC_UND_MED'].dropna().iloc[0] if not df_map_ano['DESC_UND_MED'].dropna().empty else ''
-
-    # Carrega o GeoJSON do arquivo
+    # Monta o mapa com o GeoJSON carregado uma única vez por processo
+    tracing.stage('figura')
     try:
-        with open('db/br_geojson.json', 'r', encoding='utf-8') as f:
-            geojson = json.load(f)
+        return choropleth_figure(df_map_ano)
     except Exception as e:
-        logging.error(f"Erro ao carregar GeoJSON: {e}")
-        return go.Figure().update_layout(
-            title='Erro ao carregar dados do mapa.',
-            xaxis={'visible': False}, yaxis={'visible': False}
-        )
-
-    # Cria o mapa usando px.choropleth exatamente como na função create_visualization
-    fig_map = px.choropleth(
-        df_map_ano,
-        geojson=geojson,
-        locations='DESC_UND_FED',
-        featureidkey='properties.name',
-        color='VLR_VAR',
-        color_continuous_scale=[
-            [0.0, 'rgba(34, 152, 70, 0.2)'],
-            [1.0, 'rgba(34, 152, 70, 1)']
-        ]
+        logging.error("Erro ao carregar GeoJSON: %s", e)
+        return message_figure('Erro ao carregar dados do mapa.')
+
+
+# Registro da troca de ano do ranking e do mapa
+if CLIENTSIDE_YEAR_SWITCH:
+    # No navegador: reordena o ranking e recolore o mapa a partir da tabela por ano
+    # pré-enviada em 'year-values-store' (funções em assets/clientside.js)
+    app.clientside_callback(
+        ClientsideFunction(namespace='ods', function_name='atualizarRanking'),
+        Output({'type': 'ranking-chart', 'index': MATCH}, 'figure'),
+        Input({'type': 'year-dropdown-ranking', 'index': MATCH}, 'value'),
+        State({'type': 'year-values-store', 'index': MATCH}, 'data'),
+        State({'type': 'ranking-chart', 'index': MATCH}, 'figure'),
+        prevent_initial_call=True
     )
-
-    # Atualiza as configurações de GEO (igual à função create_visualization)
-    map_center = {'lat': -12.95984198, 'lon': -53.27299730}
-    geos_update = dict(
-        visible=False,
-        showcoastlines=True,
-        coastlinecolor="White",
-        showland=True,
-        landcolor="white",
-        showframe=False,
-        projection=dict(type='mercator', scale=15),
-        center=map_center
+    app.clientside_callback(
+        ClientsideFunction(namespace='ods', function_name='atualizarMapa'),
+        Output({'type': 'choropleth-map', 'index': MATCH}, 'figure'),
+        Input({'type': 'year-dropdown-map', 'index': MATCH}, 'value'),
+        State({'type': 'year-values-store', 'index': MATCH}, 'data'),
+        State({'type': 'choropleth-map', 'index': MATCH}, 'figure'),
+        prevent_initial_call=True
     )
-    fig_map.update_geos(**geos_update)
-
-    # Atualiza os traces para usar linhas brancas (igual à função create_visualization)
-    fig_map.update_traces(
-        marker_line_color='white',
-        marker_line_width=1,
-        customdata=df_map_ano[['VLR_VAR_FORMATADO']],
-        hovertemplate="<b>%{location}</b><br>Valor: %{customdata[0]}" + (
-            f" {und_med_map}" if und_med_map else "") + "<extra></extra>"
-    )
-
-    # Remove o título da barra de cores (igual à função create_visualization)
-    fig_map.update_layout(coloraxis_colorbar_title_text='')
-
-    return fig_map
+else:
+    app.callback(
+        Output({'type': 'ranking-chart', 'index': MATCH}, 'figure'),
+        [Input({'type': 'year-dropdown-ranking', 'index': MATCH}, 'value')],
+        [
+            State({'type': 'ranking-chart', 'index': MATCH}, 'id'),
+            State({'type': 'visualization-state-store', 'index': MATCH}, 'data')
+        ],
+        prevent_initial_call=True
+    )(update_ranking_chart)
+    app.callback(
+        Output({'type': 'choropleth-map', 'index': MATCH}, 'figure'),
+        [Input({'type': 'year-dropdown-map', 'index': MATCH}, 'value')],
+        [
+            State({'type': 'choropleth-map', 'index': MATCH}, 'id'),
+            State({'type': 'visualization-state-store', 'index': MATCH}, 'data')
+        ],
+        prevent_initial_call=True
+    )(update_map_on_year_change)
 
 
 def find_best_initial_value(filter_values, preference_list=None):
@@ -2871,39 +2725,42 @@ def find_best_initial_value(filter_values, preference_list=None):
 
 
 # Função para testar diferentes combinações de filtros até encontrar uma que retorne dados
-def find_valid_filter_combination(df_dados, filter_cols, var_value=None):
+def find_valid_filter_combination(df_dados, filter_cols, var_value=None, lattice=None):
     """
     Tenta diferentes combinações de filtros até encontrar uma que retorne dados válidos.
-    
+
+    As verificações são consultas ao reticulado de combinações (FilterLattice), sem
+    filtrar o DataFrame a cada tentativa.
+
     Args:
         df_dados: DataFrame com os dados do indicador
         filter_cols: Lista de colunas que são filtros dinâmicos
         var_value: Valor da variável principal, se aplicável
-        
+        lattice: Reticulado pré-computado do indicador (calculado a partir de df_dados se omitido)
+
     Returns:
         Dicionário com a melhor combinação de filtros encontrada
     """
-    logging.debug(f"Buscando combinação válida de filtros para {len(filter_cols)} filtros")
-
-    # Verificar se há variável principal
-    if var_value is not None and 'CODG_VAR' in df_dados.columns:
-        df_test = df_dados[df_dados['CODG_VAR'].astype(str).str.strip() == str(var_value).strip()].copy()
-        if df_test.empty:
-            # Se a variável selecionada não retornar dados, não adianta testar filtros
-            logging.debug(f"Variável {var_value} não retorna dados, não testando filtros")
-            return {}
-    else:
-        df_test = df_dados.copy()
+    logging.debug("Buscando combinação válida de filtros para %d filtros", len(filter_cols))
 
     # Se não houver filtros, não há o que testar
     if not filter_cols:
         return {}
 
     # Verificar se há coluna VLR_VAR antes de continuar
-    if 'VLR_VAR' not in df_test.columns:
+    if 'VLR_VAR' not in df_dados.columns:
         logging.debug("Coluna VLR_VAR não encontrada no DataFrame, não é possível testar filtros")
         return {}
 
+    if lattice is None:
+        lattice = FilterLattice(df_dados, filter_cols)
+
+    # Verificar se há variável principal
+    if var_value is not None and lattice.stats(var_value)[0] == 0:
+        # Se a variável selecionada não retornar dados, não adianta testar filtros
+        logging.debug("Variável %s não retorna dados, não testando filtros", var_value)
+        return {}
+
     # Preferências de valores por tipo de filtro
     preference_map = {
         'CODG_DOM': ['Urbana', 'Rural', 'Total'],  # Situação do domicílio
@@ -2916,395 +2773,64 @@ def find_valid_filter_combination(df_dados, filter_cols, var_value=None):
     # Primeiro tenta valores preferenciais para cada filtro
     best_filters = {}
     for col in filter_cols:
-        unique_values = sorted(df_test[col].dropna().astype(str).unique())
+        unique_values = lattice.values(col, var_value)
         if not unique_values:
             continue
 
         # Usa preferências específicas para o filtro, se disponíveis
         prefs = preference_map.get(col, None)
-        best_value = find_best_initial_value(unique_values, prefs)
-        best_filters[col] = best_value
-
-    # Verifica se a combinação de filtros retorna dados não-zeros
-    df_filtered = df_test.copy()
-    for col, val in best_filters.items():
-        df_filtered = df_filtered[df_filtered[col].astype(str).str.strip() == str(val).strip()]
+        best_filters[col] = find_best_initial_value(unique_values, prefs)
 
-    # Se não restar nenhum registro, tenta filtros um a um
-    if df_filtered.empty or (df_filtered['VLR_VAR'] == 0).all():
+    # Se a combinação não tiver dados não-zeros, tenta filtros um a um
+    if not lattice.has_data(var_value, best_filters):
         logging.debug("Combinação inicial resultou em dados vazios, tentando filtros individuais")
         best_filters = {}
 
         # Testa cada filtro isoladamente (um por vez)
         for col in filter_cols:
-            unique_values = sorted(df_test[col].dropna().astype(str).unique())
-            for val in unique_values:
-                df_test_single = df_test[df_test[col].astype(str).str.strip() == str(val).strip()]
-                if not df_test_single.empty and not (df_test_single['VLR_VAR'] == 0).all():
+            for val in lattice.values(col, var_value):
+                if lattice.has_data(var_value, {col: val}):
                     best_filters[col] = val
                     break
 
-    logging.debug(f"Melhor combinação de filtros encontrada: {best_filters}")
+    logging.debug("Melhor combinação de filtros encontrada: %s", best_filters)
     return best_filters
 
 
 # Adicione a seguinte função para selecionar a melhor variável inicial
-def find_best_initial_var(df_dados, df_variavel_filtrado):
+def find_best_initial_var(df_dados, df_variavel_filtrado, lattice=None):
     """
     Encontra a melhor variável inicial baseado nos dados disponíveis
     """
     if df_variavel_filtrado.empty or 'CODG_VAR' not in df_dados.columns:
         return None
 
-    # Tenta encontrar uma variável que tenha dados não-zeros
-    for _, row in df_variavel_filtrado.iterrows():
-        var_cod = row['CODG_VAR']
-        df_test = df_dados[df_dados['CODG_VAR'].astype(str).str.strip() == str(var_cod).strip()]
+    if lattice is None:
+        lattice = FilterLattice(df_dados, [])
 
-        if not df_test.empty and not (df_test['VLR_VAR'] == 0).all():
-            logging.debug(f"Encontrada variável com dados válidos: {var_cod}")
+    # Tenta encontrar uma variável que tenha dados não-zeros
+    for var_cod in df_variavel_filtrado['CODG_VAR']:
+        if lattice.has_data(var_cod):
+            logging.debug("Encontrada variável com dados válidos: %s", var_cod)
             return var_cod
 
     # Se não encontrar, usa a primeira variável
     return df_variavel_filtrado['CODG_VAR'].iloc[0]
 
 
-# Callback para download de CSV (DADOS FILTRADOS)
-@app.callback(
-    Output({'type': 'download-csv', 'index': MATCH}, 'data'),
-    Input({'type': 'btn-csv-filtered', 'index': MATCH}, 'n_clicks'),
-    State({'type': 'download-data', 'index': MATCH}, 'data'),
-    State({'type': 'btn-csv-filtered', 'index': MATCH}, 'id'),  # Para obter o ID do indicador
-    prevent_initial_call=True
-)
-def download_csv_filtered(n_clicks, data_json, btn_id):
-    """Gera o arquivo CSV para download com os dados filtrados da tabela."""
-    if n_clicks is None or data_json is None:
-        raise PreventUpdate
-    
-    try:
-        # Obtém o ID do indicador do botão
-        indicador_id = btn_id.get('index', '')
-        
-        # Formata o nome do arquivo: indicador sem espaços, pontos substituídos por underscores
-        indicador_formatado = str(indicador_id).replace(' ', '').replace('.', '_')
-        
-        # Converte JSON para DataFrame
-        from io import StringIO
-        df = pd.read_json(StringIO(data_json), orient='split')
-        
-        # Log para verificar os campos presentes na exportação
-        logging.info(f"Campos disponíveis na exportação CSV: {df.columns.tolist()}")
-        
-        # Retorna conteúdo CSV com nome de arquivo incluindo o indicador
-        return dict(
-            content=df.to_csv(index=False, encoding='utf-8-sig'),
-            filename=f'{indicador_formatado}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
-        )
-    except Exception as e:
-        logging.exception("Erro ao gerar CSV filtrado: %s", str(e))
-        return no_update
-
-# Callback para download de CSV (DADOS COMPLETOS)
-@app.callback(
-    Output({'type': 'download-csv', 'index': MATCH}, 'data', allow_duplicate=True),
-    Input({'type': 'btn-csv-full', 'index': MATCH}, 'n_clicks'),
-    State({'type': 'btn-csv-full', 'index': MATCH}, 'id'),  # Para obter o ID do indicador
-    prevent_initial_call=True
-)
-def download_csv_full(n_clicks, btn_id):
-    """Gera o arquivo CSV para download com os dados completos do indicador."""
-    if n_clicks is None:
-        raise PreventUpdate
-    
-    try:
-        # Obtém o ID do indicador do botão
-        indicador_id = btn_id.get('index', '')
-        
-        # Formata o nome do arquivo: indicador sem espaços, pontos substituídos por underscores
-        indicador_formatado = str(indicador_id).replace(' ', '').replace('.', '_')
-        
-        # Carrega os dados completos do indicador sem filtros
-        df_full = load_dados_indicador_cache(indicador_id)
-        
-        if df_full is None or df_full.empty:
-            logging.warning(f"Dados completos não disponíveis para o indicador {indicador_id}")
-            return no_update
-        
-        # Prepara os dados para exportação, garantindo todas as colunas descritivas
-        # Adiciona descrições da unidade federativa
-        if 'CODG_UND_FED' in df_full.columns:
-            df_full['DESC_UND_FED'] = df_full['CODG_UND_FED'].astype(str).map(constants.UF_NAMES)
-        
-        # Adiciona descrições de variáveis
-        if 'CODG_VAR' in df_full.columns:
-            df_variavel_loaded = load_variavel()
-            if not df_variavel_loaded.empty:
-                df_full['CODG_VAR'] = df_full['CODG_VAR'].astype(str)
-                df_variavel_loaded['CODG_VAR'] = df_variavel_loaded['CODG_VAR'].astype(str)
-                df_full = df_full.merge(df_variavel_loaded[['CODG_VAR', 'DESC_VAR']], 
-                                             on='CODG_VAR', how='left')
-        
-        # Adiciona descrições de unidade de medida
-        if 'CODG_UND_MED' in df_full.columns:
-            df_unidade_medida_loaded = load_unidade_medida()
-            if not df_unidade_medida_loaded.empty:
-                df_full['CODG_UND_MED'] = df_full['CODG_UND_MED'].astype(str)
-                df_unidade_medida_loaded['CODG_UND_MED'] = df_unidade_medida_loaded['CODG_UND_MED'].astype(str)
-                df_full = df_full.merge(df_unidade_medida_loaded[['CODG_UND_MED', 'DESC_UND_MED']], 
-                                             on='CODG_UND_MED', how='left')
-        
-        # Adiciona ID_INDICADOR
-        if 'ID_INDICADOR' not in df_full.columns:
-            df_full['ID_INDICADOR'] = indicador_id
-        
-        # Reordena colunas para agrupá-las logicamente
-        all_columns = list(df_full.columns)
-        ordered_pairs = [
-            ['ID_INDICADOR'],
-            ['CODG_UND_FED', 'DESC_UND_FED'],
-            ['CODG_ANO'],
-            ['CODG_VAR', 'DESC_VAR'],
-            ['VLR_VAR'],
-            ['CODG_UND_MED', 'DESC_UND_MED']
-        ]
-        
-        # Campos dinâmicos
-        dynamic_pairs = []
-        for col in all_columns:
-            if col.startswith('CODG_') and col not in [item for sublist in ordered_pairs for item in sublist]:
-                desc_col = 'DESC_' + col[5:]
-                if desc_col in all_columns:
-                    dynamic_pairs.append([col, desc_col])
-                else:
-                    dynamic_pairs.append([col])
-        
-        # Constrói lista ordenada de colunas
-        ordered_columns = []
-        for pair in ordered_pairs + dynamic_pairs:
-            for col in pair:
-                if col in all_columns:
-                    ordered_columns.append(col)
-        
-        # Adiciona colunas restantes
-        for col in all_columns:
-            if col not in ordered_columns:
-                ordered_columns.append(col)
-        
-        # Reordena DataFrame
-        try:
-            df_full = df_full[ordered_columns]
-        except Exception as e:
-            logging.exception(f"Erro ao reordenar colunas para CSV completo: {e}")
-            # Continua com a ordem original se houver erro
-        
-        # Log para verificar os campos presentes na exportação
-        logging.info(f"Campos disponíveis na exportação CSV completa: {df_full.columns.tolist()}")
-        
-        # Retorna conteúdo CSV com nome de arquivo incluindo o indicador e sufixo 'full'
-        return dict(
-            content=df_full.to_csv(index=False, encoding='utf-8-sig'),
-            filename=f'{indicador_formatado}_full_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
-        )
-    except Exception as e:
-        logging.exception("Erro ao gerar CSV completo: %s", str(e))
-        return no_update
-
-# Callback para download de Excel (DADOS FILTRADOS)
-@app.callback(
-    Output({'type': 'download-excel', 'index': MATCH}, 'data'),
-    Input({'type': 'btn-excel-filtered', 'index': MATCH}, 'n_clicks'),
-    State({'type': 'download-data', 'index': MATCH}, 'data'),
-    State({'type': 'btn-excel-filtered', 'index': MATCH}, 'id'),  # Para obter o ID do indicador
-    prevent_initial_call=True
-)
-def download_excel_filtered(n_clicks, data_json, btn_id):
-    """Gera o arquivo Excel para download com os dados filtrados da tabela."""
-    if n_clicks is None or data_json is None:
-        raise PreventUpdate
-    
-    try:
-        # Obtém o ID do indicador do botão
-        indicador_id = btn_id.get('index', '')
-        
-        # Formata o nome do arquivo: indicador sem espaços, pontos substituídos por underscores
-        indicador_formatado = str(indicador_id).replace(' ', '').replace('.', '_')
-        
-        # Converte JSON para DataFrame
-        from io import StringIO
-        df = pd.read_json(StringIO(data_json), orient='split')
-        
-        # Log para verificar os campos presentes na exportação
-        logging.info(f"Campos disponíveis na exportação Excel filtrada: {df.columns.tolist()}")
-        
-        # Cria buffer de memória para o Excel
-        output = io.BytesIO()
-        
-        # Tenta usar xlsxwriter, com fallback para openpyxl
-        try:
-            excel_engine = 'xlsxwriter'
-            with pd.ExcelWriter(output, engine=excel_engine) as writer:
-                df.to_excel(writer, sheet_name='Dados', index=False)
-                
-                # Auto-ajusta largura das colunas (apenas com xlsxwriter)
-                worksheet = writer.sheets['Dados']
-                for i, col in enumerate(df.columns):
-                    # Encontra a largura máxima da coluna
-                    column_len = max(
-                        df[col].astype(str).map(len).max(),
-                        len(str(col))
-                    ) + 2  # adiciona um espaço extra
-                    worksheet.set_column(i, i, column_len)
-        except ImportError:
-            # Fallback para openpyxl se xlsxwriter não estiver disponível
-            excel_engine = 'openpyxl'
-            with pd.ExcelWriter(output, engine=excel_engine) as writer:
-                df.to_excel(writer, sheet_name='Dados', index=False)
-                logging.info("Usando engine openpyxl para Excel (sem auto-ajuste de colunas)")
-        
-        # Coloca o ponteiro do buffer no início
-        output.seek(0)
-        
-        # Retorna conteúdo Excel com nome de arquivo incluindo o indicador
-        return dcc.send_bytes(output.read(), f'{indicador_formatado}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx')
-    except Exception as e:
-        logging.exception("Erro ao gerar Excel filtrado: %s", str(e))
-        return no_update
-
-# Callback para download de Excel (DADOS COMPLETOS)
-@app.callback(
-    Output({'type': 'download-excel', 'index': MATCH}, 'data', allow_duplicate=True),
-    Input({'type': 'btn-excel-full', 'index': MATCH}, 'n_clicks'),
-    State({'type': 'btn-excel-full', 'index': MATCH}, 'id'),  # Para obter o ID do indicador
-    prevent_initial_call=True
-)
-def download_excel_full(n_clicks, btn_id):
-    """Gera o arquivo Excel para download com os dados completos do indicador."""
-    if n_clicks is None:
-        raise PreventUpdate
-    
-    try:
-        # Obtém o ID do indicador do botão
-        indicador_id = btn_id.get('index', '')
-        
-        # Formata o nome do arquivo: indicador sem espaços, pontos substituídos por underscores
-        indicador_formatado = str(indicador_id).replace(' ', '').replace('.', '_')
-        
-        # Carrega os dados completos do indicador sem filtros
-        df_full = load_dados_indicador_cache(indicador_id)
-        
-        if df_full is None or df_full.empty:
-            logging.warning(f"Dados completos não disponíveis para o indicador {indicador_id}")
-            return no_update
-        
-        # Prepara os dados para exportação, garantindo todas as colunas descritivas
-        # Adiciona descrições da unidade federativa
-        if 'CODG_UND_FED' in df_full.columns:
-            df_full['DESC_UND_FED'] = df_full['CODG_UND_FED'].astype(str).map(constants.UF_NAMES)
-        
-        # Adiciona descrições de variáveis
-        if 'CODG_VAR' in df_full.columns:
-            df_variavel_loaded = load_variavel()
-            if not df_variavel_loaded.empty:
-                df_full['CODG_VAR'] = df_full['CODG_VAR'].astype(str)
-                df_variavel_loaded['CODG_VAR'] = df_variavel_loaded['CODG_VAR'].astype(str)
-                df_full = df_full.merge(df_variavel_loaded[['CODG_VAR', 'DESC_VAR']], 
-                                        on='CODG_VAR', how='left')
-        
-        # Adiciona descrições de unidade de medida
-        if 'CODG_UND_MED' in df_full.columns:
-            df_unidade_medida_loaded = load_unidade_medida()
-            if not df_unidade_medida_loaded.empty:
-                df_full['CODG_UND_MED'] = df_full['CODG_UND_MED'].astype(str)
-                df_unidade_medida_loaded['CODG_UND_MED'] = df_unidade_medida_loaded['CODG_UND_MED'].astype(str)
-                df_full = df_full.merge(df_unidade_medida_loaded[['CODG_UND_MED', 'DESC_UND_MED']], 
-                                        on='CODG_UND_MED', how='left')
-        
-        # Adiciona ID_INDICADOR
-        if 'ID_INDICADOR' not in df_full.columns:
-            df_full['ID_INDICADOR'] = indicador_id
-        
-        # Reordena colunas para agrupá-las logicamente
-        all_columns = list(df_full.columns)
-        ordered_pairs = [
-            ['ID_INDICADOR'],
-            ['CODG_UND_FED', 'DESC_UND_FED'],
-            ['CODG_ANO'],
-            ['CODG_VAR', 'DESC_VAR'],
-            ['VLR_VAR'],
-            ['CODG_UND_MED', 'DESC_UND_MED']
-        ]
-        
-        # Campos dinâmicos
-        dynamic_pairs = []
-        for col in all_columns:
-            if col.startswith('CODG_') and col not in [item for sublist in ordered_pairs for item in sublist]:
-                desc_col = 'DESC_' + col[5:]
-                if desc_col in all_columns:
-                    dynamic_pairs.append([col, desc_col])
-                else:
-                    dynamic_pairs.append([col])
-        
-        # Constrói lista ordenada de colunas
-        ordered_columns = []
-        for pair in ordered_pairs + dynamic_pairs:
-            for col in pair:
-                if col in all_columns:
-                    ordered_columns.append(col)
-        
-        # Adiciona colunas restantes
-        for col in all_columns:
-            if col not in ordered_columns:
-                ordered_columns.append(col)
-        
-        # Reordena DataFrame se possível
-        try:
-            df_full = df_full[ordered_columns]
-        except Exception as e:
-            logging.exception(f"Erro ao reordenar colunas para Excel completo: {e}")
-            # Continua com a ordem original se houver erro
-        
-        # Log para verificar os campos presentes na exportação
-        logging.info(f"Campos disponíveis na exportação Excel completa: {df_full.columns.tolist()}")
-        
-        # Cria buffer de memória para o Excel
-        output = io.BytesIO()
-        
-        # Tenta usar xlsxwriter, com fallback para openpyxl
-        try:
-            excel_engine = 'xlsxwriter'
-            with pd.ExcelWriter(output, engine=excel_engine) as writer:
-                df_full.to_excel(writer, sheet_name='Dados', index=False)
-                
-                # Auto-ajusta largura das colunas (apenas com xlsxwriter)
-                worksheet = writer.sheets['Dados']
-                for i, col in enumerate(df_full.columns):
-                    # Encontra a largura máxima da coluna
-                    column_len = max(
-                        df_full[col].astype(str).map(len).max(),
-                        len(str(col))
-                    ) + 2  # adiciona um espaço extra
-                    worksheet.set_column(i, i, column_len)
-        except ImportError:
-            # Fallback para openpyxl se xlsxwriter não estiver disponível
-            excel_engine = 'openpyxl'
-            with pd.ExcelWriter(output, engine=excel_engine) as writer:
-                df_full.to_excel(writer, sheet_name='Dados', index=False)
-                logging.info("Usando engine openpyxl para Excel (sem auto-ajuste de colunas)")
-        
-        # Coloca o ponteiro do buffer no início
-        output.seek(0)
-        
-        # Retorna conteúdo Excel com nome de arquivo incluindo o indicador e sufixo 'full'
-        return dcc.send_bytes(output.read(), f'{indicador_formatado}_full_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx')
-    except Exception as e:
-        logging.exception("Erro ao gerar Excel completo: %s", str(e))
-        return no_update
-
+# Latência de todos os callbacks do servidor (depois de registrados) e rastreamento das etapas;
+# só indicadores da navegação viram rótulo das métricas (os ids das saídas vêm do navegador)
+metrics.instrument_callbacks(
+    app, known_indicators=lambda: get_navigation_tree(get_data_version()).meta_por_indicador)
+tracing.instrument_callbacks(app)
 
 server = app.server
 
 if __name__ == '__main__':
+    from generate_password import generate_password_hash, generate_secret_key, update_env_file
+
+    # No gunicorn o pool é iniciado em cada worker (gunicorn.conf.py)
+    offload.start()
     # Verifica se o arquivo .env existe
     if not os.path.exists('.env'):
         logging.warning("Arquivo .env não encontrado. Criando com configurações padrão...")
@@ -0,0 +1,168 @@
+// Callbacks executados no navegador (clientside) do Painel ODS
+(function() {
+    var COR_GOIAS = 'rgba(34, 152, 70, 1)';
+    var COR_OUTRAS = 'rgba(34, 152, 70, 0.2)';
+
+    // O template (plotly_white) vem da figura gerada no servidor e é preservado entre trocas
+    function templateDe(figura) {
+        return (figura && figura.layout && figura.layout.template) || undefined;
+    }
+
+    function figuraAviso(titulo, figura) {
+        return {
+            data: [],
+            layout: {
+                title: {text: titulo}, xaxis: {visible: false}, yaxis: {visible: false},
+                template: templateDe(figura)
+            }
+        };
+    }
+
+    function figuraMultiplosValores(texto, figura) {
+        return {
+            data: [],
+            layout: {
+                annotations: [{
+                    text: texto, showarrow: false, xref: 'paper', yref: 'paper',
+                    x: 0.5, y: 0.5, align: 'center', font: {size: 12}
+                }],
+                xaxis: {visible: false}, yaxis: {visible: false},
+                margin: {t: 20, b: 20, l: 20, r: 20}, height: 200,
+                template: templateDe(figura)
+            }
+        };
+    }
+
+    // Retorna os dados do ano ou a mensagem de aviso quando não há como desenhar
+    function dadosDoAno(ano, tabela, rotulo) {
+        var dados = tabela.anos[String(ano)];
+        if (!dados || !dados.ufs.length) {
+            return {aviso: 'Sem dados para o ano ' + ano + ' com os filtros aplicados.'};
+        }
+        if (!dados.unico) {
+            return {aviso: rotulo + ' não pode ser gerado: múltiplos valores por UF para o ano e filtros ' +
+                'selecionados.<br>Verifique os filtros ou a configuração do indicador.', multiplos: true};
+        }
+        return {dados: dados};
+    }
+
+    window.dash_clientside = Object.assign({}, window.dash_clientside, {
+        ods: {
+            // Inicia o download do arquivo gerado em segundo plano (exportação completa)
+            baixarArquivo: function(arquivo) {
+                if (!arquivo || !arquivo.url) {
+                    return window.dash_clientside.no_update;
+                }
+                var link = document.createElement('a');
+                link.href = arquivo.url;
+                link.style.display = 'none';
+                document.body.appendChild(link);
+                link.click();
+                document.body.removeChild(link);
+                return arquivo.url;
+            },
+
+            // Identifica o botão (objetivo ou meta) clicado entre os de mesmo tipo (ids com padrão)
+            // e retorna só o seu índice; o contador de cliques garante a atualização em cliques repetidos
+            botaoClicado: function(cliques) {
+                var disparos = window.dash_clientside.callback_context.triggered || [];
+                if (disparos.length !== 1 || !disparos[0].value) {
+                    return window.dash_clientside.no_update;
+                }
+                var propId = disparos[0].prop_id;
+                var id;
+                try {
+                    id = JSON.parse(propId.slice(0, propId.lastIndexOf('.')));
+                } catch (e) {
+                    return window.dash_clientside.no_update;
+                }
+                return {index: id.index, n_clicks: disparos[0].value};
+            },
+
+            atualizarRanking: function(ano, tabela, figura) {
+                if (!ano || !tabela || !tabela.anos) {
+                    return window.dash_clientside.no_update;
+                }
+                var resultado = dadosDoAno(ano, tabela, 'Ranking');
+                if (resultado.multiplos) {
+                    return figuraMultiplosValores(resultado.aviso, figura);
+                }
+                if (resultado.aviso) {
+                    return figuraAviso(resultado.aviso, figura);
+                }
+                var dados = resultado.dados;
+
+                // Mesma ordenação de create_visualization (0 = maior para menor)
+                var crescente = (tabela.ranking_ordem === 0);
+                var ordem = dados.ufs.map(function(_, i) { return i; });
+                ordem.sort(function(a, b) {
+                    return crescente ? dados.valores[a] - dados.valores[b] : dados.valores[b] - dados.valores[a];
+                });
+
+                var traces = ordem.map(function(i) {
+                    var uf = dados.ufs[i];
+                    return {
+                        type: 'bar', orientation: 'h',
+                        y: [uf], x: [dados.valores[i]], name: uf,
+                        marker: {color: uf === 'Goiás' ? COR_GOIAS : COR_OUTRAS},
+                        text: [dados.textos[i]], textposition: 'outside',
+                        hovertemplate: '<b>' + uf + '</b><br>Valor: ' + dados.textos[i] +
+                            '<br>Unidade: ' + dados.unidades[i] + '<extra></extra>'
+                    };
+                });
+
+                // Mesmo layout do ranking gerado em create_visualization
+                var maximo = Math.max.apply(null, dados.valores);
+                var layout = {
+                    xaxis: {
+                        title: {text: null}, showgrid: true, zeroline: false,
+                        tickfont: {size: 12, color: 'black'}, range: [0, maximo * 1.15], tickformat: 'd'
+                    },
+                    yaxis: {
+                        title: {text: null}, showgrid: false, tickfont: {size: 12, color: 'black'},
+                        categoryorder: 'array',
+                        categoryarray: ordem.map(function(i) { return dados.ufs[i]; })
+                    },
+                    showlegend: false, margin: {l: 150, r: 20, t: 30, b: 30}, bargap: 0.1,
+                    template: templateDe(figura)
+                };
+                return {data: traces, layout: layout};
+            },
+
+            atualizarMapa: function(ano, tabela, figura) {
+                if (!ano || !tabela || !tabela.anos) {
+                    return window.dash_clientside.no_update;
+                }
+                // Sem a figura inicial (com o GeoJSON) não há o que recolorir
+                if (!figura || !figura.data || !figura.data.length) {
+                    return window.dash_clientside.no_update;
+                }
+                var layout = Object.assign({}, figura.layout);
+                var resultado = dadosDoAno(ano, tabela, 'Mapa');
+                if (resultado.aviso) {
+                    // Mantém o trace (e o GeoJSON) para as próximas trocas de ano
+                    layout.annotations = [{
+                        text: resultado.aviso, showarrow: false, xref: 'paper', yref: 'paper',
+                        x: 0.5, y: 0.5, align: 'center', font: {size: 12}
+                    }];
+                    return {
+                        data: [Object.assign({}, figura.data[0], {locations: [], z: [], customdata: []})],
+                        layout: layout
+                    };
+                }
+                var dados = resultado.dados;
+
+                var unidade = dados.unidades.length ? dados.unidades[0] : '';
+                var trace = Object.assign({}, figura.data[0], {
+                    locations: dados.ufs.slice(),
+                    z: dados.valores.slice(),
+                    customdata: dados.textos.map(function(t) { return [t]; }),
+                    hovertemplate: '<b>%{location}</b><br>Valor: %{customdata[0]}' +
+                        (unidade ? ' ' + unidade : '') + '<extra></extra>'
+                });
+                delete layout.annotations;
+                return {data: [trace], layout: layout};
+            }
+        }
+    });
+})();
@@ -0,0 +1,514 @@
+"""
+Medições de desempenho do Painel ODS.
+
+Uso:
+    python benchmark.py memory [--limite N] [--indicador "Indicador 3.3.5" ...]
+    python benchmark.py figures [--limite N] [--repeticoes N]
+    python benchmark.py rss [--workers N] [--sem-preload] [--requisicoes N] [--limite-memoria MiB]
+    python benchmark.py load [--worker-class sync|gthread] [--workers N] [--threads N] [--offload N] [--duracao S]
+    python benchmark.py startup [--repeticoes N] [--top N]
+"""
+import argparse
+import contextlib
+import json
+import logging
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+import urllib.request
+
+import pandas as pd
+
+
+def indicadores_com_dados(app_module, limite=None):
+    """
+    Lista os indicadores que possuem arquivo parquet.
+
+    Args:
+        app_module: Módulo app já importado
+        limite: Quantidade máxima de indicadores (None para todos)
+
+    Returns:
+        list: IDs dos indicadores
+    """
+    ids = []
+    for indicador_id in app_module.df_indicadores['ID_INDICADOR']:
+        nome = indicador_id.lower().replace('indicador ', '')
+        if os.path.exists(f'db/resultados/indicador{nome}.parquet'):
+            ids.append(indicador_id)
+    return ids[:limite] if limite else ids
+
+
+def selecao_inicial(app_module, indicador_id, df_dados):
+    """Reproduz a seleção inicial (variável e filtros) usada ao abrir o indicador."""
+    df_variavel = app_module.load_variavel()
+    variaveis = df_variavel[df_variavel['CODG_VAR'].astype(str).isin(df_dados['CODG_VAR'].astype(str).unique())]
+    var = app_module.find_best_initial_var(df_dados, variaveis) if not variaveis.empty else None
+    filtros = app_module.find_valid_filter_combination(
+        df_dados, app_module.identify_filter_columns(df_dados), var
+    )
+    return var, filtros
+
+
+def _id_callback(component_id):
+    """Chave do callback registrado: ids com dicionário usam MATCH no índice."""
+    if isinstance(component_id, dict):
+        return json.dumps({k: (['MATCH'] if k == 'index' else v) for k, v in sorted(component_id.items())},
+                          separators=(',', ':'))
+    return component_id
+
+
+def _prop_id(component_id, prop):
+    if isinstance(component_id, dict):
+        return json.dumps(component_id, separators=(',', ':'), sort_keys=True) + '.' + prop
+    return component_id + '.' + prop
+
+
+def requisicao_callback(client, saidas, entradas, estados=()):
+    """
+    Dispara um callback pelo endpoint HTTP do Dash, como o navegador faria.
+
+    Args:
+        client: Cliente de teste do Flask
+        saidas: Lista de (id, propriedade) das saídas
+        entradas: Lista de (id, propriedade, valor) das entradas
+        estados: Lista de (id, propriedade, valor) dos estados
+
+    Returns:
+        Resposta HTTP do Flask
+    """
+    chaves = [f"{_id_callback(cid)}.{prop}" for cid, prop in saidas]
+    outputs = [{'id': cid, 'property': prop} for cid, prop in saidas]
+    payload = {
+        'output': chaves[0] if len(chaves) == 1 else '..' + '...'.join(chaves) + '..',
+        'outputs': outputs[0] if len(outputs) == 1 else outputs,
+        'inputs': [{'id': cid, 'property': prop, 'value': valor} for cid, prop, valor in entradas],
+        'state': [{'id': cid, 'property': prop, 'value': valor} for cid, prop, valor in estados],
+        'changedPropIds': [_prop_id(entradas[0][0], entradas[0][1])],
+    }
+    return client.post('/_dash-update-component', json=payload)
+
+
+def medir_pico(func, *args):
+    """Executa a função e retorna (tempo em ms, pico de memória alocada em KiB)."""
+    tracemalloc.start()
+    inicio = time.perf_counter()
+    resposta = func(*args)
+    duracao = (time.perf_counter() - inicio) * 1000
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    if getattr(resposta, 'status_code', 200) >= 400:
+        raise RuntimeError(f"Callback retornou HTTP {resposta.status_code}")
+    return duracao, pico / 1024
+
+
+def bench_memory(args):
+    """Pico de memória por requisição: carga do indicador e troca de ano do ranking/mapa."""
+    import app
+
+    client = app.server.test_client()
+    etapas = {'indicador': [], 'ranking': [], 'mapa': []}
+    print(f"{'Indicador':24s} {'indicador':>18s} {'ranking':>18s} {'mapa':>18s}")
+    for indicador_id in args.indicador or indicadores_com_dados(app, args.limite):
+        df_dados = app.load_dados_indicador_cache(indicador_id)
+        var, filtros = selecao_inicial(app, indicador_id, df_dados)
+        store = {'selected_var': var, 'selected_filters': filtros}
+        ano = sorted(df_dados['CODG_ANO'].astype(str).unique())[-1]
+
+        container = {'type': 'lazy-load-container', 'index': indicador_id}
+        carga = (
+            requisicao_callback, client,
+            [(container, 'children'), ({'type': 'spinner-indicator', 'index': indicador_id}, 'style')],
+            [('tabs-indicadores', 'active_tab', f'tab-{indicador_id}')],
+            [(container, 'id', container)],
+        )
+        # Aquece caches (dados, índices de filtros, GeoJSON) antes de medir
+        carga[0](*carga[1:])
+
+        requisicoes = [carga]
+        for tipo, dropdown in (('ranking-chart', 'year-dropdown-ranking'), ('choropleth-map', 'year-dropdown-map')):
+            grafico = {'type': tipo, 'index': indicador_id}
+            store_id = {'type': 'visualization-state-store', 'index': indicador_id}
+            requisicoes.append((
+                requisicao_callback, client, [(grafico, 'figure')],
+                [({'type': dropdown, 'index': indicador_id}, 'value', ano)],
+                [(grafico, 'id', grafico), (store_id, 'data', store)],
+            ))
+
+        resultados = [medir_pico(*requisicao) for requisicao in requisicoes]
+        for nome, resultado in zip(etapas, resultados):
+            etapas[nome].append(resultado)
+        print(f"{indicador_id:24s} " + " ".join(f"{ms:7.1f}ms {kib:7.0f}KiB" for ms, kib in resultados))
+
+    print("\nResumo (pico de memória alocada por requisição):")
+    for nome, valores in etapas.items():
+        if not valores:
+            continue
+        picos = [kib for _, kib in valores]
+        tempos = [ms for ms, _ in valores]
+        print(f"  {nome:10s} pico médio {sum(picos) / len(picos):8.0f} KiB | pico máximo {max(picos):8.0f} KiB"
+              f" | tempo médio {sum(tempos) / len(tempos):7.1f} ms")
+
+
+def dados_graficos(app_module, indicador_id, df_dados):
+    """Prepara os dados dos gráficos (seleção inicial, descrições, anos como texto) como create_visualization."""
+    var, filtros = selecao_inicial(app_module, indicador_id, df_dados)
+    df_selecionado, _ = app_module.filter_indicator_data(df_dados, indicador_id, var, filtros)
+    df_graficos = app_module.build_table_frame(df_selecionado, df_dados, indicador_id)
+    df_graficos['CODG_ANO'] = df_graficos['CODG_ANO'].astype(str)
+    df_graficos['VLR_VAR'] = pd.to_numeric(df_graficos['VLR_VAR'], errors='coerce').fillna(0)
+    return var, filtros, df_graficos.sort_values('CODG_ANO')
+
+
+def bench_figures(args):
+    """Tempo de construção das figuras (linha, ranking e mapa) e o custo da validação por go.Figure."""
+    import plotly.graph_objects as go
+    import app
+    import figures
+
+    def media_ms(func, repeticoes):
+        inicio = time.perf_counter()
+        for _ in range(repeticoes):
+            func()
+        return (time.perf_counter() - inicio) * 1000 / repeticoes
+
+    # Bases validadas e GeoJSON são montados uma vez por processo: fora da medição
+    figures._base_layouts()
+    figures.load_geojson()
+
+    totais = {'construcao': [], 'validacao': [], 'visualizacao': []}
+    print(f"{'Indicador':24s} {'construção':>12s} {'go.Figure':>12s} {'visualização':>14s}")
+    for indicador_id in indicadores_com_dados(app, args.limite):
+        df_dados = app.load_dados_indicador_cache(indicador_id)
+        var, filtros, df_graficos = dados_graficos(app, indicador_id, df_dados)
+        if df_graficos.empty:
+            continue
+        df_ano = df_graficos[df_graficos['CODG_ANO'] == df_graficos['CODG_ANO'].iloc[-1]]
+        df_ano = df_ano.sort_values('VLR_VAR', ascending=False)
+
+        def construir():
+            return [figures.series_figure(df_graficos, 'line'), figures.ranking_figure(df_ano),
+                    figures.choropleth_figure(df_ano)]
+
+        figuras = construir()
+        construcao = media_ms(construir, args.repeticoes)
+        # Custo que cada renderização pagava ao montar as figuras por go.Figure (validação completa)
+        validacao = media_ms(lambda: [go.Figure(fig) for fig in figuras], args.repeticoes)
+        visualizacao = media_ms(lambda: app.create_visualization(df_dados, indicador_id, var, filtros), 1)
+
+        totais['construcao'].append(construcao)
+        totais['validacao'].append(validacao)
+        totais['visualizacao'].append(visualizacao)
+        print(f"{indicador_id:24s} {construcao:10.2f}ms {validacao:10.2f}ms {visualizacao:12.1f}ms")
+
+    if totais['construcao']:
+        print("\nResumo (média por indicador):")
+        for nome, valores in totais.items():
+            print(f"  {nome:12s} {sum(valores) / len(valores):8.2f} ms")
+
+
+def memoria_processo(pid):
+    """
+    Memória do processo em KiB a partir de /proc/<pid>/smaps_rollup.
+
+    RSS conta as páginas compartilhadas com o master em todos os workers; PSS divide cada
+    página compartilhada entre os processos que a usam (a soma dos PSS é o uso real do pod).
+
+    Returns:
+        dict: rss, pss, uss (páginas privadas) e shared em KiB
+    """
+    campos = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for linha in f:
+            partes = linha.split()
+            if len(partes) >= 2 and partes[0].endswith(':') and partes[1].isdigit():
+                campos[partes[0][:-1]] = int(partes[1])
+    privada = campos.get('Private_Clean', 0) + campos.get('Private_Dirty', 0)
+    return {
+        'rss': campos.get('Rss', 0),
+        'pss': campos.get('Pss', 0),
+        'uss': privada,
+        'shared': campos.get('Shared_Clean', 0) + campos.get('Shared_Dirty', 0),
+    }
+
+
+def filhos(pid):
+    """PIDs dos processos filhos (workers do gunicorn)."""
+    try:
+        with open(f'/proc/{pid}/task/{pid}/children') as f:
+            return [int(p) for p in f.read().split()]
+    except OSError:
+        return []
+
+
+@contextlib.contextmanager
+def gunicorn_local(porta, workers, timeout, **env_extra):
+    """
+    Inicia o gunicorn com gunicorn.conf.py em uma porta local e espera todos os workers ficarem prontos.
+
+    Args:
+        porta: Porta local
+        workers: Quantidade de workers
+        timeout: Espera máxima pelos workers (s)
+        **env_extra: Variáveis de ambiente adicionais (ex.: GUNICORN_WORKER_CLASS)
+
+    Yields:
+        Tupla (processo do master, URL base)
+    """
+    env = dict(os.environ, PORT=str(porta), HOST='127.0.0.1', GUNICORN_WORKERS=str(workers),
+               GUNICORN_LOG_LEVEL='warning', **env_extra)
+    processo = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'app:server'],
+                                env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base = f'http://127.0.0.1:{porta}'
+    try:
+        inicio = time.perf_counter()
+        prontos = 0
+        # Cada /readyz cai em um worker qualquer: exige várias respostas prontas seguidas
+        while prontos < 3 * workers or len(filhos(processo.pid)) < workers:
+            if processo.poll() is not None:
+                raise RuntimeError(f"gunicorn terminou com código {processo.returncode}")
+            if time.perf_counter() - inicio > timeout:
+                raise RuntimeError(f"Workers não ficaram prontos em {timeout} s")
+            try:
+                with urllib.request.urlopen(f'{base}/readyz', timeout=5):
+                    prontos += 1
+            except OSError:  # Conexão recusada ou worker ainda importando o app
+                prontos = 0
+                time.sleep(0.5)
+        print(f"Workers prontos em {time.perf_counter() - inicio:.1f} s")
+        yield processo, base
+    finally:
+        processo.send_signal(signal.SIGTERM)
+        processo.wait(timeout=60)
+
+
+def bench_rss(args):
+    """
+    Memória por worker do gunicorn (com gunicorn.conf.py) depois do aquecimento e de algumas
+    requisições, comparada ao limite de memória do pod.
+    """
+    print(f"{'Sem' if args.sem_preload else 'Com'} preload, {args.workers} workers")
+    with gunicorn_local(args.porta, args.workers, args.timeout,
+                        GUNICORN_PRELOAD='false' if args.sem_preload else 'true') as (processo, base):
+        for i in range(args.requisicoes):
+            caminho = ('/', '/_dash-layout', '/_dash-dependencies')[i % 3]
+            with urllib.request.urlopen(f'{base}{caminho}', timeout=30) as resposta:
+                resposta.read()
+
+        pids = filhos(processo.pid)
+        print(f"\n{'Processo':12s} {'RSS':>10s} {'PSS':>10s} {'USS':>10s} {'Compart.':>10s}")
+        total_pss = 0
+        for nome, pid in [('master', processo.pid)] + [(f'worker {i + 1}', p) for i, p in enumerate(pids)]:
+            memoria = memoria_processo(pid)
+            total_pss += memoria['pss']
+            print(f"{nome:12s} " + " ".join(f"{memoria[k] / 1024:8.1f}Mi" for k in ('rss', 'pss', 'uss', 'shared')))
+
+        workers_uss = [memoria_processo(p)['uss'] for p in pids]
+        print(f"\nTotal (soma dos PSS): {total_pss / 1024:.1f} MiB de {args.limite_memoria} MiB "
+              f"({total_pss / 1024 / args.limite_memoria:.0%} do limite)")
+        if workers_uss:
+            print(f"Memória privada média por worker: {sum(workers_uss) / len(workers_uss) / 1024:.1f} MiB "
+                  f"(referência para GUNICORN_WORKER_MEMORY)")
+
+
+def percentil(valores, p):
+    """Percentil p (0-100) de uma lista já ordenada."""
+    if not valores:
+        return float('nan')
+    return valores[min(len(valores) - 1, int(round(p / 100 * (len(valores) - 1))))]
+
+
+def bench_load(args):
+    """
+    Cenário de carga local: clientes baixando exportações Excel (CPU) ao mesmo tempo que
+    clientes leves pedem o layout e o /healthz; mede a latência de cada grupo.
+    """
+    from exports import build_export_url
+
+    # Indicadores em rodízio, mais que o memo de exportações (16), para que cada download gere o arquivo
+    ids = []
+    for nome in sorted(os.listdir('db/resultados')):
+        if nome.startswith('indicador') and nome.endswith('.parquet'):
+            ids.append('Indicador ' + nome[len('indicador'):-len('.parquet')])
+    exportacoes = [build_export_url(indicador_id, 'xlsx') for indicador_id in ids[:args.indicadores]]
+    leves = ['/_dash-layout', '/healthz']
+
+    env = {'GUNICORN_WORKER_CLASS': args.worker_class, 'OFFLOAD_PROCESSES': str(args.offload)}
+    if args.threads:
+        env['GUNICORN_THREADS'] = str(args.threads)
+    print(f"Workers: {args.workers} × {args.worker_class} (threads: {args.threads or 'padrão'}, "
+          f"offload: {args.offload}), {args.clientes_exportacao} clientes de exportação, "
+          f"{args.clientes_leves} clientes leves, {args.duracao} s")
+
+    with gunicorn_local(args.porta, args.workers, args.timeout, **env) as (_, base):
+        latencias = {'exportacao': [], 'leve': []}
+        erros = {'exportacao': 0, 'leve': 0}
+        lock = threading.Lock()
+        fim = time.perf_counter() + args.duracao
+
+        def cliente(grupo, caminhos, deslocamento):
+            i = deslocamento
+            while time.perf_counter() < fim:
+                inicio = time.perf_counter()
+                try:
+                    with urllib.request.urlopen(base + caminhos[i % len(caminhos)], timeout=args.timeout) as resposta:
+                        resposta.read()
+                    with lock:
+                        latencias[grupo].append((time.perf_counter() - inicio) * 1000)
+                except OSError:
+                    with lock:
+                        erros[grupo] += 1
+                i += 1
+
+        clientes = [threading.Thread(target=cliente, args=('exportacao', exportacoes, n * 7))
+                    for n in range(args.clientes_exportacao)]
+        clientes += [threading.Thread(target=cliente, args=('leve', leves, n)) for n in range(args.clientes_leves)]
+        for thread in clientes:
+            thread.start()
+        for thread in clientes:
+            thread.join()
+
+    print(f"\n{'Grupo':12s} {'req':>6s} {'req/s':>7s} {'p50':>9s} {'p95':>9s} {'p99':>9s} {'máx':>9s} {'erros':>6s}")
+    for grupo, valores in latencias.items():
+        valores.sort()
+        print(f"{grupo:12s} {len(valores):6d} {len(valores) / args.duracao:7.1f} "
+              + " ".join(f"{percentil(valores, p):7.1f}ms" for p in (50, 95, 99))
+              + f" {max(valores, default=float('nan')):7.1f}ms {erros[grupo]:6d}")
+
+
+# Executado em um processo novo por repetição: tempo até o app importado e até o /readyz pronto
+_STARTUP_SCRIPT = """
+import json, sys, time
+inicio = time.perf_counter()
+import app
+importado = time.perf_counter()
+pronto = app.readiness.wait({timeout})
+fim = time.perf_counter()
+print(json.dumps({{'importacao': importado - inicio, 'pronto': fim - inicio if pronto else None,
+                  'etapas': app.readiness.report()}}))
+sys.stdout.flush()
+"""
+
+
+def importtime(stderr):
+    """
+    Lê a saída de -X importtime.
+
+    Returns:
+        Lista de (módulo, profundidade, próprio em µs, acumulado em µs), na ordem da saída
+    """
+    modulos = []
+    for linha in stderr.splitlines():
+        if not linha.startswith('import time:') or 'self [us]' in linha:
+            continue
+        proprio, acumulado, nome = linha[len('import time:'):].split('|')
+        profundidade = (len(nome) - len(nome.lstrip(' ')) - 1) // 2
+        modulos.append((nome.strip(), profundidade, int(proprio), int(acumulado)))
+    return modulos
+
+
+def bench_startup(args):
+    """
+    Tempo de inicialização do app em processos novos (importação e /readyz pronto), com a
+    decomposição do -X importtime: módulos importados diretamente pelo app e maiores tempos próprios.
+    """
+    script = _STARTUP_SCRIPT.format(timeout=args.timeout)
+    execucoes = []
+    for i in range(args.repeticoes + 1):
+        resultado = subprocess.run([sys.executable, '-X', 'importtime', '-c', script], capture_output=True,
+                                   text=True, timeout=args.timeout + 60)
+        if resultado.returncode != 0:
+            print(resultado.stderr[-2000:])
+            raise SystemExit("Falha ao importar o app")
+        # A primeira execução só aquece o cache do sistema de arquivos e os .pyc
+        if i > 0:
+            execucoes.append((json.loads(resultado.stdout.strip().splitlines()[-1]), importtime(resultado.stderr)))
+
+    importacoes = sorted(m['importacao'] * 1000 for m, _ in execucoes)
+    prontos = sorted(m['pronto'] * 1000 for m, _ in execucoes if m['pronto'] is not None)
+    print(f"{args.repeticoes} execuções (mediana): importação do app {percentil(importacoes, 50):.0f} ms, "
+          f"pronto (/readyz) {percentil(prontos, 50):.0f} ms")
+    for etapa, dados in execucoes[-1][0]['etapas'].items():
+        print(f"  {etapa:12s} pronto após {dados.get('ready_after_s', float('nan')) * 1000:7.0f} ms")
+
+    # Mediana por módulo entre as execuções
+    acumulado, proprio = {}, {}
+    for _, modulos in execucoes:
+        filhos_pendentes = []
+        for nome, profundidade, us_proprio, us_acumulado in modulos:
+            proprio.setdefault(nome, []).append(us_proprio)
+            # Cada módulo aparece depois dos que importou: os de profundidade 1 antes do 'app' são dele
+            if profundidade == 1:
+                filhos_pendentes.append((nome, us_acumulado))
+            elif profundidade == 0:
+                if nome == 'app':
+                    for filho, us_filho in filhos_pendentes:
+                        acumulado.setdefault(filho, []).append(us_filho)
+                    acumulado.setdefault('app (próprio)', []).append(us_proprio)
+                filhos_pendentes = []
+
+    def mediana(valores):
+        return percentil(sorted(valores), 50) / 1000
+
+    print(f"\n{'Importados pelo app':40s} {'acumulado':>10s}")
+    for nome, valores in sorted(acumulado.items(), key=lambda item: -mediana(item[1]))[:args.top]:
+        print(f"{nome:40s} {mediana(valores):8.1f}ms")
+    print(f"\n{'Maiores tempos próprios':40s} {'próprio':>10s}")
+    for nome, valores in sorted(proprio.items(), key=lambda item: -mediana(item[1]))[:args.top]:
+        print(f"{nome:40s} {mediana(valores):8.1f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Medições de desempenho do Painel ODS')
+    subparsers = parser.add_subparsers(dest='comando', required=True)
+
+    parser_memory = subparsers.add_parser('memory', help='Pico de memória por requisição (tracemalloc)')
+    parser_memory.add_argument('--limite', type=int, default=None, help='Quantidade máxima de indicadores')
+    parser_memory.add_argument('--indicador', action='append', help='Indicador a medir (pode repetir)')
+    parser_memory.set_defaults(func=bench_memory)
+
+    parser_figures = subparsers.add_parser('figures', help='Tempo de construção das figuras')
+    parser_figures.add_argument('--limite', type=int, default=None, help='Quantidade máxima de indicadores')
+    parser_figures.add_argument('--repeticoes', type=int, default=20, help='Repetições por medição')
+    parser_figures.set_defaults(func=bench_figures)
+
+    parser_rss = subparsers.add_parser('rss', help='Memória por worker do gunicorn (RSS/PSS/USS)')
+    parser_rss.add_argument('--workers', type=int, default=4, help='Quantidade de workers')
+    parser_rss.add_argument('--sem-preload', action='store_true', help='Importa o app em cada worker')
+    parser_rss.add_argument('--requisicoes', type=int, default=30, help='Requisições antes de medir')
+    parser_rss.add_argument('--limite-memoria', type=int, default=2048, help='Limite de memória do pod (MiB)')
+    parser_rss.add_argument('--porta', type=int, default=8099, help='Porta do gunicorn de teste')
+    parser_rss.add_argument('--timeout', type=int, default=180, help='Espera máxima pelos workers (s)')
+    parser_rss.set_defaults(func=bench_rss)
+
+    parser_load = subparsers.add_parser('load', help='Latência sob carga: exportações Excel e requisições leves')
+    parser_load.add_argument('--worker-class', choices=('sync', 'gthread'), default='gthread', help='Classe dos workers')
+    parser_load.add_argument('--workers', type=int, default=2, help='Quantidade de workers')
+    parser_load.add_argument('--threads', type=int, default=None, help='Threads por worker gthread')
+    parser_load.add_argument('--offload', type=int, default=1, help='Processos de offload por worker (0 desativa)')
+    parser_load.add_argument('--clientes-exportacao', type=int, default=4, help='Clientes baixando Excel')
+    parser_load.add_argument('--clientes-leves', type=int, default=4, help='Clientes pedindo layout e /healthz')
+    parser_load.add_argument('--indicadores', type=int, default=40, help='Indicadores no rodízio de exportações')
+    parser_load.add_argument('--duracao', type=int, default=30, help='Duração da carga (s)')
+    parser_load.add_argument('--porta', type=int, default=8099, help='Porta do gunicorn de teste')
+    parser_load.add_argument('--timeout', type=int, default=180, help='Espera máxima pelos workers e requisições (s)')
+    parser_load.set_defaults(func=bench_load)
+
+    parser_startup = subparsers.add_parser('startup', help='Tempo de inicialização do app (-X importtime)')
+    parser_startup.add_argument('--repeticoes', type=int, default=5, help='Processos medidos')
+    parser_startup.add_argument('--top', type=int, default=15, help='Módulos exibidos por tabela')
+    parser_startup.add_argument('--timeout', type=int, default=120, help='Espera máxima pelo /readyz (s)')
+    parser_startup.set_defaults(func=bench_startup)
+
+    args = parser.parse_args()
+    # Os logs do app poluem a saída das medições
+    logging.disable(logging.INFO)
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
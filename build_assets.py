@@ -0,0 +1,183 @@
+"""
+Gera os arquivos estáticos do Painel ODS para o nginx servir diretamente (sem passar pelo gunicorn).
+
+- assets/: cópia dos arquivos com o hash do conteúdo no nome (ex.: clientside.3f2a9c1b0d4e.js)
+  e o manifesto usado pelo app para trocar os links da página
+- _dash-component-suites/: JS/CSS dos componentes com os nomes versionados gerados pelo Dash
+- versões pré-comprimidas .gz dos arquivos de texto (e .br com --brotli, para nginx com o módulo
+  ngx_brotli e `brotli_static on`; ver nginx.conf)
+
+Deve ser executado no mesmo ambiente em que o app roda (os nomes versionados do Dash usam a data
+de modificação dos pacotes instalados).
+
+Uso:
+    python build_assets.py [--saida static_build] [--brotli]
+"""
+import argparse
+import gzip
+import hashlib
+import importlib
+import json
+import logging
+import os
+import pkgutil
+import re
+import shutil
+from urllib.parse import urlparse
+
+from dash.fingerprint import check_fingerprint
+
+try:
+    import brotli
+except ImportError:  # Sem brotli gera apenas as versões .gz, mesmo com --brotli
+    brotli = None
+
+from config import DASH_CONFIG, STATIC_BUILD_DIR
+
+logger = logging.getLogger('build_assets')
+
+ASSETS_DIR = 'assets'
+MANIFEST_NAME = 'assets-manifest.json'
+# Extensões que valem a pena pré-comprimir
+COMPRESSIBLE_EXTENSIONS = {'.js', '.css', '.html', '.json', '.map', '.svg', '.ico', '.txt'}
+COMPONENT_SUITES_RE = re.compile(r'(?:src|href)="(/_dash-component-suites/[^"]+)"')
+# Bibliotecas de componentes importadas pelo app.py, além das que o Dash sempre registra
+# (dcc, html, dash_table); uma biblioteca nova fora da lista continua sendo servida pelo app
+COMPONENT_PACKAGES = ('dash_bootstrap_components', 'dash_ag_grid')
+
+
+def fingerprinted_name(relpath, conteudo):
+    """Nome com os 12 primeiros caracteres do SHA-256 do conteúdo antes da extensão."""
+    digest = hashlib.sha256(conteudo).hexdigest()[:12]
+    base, ext = os.path.splitext(relpath)
+    return f'{base}.{digest}{ext}'
+
+
+def write_file(path, conteudo, com_brotli=False):
+    """
+    Grava o arquivo e, se for texto, as versões pré-comprimidas (.gz e, opcionalmente, .br).
+
+    As versões comprimidas só são mantidas quando reduzem o tamanho em pelo menos 10%.
+
+    Args:
+        path: Caminho de destino
+        conteudo: bytes do arquivo
+        com_brotli: Também gera a versão .br
+
+    Returns:
+        int: Quantidade de arquivos gravados
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(conteudo)
+    gravados = 1
+    if os.path.splitext(path)[1].lower() not in COMPRESSIBLE_EXTENSIONS:
+        return gravados
+
+    versoes = [('.gz', gzip.compress(conteudo, compresslevel=9, mtime=0))]
+    if com_brotli and brotli is not None:
+        versoes.append(('.br', brotli.compress(conteudo, quality=11)))
+    for sufixo, comprimido in versoes:
+        if len(comprimido) < 0.9 * len(conteudo):
+            with open(path + sufixo, 'wb') as f:
+                f.write(comprimido)
+            gravados += 1
+    return gravados
+
+
+def build_assets(saida, com_brotli=False):
+    """
+    Copia assets/ com e sem hash no nome e grava o manifesto {original: com hash}.
+
+    Args:
+        saida: Diretório de saída
+        com_brotli: Também gera as versões .br
+
+    Returns:
+        dict: Manifesto
+    """
+    manifesto = {}
+    gravados = 0
+    for raiz, _, arquivos in os.walk(ASSETS_DIR):
+        for nome in sorted(arquivos):
+            origem = os.path.join(raiz, nome)
+            relpath = os.path.relpath(origem, ASSETS_DIR).replace(os.sep, '/')
+            with open(origem, 'rb') as f:
+                conteudo = f.read()
+            versionado = fingerprinted_name(relpath, conteudo)
+            manifesto[relpath] = versionado
+            # O nome original continua disponível (favicon, página de manutenção, links diretos)
+            gravados += write_file(os.path.join(saida, 'assets', relpath), conteudo, com_brotli)
+            gravados += write_file(os.path.join(saida, 'assets', versionado), conteudo, com_brotli)
+
+    with open(os.path.join(saida, MANIFEST_NAME), 'w', encoding='utf-8') as f:
+        json.dump(manifesto, f, indent=2, sort_keys=True)
+    logger.info("assets: %d arquivos no manifesto, %d gravados", len(manifesto), gravados)
+    return manifesto
+
+
+def build_component_suites(saida, com_brotli=False):
+    """
+    Grava os arquivos dos componentes do Dash com os mesmos caminhos que a página usa.
+
+    Os arquivos referenciados na página têm versão no nome; os carregados sob demanda
+    (chunks assíncronos, source maps) são gravados com o nome original.
+
+    Args:
+        saida: Diretório de saída
+        com_brotli: Também gera as versões .br
+
+    Returns:
+        int: Quantidade de arquivos gravados
+    """
+    import dash
+
+    # Um app vazio com as mesmas bibliotecas referencia os mesmos arquivos: importar o app.py no
+    # build da imagem gravaria logs, leria os dados e aqueceria o cache dentro da imagem
+    for pacote in COMPONENT_PACKAGES:
+        importlib.import_module(pacote)
+    app = dash.Dash(__name__, serve_locally=True, assets_ignore='.*', **DASH_CONFIG)
+    app.layout = dash.html.Div()
+
+    client = app.server.test_client()
+    pagina = client.get('/').get_data(as_text=True)
+    caminhos = set()
+    for url in COMPONENT_SUITES_RE.findall(pagina):
+        _, _, pacote, resto = urlparse(url).path.split('/', 3)
+        caminhos.add((pacote, resto))
+    # Recursos registrados pelo Dash (inclui os dinâmicos, pedidos sem versão no nome)
+    for pacote, relpaths in app.registered_paths.items():
+        for relpath in relpaths:
+            caminhos.add((pacote, relpath))
+
+    gravados = 0
+    for pacote, caminho in sorted(caminhos):
+        path_in_pkg, _ = check_fingerprint(caminho)
+        try:
+            conteudo = pkgutil.get_data(pacote, path_in_pkg)
+        except (OSError, ImportError):
+            logger.info("Recurso não encontrado no pacote, ignorado: %s/%s", pacote, path_in_pkg)
+            continue
+        gravados += write_file(os.path.join(saida, '_dash-component-suites', pacote, caminho), conteudo,
+                               com_brotli)
+    logger.info("_dash-component-suites: %d recursos, %d arquivos gravados", len(caminhos), gravados)
+    return gravados
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Gera os arquivos estáticos do Painel ODS para o nginx')
+    parser.add_argument('--saida', default=STATIC_BUILD_DIR, help='Diretório de saída')
+    parser.add_argument('--brotli', action='store_true',
+                        help='Gera também as versões .br (nginx com ngx_brotli e brotli_static on)')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    # Recria o diretório para não deixar versões antigas para trás
+    shutil.rmtree(args.saida, ignore_errors=True)
+    os.makedirs(args.saida)
+    build_assets(args.saida, args.brotli)
+    build_component_suites(args.saida, args.brotli)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,15 +1,23 @@
 import os
 import pickle
+import sys
 import time
 import threading
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 from datetime import datetime, timedelta
 import logging
 
+from config import PRELOAD_MAX_WORKERS
+import metrics
+
 # Configuração de logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger('cache_manager')
 
+# Threads compartilhadas por todo pré-carregamento/pré-cálculo em segundo plano (orçamento fixo por processo)
+preload_executor = ThreadPoolExecutor(max_workers=PRELOAD_MAX_WORKERS, thread_name_prefix='preload')
+
 class CacheManager:
     """
     Gerenciador de cache de dois níveis (memória e disco) com pré-carregamento preditivo.
@@ -27,20 +35,25 @@ class CacheManager:
         self.memory_maxsize = memory_maxsize
         self.disk_ttl_hours = disk_ttl_hours
         
-        # Cache em memória
+        # Cache em memória (acessado também pelas threads de pré-carregamento)
         self.memory_cache = {}
         self.last_accessed = {}
+        self._sizes = {}  # chave -> bytes ocupados em memória
+        self.memory_bytes = 0
+        self._lock = threading.RLock()
         
         # Estatísticas
         self.hits = {"memory": 0, "disk": 0}
         self.misses = 0
         self.preloads = 0
+        self.evictions = 0
         
         # Cria o diretório de cache se não existir
         if not os.path.exists(cache_dir):
             os.makedirs(cache_dir)
         
-        logger.info(f"Cache Manager inicializado: memória={memory_maxsize}, disco TTL={disk_ttl_hours}h, dir={cache_dir}")
+        logger.info("Cache Manager inicializado: memória=%s, disco TTL=%sh, dir=%s",
+                    memory_maxsize, disk_ttl_hours, cache_dir)
     
     def _get_cache_path(self, key):
         """Retorna o caminho do arquivo de cache para uma chave."""
@@ -57,14 +70,40 @@ class CacheManager:
         file_time = datetime.fromtimestamp(os.path.getmtime(cache_path))
         return datetime.now() - file_time < timedelta(hours=self.disk_ttl_hours)
     
+    @staticmethod
+    def _sizeof(value):
+        """Bytes ocupados por um item (DataFrames incluem o conteúdo das colunas de texto)."""
+        if isinstance(value, pd.DataFrame):
+            return int(value.memory_usage(index=True, deep=True).sum())
+        return sys.getsizeof(value)
+
+    def _store_memory(self, key, value):
+        """Guarda o item na memória, removendo o menos usado se cheio (chamar com o lock adquirido)."""
+        if key not in self.memory_cache:
+            self._cleanup_memory_cache()
+        self._drop_memory(key)
+        self.memory_cache[key] = value
+        self.last_accessed[key] = time.time()
+        self._sizes[key] = self._sizeof(value)
+        self.memory_bytes += self._sizes[key]
+        metrics.CACHE_MEMORY_BYTES.set(self.memory_bytes)
+
+    def _drop_memory(self, key):
+        """Remove o item da memória (chamar com o lock adquirido)."""
+        self.memory_cache.pop(key, None)
+        self.last_accessed.pop(key, None)
+        self.memory_bytes -= self._sizes.pop(key, 0)
+        metrics.CACHE_MEMORY_BYTES.set(self.memory_bytes)
+
     def _cleanup_memory_cache(self):
-        """Limpa o cache em memória se estiver cheio."""
+        """Limpa o cache em memória se estiver cheio (chamar com o lock adquirido)."""
         if len(self.memory_cache) >= self.memory_maxsize:
             # Remove o item menos recentemente acessado
             oldest_key = min(self.last_accessed.items(), key=lambda x: x[1])[0]
-            self.memory_cache.pop(oldest_key, None)
-            self.last_accessed.pop(oldest_key, None)
-            logger.debug(f"Cache em memória cheio, removido: {oldest_key}")
+            self._drop_memory(oldest_key)
+            self.evictions += 1
+            metrics.CACHE_EVICTIONS.inc()
+            logger.debug("Cache em memória cheio, removido: %s", oldest_key)
     
     def get(self, key):
         """
@@ -77,11 +116,13 @@ class CacheManager:
             O item se encontrado, None caso contrário
         """
         # 1. Verifica no cache em memória (mais rápido)
-        if key in self.memory_cache:
-            self.last_accessed[key] = time.time()
-            self.hits["memory"] += 1
-            logger.debug(f"Cache HIT (memória): {key}")
-            return self.memory_cache[key]
+        with self._lock:
+            if key in self.memory_cache:
+                self.last_accessed[key] = time.time()
+                self.hits["memory"] += 1
+                metrics.CACHE_HITS.labels('memory').inc()
+                logger.debug("Cache HIT (memória): %s", key)
+                return self.memory_cache[key]
         
         # 2. Verifica no cache em disco
         cache_path = self._get_cache_path(key)
@@ -89,21 +130,25 @@ class CacheManager:
             try:
                 with open(cache_path, 'rb') as f:
                     data = pickle.load(f)
+                    tamanho = f.tell()
                 
                 # Atualiza o cache em memória
-                self._cleanup_memory_cache()
-                self.memory_cache[key] = data
-                self.last_accessed[key] = time.time()
+                with self._lock:
+                    self._store_memory(key, data)
+                    self.hits["disk"] += 1
+                metrics.CACHE_HITS.labels('disk').inc()
+                metrics.CACHE_BYTES.labels('disk', 'read').inc(tamanho)
                 
-                self.hits["disk"] += 1
-                logger.debug(f"Cache HIT (disco): {key}")
+                logger.debug("Cache HIT (disco): %s", key)
                 return data
             except Exception as e:
-                logger.warning(f"Erro ao carregar cache do disco para {key}: {e}")
+                logger.warning("Erro ao carregar cache do disco para %s: %s", key, e)
         
         # Não encontrado em nenhum cache
-        self.misses += 1
-        logger.debug(f"Cache MISS: {key}")
+        with self._lock:
+            self.misses += 1
+        metrics.CACHE_MISSES.inc()
+        logger.debug("Cache MISS: %s", key)
         return None
     
     def set(self, key, value):
@@ -115,18 +160,21 @@ class CacheManager:
             value: Valor a ser armazenado
         """
         # 1. Armazena no cache em memória
-        self._cleanup_memory_cache()
-        self.memory_cache[key] = value
-        self.last_accessed[key] = time.time()
+        with self._lock:
+            self._store_memory(key, value)
         
-        # 2. Armazena no cache em disco
+        # 2. Armazena no cache em disco (arquivo temporário + rename: leitores nunca veem um pickle pela metade)
         cache_path = self._get_cache_path(key)
         try:
-            with open(cache_path, 'wb') as f:
+            temp_path = f"{cache_path}.{threading.get_ident()}.tmp"
+            with open(temp_path, 'wb') as f:
                 pickle.dump(value, f)
-            logger.debug(f"Item armazenado no cache: {key}")
+                tamanho = f.tell()
+            os.replace(temp_path, cache_path)
+            metrics.CACHE_BYTES.labels('disk', 'write').inc(tamanho)
+            logger.debug("Item armazenado no cache: %s", key)
         except Exception as e:
-            logger.error(f"Erro ao salvar cache em disco para {key}: {e}")
+            logger.error("Erro ao salvar cache em disco para %s: %s", key, e)
     
     def preload(self, keys, load_func):
         """
@@ -139,8 +187,9 @@ class CacheManager:
         def preload_worker():
             for key in keys:
                 # Verifica se já está no cache
-                if key in self.memory_cache:
-                    continue
+                with self._lock:
+                    if key in self.memory_cache:
+                        continue
                     
                 cache_path = self._get_cache_path(key)
                 if self._is_disk_cache_valid(cache_path):
@@ -152,16 +201,15 @@ class CacheManager:
                     if data is not None:
                         # Armazena no cache
                         self.set(key, data)
-                        self.preloads += 1
-                        logger.info(f"Pré-carregado com sucesso: {key}")
+                        with self._lock:
+                            self.preloads += 1
+                        logger.info("Pré-carregado com sucesso: %s", key)
                 except Exception as e:
-                    logger.warning(f"Erro no pré-carregamento de {key}: {e}")
+                    logger.warning("Erro no pré-carregamento de %s: %s", key, e)
         
-        # Inicia o carregamento em segundo plano
-        thread = threading.Thread(target=preload_worker)
-        thread.daemon = True
-        thread.start()
-        logger.info(f"Iniciado pré-carregamento para {len(keys)} itens")
+        # Carrega em segundo plano nas threads compartilhadas (sem criar uma thread por chamada)
+        preload_executor.submit(preload_worker)
+        logger.info("Iniciado pré-carregamento para %s itens", len(keys))
     
     def clear(self, key=None):
         """
@@ -172,19 +220,22 @@ class CacheManager:
         """
         if key:
             # Remove um item específico
-            if key in self.memory_cache:
-                del self.memory_cache[key]
-                self.last_accessed.pop(key, None)
+            with self._lock:
+                self._drop_memory(key)
             
             cache_path = self._get_cache_path(key)
             if os.path.exists(cache_path):
                 os.remove(cache_path)
             
-            logger.info(f"Cache limpo para: {key}")
+            logger.info("Cache limpo para: %s", key)
         else:
             # Limpa todo o cache
-            self.memory_cache.clear()
-            self.last_accessed.clear()
+            with self._lock:
+                self.memory_cache.clear()
+                self.last_accessed.clear()
+                self._sizes.clear()
+                self.memory_bytes = 0
+                metrics.CACHE_MEMORY_BYTES.set(0)
             
             # Remove todos os arquivos de cache
             for filename in os.listdir(self.cache_dir):
@@ -205,7 +256,9 @@ class CacheManager:
             "disk_hits": self.hits["disk"],
             "misses": self.misses,
             "preloads": self.preloads,
+            "evictions": self.evictions,
             "memory_cache_size": len(self.memory_cache),
+            "memory_cache_bytes": self.memory_bytes,
             "memory_cache_maxsize": self.memory_maxsize
         }
     
@@ -221,9 +274,177 @@ class CacheManager:
         print(f"Tamanho do cache em memória: {stats['memory_cache_size']}/{stats['memory_cache_maxsize']}")
         print("=============================\n")
 
+
+class PrefetchQueue:
+    """
+    Fila de pré-cálculo em segundo plano limitada pelas threads de pré-carregamento.
+
+    Cada dono (ex.: uma sessão) tem no máximo um lote pendente: um novo lote do mesmo dono,
+    ou cancel(dono), cancela as tarefas do lote anterior que ainda não começaram.
+    """
+    def __init__(self, executor):
+        """
+        Args:
+            executor: ThreadPoolExecutor que executa as tarefas (define o orçamento de threads)
+        """
+        self.executor = executor
+        self._lotes = {}  # dono -> futures do último lote
+        self._lock = threading.Lock()
+        self.completed = 0
+        self.cancelled = 0
+
+    def _run(self, key, func):
+        """Executa uma tarefa, registrando falhas sem interromper o restante do lote."""
+        try:
+            func()
+            with self._lock:
+                self.completed += 1
+            logger.debug("Pré-calculado: %s", key)
+        except Exception as e:
+            logger.warning("Erro no pré-cálculo de %s: %s", key, e)
+
+    def submit(self, owner, tasks):
+        """
+        Agenda um lote de tarefas, substituindo o lote pendente do mesmo dono.
+
+        Args:
+            owner: Identificador do dono do lote
+            tasks: Lista de pares (chave, função sem argumentos)
+        """
+        self.cancel(owner)
+        futures = [self.executor.submit(self._run, key, func) for key, func in tasks]
+        with self._lock:
+            # Descarta lotes já concluídos de outros donos
+            self._lotes = {dono: fs for dono, fs in self._lotes.items() if not all(f.done() for f in fs)}
+            self._lotes[owner] = futures
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Pré-cálculo agendado para %s: %s", owner, [key for key, _ in tasks])
+
+    def cancel(self, owner):
+        """Cancela as tarefas do dono que ainda não começaram."""
+        with self._lock:
+            futures = self._lotes.pop(owner, [])
+        cancelados = sum(future.cancel() for future in futures)
+        if cancelados:
+            with self._lock:
+                self.cancelled += cancelados
+            logger.debug("Pré-cálculo cancelado para %s: %s tarefas", owner, cancelados)
+
+
+class SingleFlight:
+    """
+    Agrupa chamadas simultâneas com a mesma chave em uma única execução.
+
+    A primeira chamada de uma chave executa a função; as que chegam enquanto ela está em
+    andamento esperam e recebem o mesmo resultado (ou a mesma exceção). Contabiliza, por tipo
+    de chave (primeiro elemento da tupla), quantas chamadas foram agrupadas.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._em_andamento = {}  # chave -> [evento, resultado, exceção]
+        self.calls = {}
+        self.coalesced = {}
+
+    def do(self, key, func):
+        """
+        Executa func() uma única vez entre as chamadas simultâneas com a mesma chave.
+
+        Args:
+            key: Tupla cujo primeiro elemento é o tipo da chamada (usado nas estatísticas)
+            func: Função sem argumentos
+
+        Returns:
+            O resultado de func()
+        """
+        tipo = key[0]
+        with self._lock:
+            self.calls[tipo] = self.calls.get(tipo, 0) + 1
+            chamada = self._em_andamento.get(key)
+            lider = chamada is None
+            if lider:
+                chamada = [threading.Event(), None, None]
+                self._em_andamento[key] = chamada
+            else:
+                self.coalesced[tipo] = self.coalesced.get(tipo, 0) + 1
+
+        if not lider:
+            logger.debug("Chamada agrupada: %s", key)
+            chamada[0].wait()
+            if chamada[2] is not None:
+                raise chamada[2]
+            return chamada[1]
+
+        try:
+            chamada[1] = func()
+            return chamada[1]
+        except BaseException as e:
+            chamada[2] = e
+            raise
+        finally:
+            with self._lock:
+                self._em_andamento.pop(key, None)
+            chamada[0].set()
+
+    def get_stats(self):
+        """Retorna, por tipo, chamadas, agrupamentos e taxa de agrupamento, e as execuções em andamento."""
+        with self._lock:
+            por_tipo = {
+                tipo: {
+                    "calls": total,
+                    "coalesced": self.coalesced.get(tipo, 0),
+                    "coalescing_rate": self.coalesced.get(tipo, 0) / total if total else 0,
+                }
+                for tipo, total in self.calls.items()
+            }
+            return {"by_kind": por_tipo, "in_flight": len(self._em_andamento)}
+
+
 # Instância global do gerenciador de cache
 cache_manager = CacheManager()
 
+# Agrupamento das requisições simultâneas de visualizações idênticas
+visualization_flight = SingleFlight()
+
+# Fila global de pré-cálculo (visualizações das abas vizinhas)
+prefetch_queue = PrefetchQueue(preload_executor)
+
+
+def submit_preload(func, *args, **kwargs):
+    """
+    Envia uma tarefa para as threads de segundo plano.
+
+    Usa o executor atual do módulo: depois do fork ele é recriado (_reset_after_fork), e uma
+    referência importada antes do fork apontaria para o executor do master, sem threads no filho.
+
+    Returns:
+        concurrent.futures.Future: Future da tarefa
+    """
+    return preload_executor.submit(func, *args, **kwargs)
+
+
+def _reset_after_fork():
+    """
+    Recria threads e travas no processo filho.
+
+    Com o app pré-carregado no master do gunicorn (preload_app), os workers herdam o executor
+    sem as threads (que não sobrevivem ao fork) e travas que podiam estar ocupadas no momento
+    do fork; os dados em cache continuam compartilhados.
+    """
+    global preload_executor
+    preload_executor = ThreadPoolExecutor(max_workers=PRELOAD_MAX_WORKERS, thread_name_prefix='preload')
+    cache_manager._lock = threading.RLock()
+    prefetch_queue.executor = preload_executor
+    prefetch_queue._lock = threading.Lock()
+    prefetch_queue._lotes = {}
+    visualization_flight._lock = threading.Lock()
+    visualization_flight._em_andamento = {}
+    # O worker herda os itens do master: a métrica de memória do worker parte do total herdado
+    metrics.CACHE_MEMORY_BYTES.set(cache_manager.memory_bytes)
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
 # Função para carregar dados do indicador com cache
 def load_dados_indicador_cached(indicador_id, load_func):
     """
@@ -10,8 +10,16 @@ USE_RELOADER = os.getenv('USE_RELOADER', 'True').lower() == 'true'
 PORT = int(os.getenv('PORT', 8050))
 HOST = os.getenv('HOST', '0.0.0.0')
 
+# Troca de ano do ranking e do mapa feita no navegador, com os valores por ano
+# pré-enviados junto da visualização (evita uma ida ao servidor por troca de ano)
+CLIENTSIDE_YEAR_SWITCH = os.getenv('CLIENTSIDE_YEAR_SWITCH', 'false').lower() == 'true'
+
 # Senha para alternar o modo de manutenção
 MAINTENANCE_PASSWORD = os.getenv('MAINTENANCE_PASSWORD', 'default_password')
+# Hash bcrypt da senha (gravado no .env por generate_password.py), exigido pelas rotas /admin/*
+MAINTENANCE_PASSWORD_HASH = os.getenv('MAINTENANCE_PASSWORD_HASH', '')
+# Duração máxima de um diagnóstico sob demanda (/admin/profile/*); abaixo do timeout do gunicorn
+PROFILE_MAX_SECONDS = int(os.getenv('PROFILE_MAX_SECONDS', 60))
 
 # Configurações de performance do Dash
 DASH_CONFIG = {
@@ -19,6 +27,40 @@ DASH_CONFIG = {
     'update_title': 'Carregando...',
 }
 
+# Compressão das respostas do servidor (callbacks, layout, exportações CSV)
+COMPRESSION_ENABLED = os.getenv('COMPRESSION_ENABLED', 'true').lower() == 'true'
+COMPRESSION_MIN_SIZE = int(os.getenv('COMPRESSION_MIN_SIZE', 1024))  # Bytes
+COMPRESSION_LEVEL = int(os.getenv('COMPRESSION_LEVEL', 4))  # Nível do gzip (1-9); acima de 4 o ganho é pequeno e o custo de CPU dobra
+
+# Exportações completas geradas em segundo plano (callbacks background do Dash, fila em disco)
+BACKGROUND_CACHE_DIR = os.getenv('BACKGROUND_CACHE_DIR', 'cache/background')
+EXPORTS_DIR = os.getenv('EXPORTS_DIR', 'cache/exports')
+EXPORT_MAX_JOBS = int(os.getenv('EXPORT_MAX_JOBS', 2))  # Exportações simultâneas entre todos os workers
+
+# Pré-carregamento em segundo plano: threads por processo e pré-cálculo opcional das abas vizinhas
+PRELOAD_MAX_WORKERS = int(os.getenv('PRELOAD_MAX_WORKERS', 1))
+TAB_PREFETCH = os.getenv('TAB_PREFETCH', 'false').lower() == 'true'
+# Processos por worker para codificar Excel/CSV e ler parquet fora do GIL (offload.py); 0 executa na
+# própria thread. Útil com workers gthread (gunicorn.conf.py usa 1 nesse modo)
+OFFLOAD_PROCESSES = int(os.getenv('OFFLOAD_PROCESSES', 0))
+# Aquecimento na inicialização: dados do primeiro indicador de cada meta (0 desativa); o /readyz
+# só responde pronto depois dele
+WARMUP_MAX_INDICATORS = int(os.getenv('WARMUP_MAX_INDICATORS', 30))
+
+# Arquivos estáticos com hash no nome e pré-comprimidos, gerados por build_assets.py e servidos pelo nginx
+STATIC_BUILD_DIR = os.getenv('STATIC_BUILD_DIR', 'static_build')
+
+# Logging em fila (logging_setup.py): níveis por módulo ("cache_manager=WARNING,tracing=INFO"),
+# registros DEBUG por minuto de cada linha de código (0 = sem limite) e tamanho máximo da fila
+LOG_LEVELS = os.getenv('LOG_LEVELS', '')
+LOG_DEBUG_RATE = int(os.getenv('LOG_DEBUG_RATE', 20))
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', 10000))
+
+# Rastreamento dos callbacks (tracing.py): arquivo dos traces em OTLP/JSON (vazio desativa; ex.:
+# logs/traces.jsonl) e duração a partir da qual o callback gera o log de requisição lenta (0 desativa)
+TRACE_FILE = os.getenv('TRACE_FILE', '')
+SLOW_REQUEST_MS = int(os.getenv('SLOW_REQUEST_MS', 2000))
+
 # Configurações de cache do servidor
 SERVER_CONFIG = {
     'SEND_FILE_MAX_AGE_DEFAULT': 31536000,  # Cache de 1 ano para arquivos estáticos
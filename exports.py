@@ -0,0 +1,220 @@
+import glob
+import hashlib
+import io
+import json
+import logging
+import os
+from datetime import datetime
+from urllib.parse import urlencode
+
+import pandas as pd
+
+logger = logging.getLogger('exports')
+
+# Formatos aceitos pelo endpoint de exportação: extensão -> tipo MIME
+EXPORT_FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+# Ordem das colunas no arquivo exportado (campos CODG seguidos das descrições correspondentes)
+ORDERED_PAIRS = [
+    ['ID_INDICADOR'],
+    ['CODG_UND_FED', 'DESC_UND_FED'],
+    ['CODG_ANO'],
+    ['CODG_VAR', 'DESC_VAR'],
+    ['VLR_VAR'],
+    ['CODG_UND_MED', 'DESC_UND_MED']
+]
+
+
+def order_export_columns(df):
+    """
+    Reordena as colunas para agrupar os campos relacionados (CODG e DESC correspondentes).
+
+    Args:
+        df: DataFrame da tabela de detalhes
+
+    Returns:
+        DataFrame com as colunas reordenadas (o original não é alterado)
+    """
+    all_columns = list(df.columns)
+    fixed_columns = [col for pair in ORDERED_PAIRS for col in pair]
+
+    # Campos dinâmicos (outros CODG_ e DESC_ correspondentes)
+    dynamic_pairs = []
+    for col in all_columns:
+        if col.startswith('CODG_') and col not in fixed_columns:
+            desc_col = 'DESC_' + col[5:]
+            dynamic_pairs.append([col, desc_col] if desc_col in all_columns else [col])
+
+    ordered_columns = []
+    for pair in ORDERED_PAIRS + dynamic_pairs:
+        for col in pair:
+            if col in all_columns and col not in ordered_columns:
+                ordered_columns.append(col)
+
+    # Colunas restantes mantêm a ordem original
+    ordered_columns += [col for col in all_columns if col not in ordered_columns]
+    return df[ordered_columns]
+
+
+def to_csv_bytes(df):
+    """Gera o conteúdo CSV (UTF-8 com BOM, para abrir corretamente no Excel)."""
+    return df.to_csv(index=False).encode('utf-8-sig')
+
+
+def to_excel_bytes(df):
+    """
+    Gera o conteúdo do arquivo Excel (.xlsx) com a planilha 'Dados'.
+
+    Usa xlsxwriter para ajustar a largura das colunas; sem ele, recorre ao openpyxl.
+
+    Args:
+        df: DataFrame a exportar
+
+    Returns:
+        bytes do arquivo .xlsx
+    """
+    output = io.BytesIO()
+    try:
+        with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
+            df.to_excel(writer, sheet_name='Dados', index=False)
+            worksheet = writer.sheets['Dados']
+            for i, col in enumerate(df.columns):
+                # Largura da coluna: maior valor ou cabeçalho, com um espaço extra
+                valores = df[col].astype(str).map(len)
+                column_len = max(valores.max() if len(valores) else 0, len(str(col))) + 2
+                worksheet.set_column(i, i, column_len)
+    except ImportError:
+        output = io.BytesIO()
+        with pd.ExcelWriter(output, engine='openpyxl') as writer:
+            df.to_excel(writer, sheet_name='Dados', index=False)
+        logger.info("Usando engine openpyxl para Excel (sem auto-ajuste de colunas)")
+    return output.getvalue()
+
+
+def _indicador_formatado(indicador_id):
+    """ID do indicador sem espaços e com pontos trocados por '_' (usado em nomes de arquivo)."""
+    return str(indicador_id).replace(' ', '').replace('.', '_')
+
+
+def export_filename(indicador_id, formato, completo=False):
+    """Nome do arquivo: indicador sem espaços, pontos trocados por '_', sufixo '_full' e data/hora."""
+    indicador_formatado = _indicador_formatado(indicador_id)
+    sufixo = '_full' if completo else ''
+    return f'{indicador_formatado}{sufixo}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.{formato}'
+
+
+def build_export_url(indicador_id, formato, selected_var=None, filters_key=None, completo=False):
+    """
+    Monta a URL do endpoint de exportação para uma seleção.
+
+    Args:
+        indicador_id: ID do indicador
+        formato: 'csv' ou 'xlsx'
+        selected_var: Código da variável selecionada
+        filters_key: Tupla ordenada de pares (coluna, valor) dos filtros (ver make_filters_key)
+        completo: Se True, exporta todos os dados do indicador (a seleção é ignorada)
+
+    Returns:
+        str: Caminho com a query string da seleção
+    """
+    params = {'indicador': indicador_id}
+    if completo:
+        params['completo'] = '1'
+        return f'/exportar/{formato}?{urlencode(params)}'
+    if selected_var is not None:
+        params['var'] = str(selected_var).strip()
+    if filters_key:
+        params['filtros'] = json.dumps([list(pair) for pair in filters_key], separators=(',', ':'))
+    return f'/exportar/{formato}?{urlencode(params)}'
+
+
+def parse_export_args(args):
+    """
+    Lê a seleção da query string do endpoint de exportação.
+
+    Args:
+        args: request.args do Flask
+
+    Returns:
+        Tupla (indicador_id, selected_var, filters_key, completo)
+
+    Raises:
+        ValueError: Se o indicador não for informado ou os filtros forem inválidos
+    """
+    indicador_id = args.get('indicador')
+    if not indicador_id:
+        raise ValueError("Indicador não informado")
+    if args.get('completo') == '1':
+        return indicador_id, None, (), True
+    selected_var = args.get('var') or None
+    filtros = json.loads(args.get('filtros') or '[]')
+    if not isinstance(filtros, list) or not all(isinstance(p, list) and len(p) == 2 for p in filtros):
+        raise ValueError("Filtros inválidos")
+    filters_key = tuple(sorted((str(col), str(val).strip()) for col, val in filtros))
+    return indicador_id, selected_var, filters_key, False
+
+
+def _versao(data_version):
+    """Identificador curto da versão dos dados usado nos nomes dos arquivos."""
+    return hashlib.sha1(repr(data_version).encode()).hexdigest()[:12]
+
+
+def full_export_path(export_dir, indicador_id, formato, data_version):
+    """Caminho do arquivo gerado com todos os dados do indicador para uma versão dos dados."""
+    return os.path.join(export_dir, f'{_indicador_formatado(indicador_id)}_full_{_versao(data_version)}.{formato}')
+
+
+def remove_old_exports(export_dir, data_version):
+    """
+    Remove os arquivos completos gerados para outras versões dos dados.
+
+    O diretório é compartilhado pelos workers e pelos processos dos callbacks em segundo plano:
+    os arquivos da versão atual e os temporários ainda em gravação são mantidos.
+
+    Args:
+        export_dir: Diretório das exportações
+        data_version: Versão atual dos dados (get_data_version)
+    """
+    atual = _versao(data_version)
+    removidos = 0
+    for path in glob.glob(os.path.join(glob.escape(export_dir), '*_full_*')):
+        nome, extensao = os.path.splitext(os.path.basename(path))
+        if extensao[1:] not in EXPORT_FORMATS or nome.rsplit('_full_', 1)[1] == atual:
+            continue
+        try:
+            os.remove(path)
+            removidos += 1
+        except OSError:
+            logger.debug("Não foi possível remover exportação antiga: %s", path)
+    if removidos:
+        logger.info("Exportações de versões anteriores removidas: %d", removidos)
+
+
+def save_export_file(path, content):
+    """
+    Grava o arquivo de exportação de forma atômica e remove as versões anteriores.
+
+    Outros processos nunca veem um arquivo pela metade: o conteúdo é gravado em um arquivo
+    temporário e movido para o destino.
+
+    Args:
+        path: Caminho gerado por full_export_path
+        content: bytes do arquivo
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporario = f'{path}.{os.getpid()}.tmp'
+    with open(temporario, 'wb') as f:
+        f.write(content)
+    os.replace(temporario, path)
+
+    # Arquivos do mesmo indicador e formato gerados para versões anteriores dos dados
+    prefixo = path.rsplit('_full_', 1)[0]
+    for antigo in glob.glob(f'{glob.escape(prefixo)}_full_*.{path.rsplit(".", 1)[1]}'):
+        if antigo != path:
+            try:
+                os.remove(antigo)
+            except OSError:
+                logger.debug("Não foi possível remover exportação antiga: %s", antigo)
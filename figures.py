@@ -0,0 +1,346 @@
+import json
+import logging
+import pkgutil
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+import plotly.io as pio
+
+logger = logging.getLogger('figures')
+
+GEOJSON_PATH = 'db/br_geojson.json'
+# Template do Plotly aplicado a todas as figuras
+PLOTLY_TEMPLATE = 'plotly_white'
+
+# Cores fixas das UFs nos gráficos de série (as demais usam a paleta do template)
+UF_COLORS = {
+    'Goiás': '#229846', 'Maranhão': '#D2B48C', 'Distrito Federal': '#636efa',
+    'Mato Grosso': '#ab63fa', 'Mato Grosso do Sul': '#ffa15a', 'Rondônia': '#19d3f3',
+    'Tocantins': '#ff6692', 'Brasil': '#FF0000'
+}
+COR_PADRAO = '#229846'
+COR_GOIAS = 'rgba(34, 152, 70, 1)'
+COR_OUTRAS = 'rgba(34, 152, 70, 0.2)'
+MAP_CENTER = {'lat': -12.95984198, 'lon': -53.27299730}
+MAP_COLORSCALE = [[0.0, COR_OUTRAS], [1.0, COR_GOIAS]]
+
+# Layout padrão dos gráficos de série (linha e barras por ano)
+DEFAULT_LAYOUT = {
+    'showlegend': True,
+    'legend': dict(
+        title=None,
+        orientation="h",  # Legenda horizontal
+        yanchor="top",
+        y=1.2,  # Posiciona abaixo do gráfico
+        xanchor="center",
+        x=0.5  # Centraliza horizontalmente
+    ),
+    'margin': dict(l=20, r=20, t=40, b=100),  # Ajusta margens para acomodar a legenda
+    'xaxis': dict(showgrid=False, zeroline=False),
+    'yaxis': dict(showgrid=False, zeroline=False),
+    'xaxis_automargin': True,
+    'yaxis_automargin': True
+}
+
+_TICKFONT = dict(size=12, color='black')
+
+
+def format_br(value):
+    """Formats a number to Brazilian standard (dot for thousands, comma for decimal).
+       Shows integer if no significant decimal part, otherwise shows up to 2 decimals,
+       removing trailing zeros.
+    """
+    if pd.isna(value) or value is None:
+        return ""
+    try:
+        f_value = float(value)
+        # Check if it's effectively an integer
+        if f_value == int(f_value):
+            # Format as integer with thousands separators
+            int_str = f"{int(f_value):,}".replace(",", ".")
+            return int_str
+        else:
+            # Format as float with 2 decimal places first for consistent rounding
+            formatted_str = f"{f_value:.2f}"  # e.g., "1459.89", "15.00", "4.90"
+            int_part, dec_part = formatted_str.split('.')
+
+            # Format integer part with dots
+            int_part_formatted = f"{int(int_part):,}".replace(",", ".")
+
+            # Only add decimal part if it's not "00"
+            if dec_part == "00":
+                return int_part_formatted
+            else:
+                # Remove trailing zeros from decimal part *before* combining
+                dec_part = dec_part.rstrip('0')  # "89" -> "89", "90" -> "9"
+                # Handle cases like "4.0" which become "4," -> should be "4"
+                if not dec_part:  # If rstrip removed everything (e.g., was "00")
+                    return int_part_formatted  # Return only integer part
+                return f"{int_part_formatted},{dec_part}"
+
+    except (ValueError, TypeError):
+        logger.warning("Could not format value '%s' to Brazilian standard.", value)
+        return str(value)  # Fallback
+
+
+@lru_cache(maxsize=None)
+def get_template():
+    """
+    Template das figuras serializado uma única vez (compartilhado entre figuras; não alterar).
+
+    Os templates embutidos são lidos direto do JSON do pacote plotly (~1 ms): passar pelo
+    pio.templates valida o template inteiro, o que custava ~150 ms na inicialização.
+    """
+    try:
+        return json.loads(pkgutil.get_data('plotly', f'package_data/templates/{PLOTLY_TEMPLATE}.json'))
+    except (OSError, ValueError):
+        return pio.templates[PLOTLY_TEMPLATE].to_plotly_json()
+
+
+@lru_cache(maxsize=1)
+def load_geojson():
+    """Carrega o GeoJSON das UFs uma única vez por processo (compartilhado entre figuras; não alterar)."""
+    with open(GEOJSON_PATH, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _series_layout(chart_type, showlegend):
+    """Layout base (validado pelo Plotly) dos gráficos de série."""
+    layout = DEFAULT_LAYOUT.copy()
+    if chart_type == 'line':
+        layout.update({
+            'xaxis': dict(showgrid=True, zeroline=False, tickfont=_TICKFONT, tickangle=45),
+            'yaxis': dict(showgrid=True, zeroline=False, tickfont=_TICKFONT, title=None,
+                          type='linear', tickformat='d')
+        })
+    else:
+        layout.update({
+            'xaxis': dict(showgrid=True, tickfont=_TICKFONT, tickangle=45, title=None),
+            'yaxis': dict(showgrid=True, tickfont=_TICKFONT, title=None, type='linear', tickformat='d')
+        })
+        if showlegend:
+            layout['barmode'] = 'group'
+    if not showlegend:
+        layout['showlegend'] = False
+    return go.Layout(layout).to_plotly_json()
+
+
+@lru_cache(maxsize=None)
+def _base_layouts():
+    """
+    Layouts e traces base validados pelo Plotly uma única vez por processo.
+
+    As figuras são montadas como dicionários a partir destas bases, atribuindo apenas os
+    arrays de dados, sem passar novamente pela validação de go.Figure a cada renderização.
+    """
+    bases = {
+        ('line', True): _series_layout('line', True),
+        ('line', False): _series_layout('line', False),
+        ('bar', True): _series_layout('bar', True),
+        ('bar', False): _series_layout('bar', False),
+        'ranking': go.Layout(
+            xaxis_title=None, yaxis_title=None,
+            yaxis=dict(showgrid=False, tickfont=_TICKFONT, categoryorder='array'),
+            xaxis=dict(showgrid=True, zeroline=False, tickfont=_TICKFONT, tickformat='d'),
+            showlegend=False, margin=dict(l=150, r=20, t=30, b=30), bargap=0.1
+        ).to_plotly_json(),
+        'map': go.Layout(
+            geo=dict(
+                domain=dict(x=[0.0, 1.0], y=[0.0, 1.0]),
+                visible=False, showcoastlines=True, coastlinecolor="White",
+                showland=True, landcolor="white", showframe=False,
+                projection=dict(type='mercator', scale=15), center=MAP_CENTER
+            ),
+            coloraxis=dict(colorbar=dict(title=dict(text='')), colorscale=MAP_COLORSCALE),
+            legend=dict(tracegroupgap=0), margin=dict(t=60)
+        ).to_plotly_json(),
+        'scatter_uf': go.Scatter(
+            mode='lines+markers+text', texttemplate='%{text}', textposition='top center',
+            textfont=dict(size=10), marker=dict(size=10, symbol='circle', line=dict(width=1, color='white'))
+        ).to_plotly_json(),
+        'scatter': go.Scatter(mode='lines+markers+text', name='Valor').to_plotly_json(),
+        'bar_uf': go.Bar(texttemplate='%{text}', textposition='outside').to_plotly_json(),
+        'bar': go.Bar().to_plotly_json(),
+        'bar_ranking': go.Bar(orientation='h', textposition='outside').to_plotly_json(),
+        'choropleth': go.Choropleth(
+            coloraxis='coloraxis', featureidkey='properties.name', geo='geo', name='',
+            marker=dict(line=dict(color='white', width=1))
+        ).to_plotly_json(),
+    }
+    logger.debug("Bases de figuras validadas: %s", list(bases))
+    return bases
+
+
+def _figure(data, layout):
+    """Figura como dicionário, com o template padrão compartilhado."""
+    return {'data': data, 'layout': {**layout, 'template': get_template()}}
+
+
+def message_figure(title):
+    """Figura vazia com uma mensagem no título e eixos ocultos."""
+    return _figure([], {'title': {'text': title}, 'xaxis': {'visible': False}, 'yaxis': {'visible': False}})
+
+
+def annotation_figure(text):
+    """Figura compacta (alerta) com o texto centralizado como anotação."""
+    return _figure([], {
+        'annotations': [{
+            'align': 'center', 'font': {'size': 12}, 'showarrow': False, 'text': text,
+            'x': 0.5, 'xref': 'paper', 'y': 0.5, 'yref': 'paper'
+        }],
+        'xaxis': {'visible': False}, 'yaxis': {'visible': False},
+        'margin': {'t': 20, 'b': 20, 'l': 20, 'r': 20}, 'height': 200
+    })
+
+
+def _year_ticks(layout, anos, valores):
+    """Completa o layout base com os anos no eixo X e a faixa do eixo Y."""
+    anos = sorted(pd.unique(anos))
+    layout = dict(layout)
+    layout['xaxis'] = {**layout['xaxis'], 'ticktext': [f"<b>{x}</b>" for x in anos], 'tickvals': anos}
+    layout['yaxis'] = {**layout['yaxis'], 'range': [0, valores.max() * 1.15]}
+    return layout
+
+
+def series_figure(df_filtered, chart_type='line'):
+    """
+    Gráfico principal por ano: linhas (ou barras agrupadas) por UF, ou uma única série sem UF.
+
+    Args:
+        df_filtered: DataFrame filtrado com CODG_ANO (texto), VLR_VAR numérico e DESC_UND_MED
+        chart_type: 'line' para linhas ou 'bar' para barras agrupadas por ano
+
+    Returns:
+        dict: Figura pronta para o dcc.Graph
+    """
+    bases = _base_layouts()
+    by_uf = 'DESC_UND_FED' in df_filtered.columns
+    if chart_type == 'line':
+        sort_cols = ['DESC_UND_FED', 'CODG_ANO'] if by_uf else 'CODG_ANO'
+    else:
+        sort_cols = ['CODG_ANO', 'DESC_UND_FED'] if by_uf else 'CODG_ANO'
+    df_data = df_filtered.sort_values(sort_cols)
+    if df_data.empty:
+        titulo = 'gráfico de linha' if chart_type == 'line' else (
+            'gráfico de barras agrupado' if by_uf else 'gráfico de barras')
+        return message_figure(f'Dados insuficientes para o {titulo}.')
+
+    valores = df_data['VLR_VAR']
+    textos = valores.map(format_br)
+    traces = []
+    if by_uf:
+        hovertemplate = (
+            "<b>%{customdata[0]}</b><br>"
+            "Ano: %{x}<br>"
+            "Valor: %{customdata[3]}<br>"
+            "Unidade: %{customdata[1]}<extra></extra>"
+        )
+        base_trace = bases['scatter_uf'] if chart_type == 'line' else bases['bar_uf']
+        for uf, posicoes in df_data.groupby('DESC_UND_FED', sort=False).indices.items():
+            df_state = df_data.iloc[posicoes]
+            textos_uf = textos.iloc[posicoes]
+            customdata = np.column_stack((
+                np.full(len(df_state), uf), df_state['DESC_UND_MED'].values,
+                df_state['VLR_VAR'].values, textos_uf.values
+            ))
+            trace = {
+                **base_trace,
+                'x': df_state['CODG_ANO'], 'y': df_state['VLR_VAR'],
+                'name': f"<b>{uf}</b>" if uf == 'Goiás' else uf,
+                'customdata': customdata, 'text': textos_uf, 'hovertemplate': hovertemplate
+            }
+            color = UF_COLORS.get(uf)
+            if chart_type == 'line':
+                line = {'width': 6 if uf == 'Goiás' else 2}
+                if color:
+                    line['color'] = color
+                trace['line'] = line
+            else:
+                trace['marker'] = {'line': {'width': 1.5}, **({'color': color} if color else {})}
+            traces.append(trace)
+    else:
+        hovertemplate = (
+            "Ano: %{x}<br>"
+            "Valor: %{customdata[2]}<br>"
+            "Unidade: %{customdata[0]}<extra></extra>"
+        )
+        if chart_type == 'line':
+            customdata = np.column_stack((df_data['DESC_UND_MED'].values, valores.values, textos.values))
+            traces.append({
+                **bases['scatter'], 'x': df_data['CODG_ANO'], 'y': valores, 'customdata': customdata,
+                'text': textos, 'line': {'color': COR_PADRAO, 'width': 3}, 'hovertemplate': hovertemplate
+            })
+        else:
+            traces.append({
+                **bases['bar'], 'x': df_data['CODG_ANO'], 'y': valores,
+                'marker': {'color': COR_PADRAO}, 'hovertemplate': hovertemplate
+            })
+
+    layout = _year_ticks(bases[(chart_type, by_uf)], df_data['CODG_ANO'], valores)
+    return _figure(traces, layout)
+
+
+def ranking_figure(df_ranking):
+    """
+    Ranking horizontal das UFs (uma barra por UF), destacando Goiás.
+
+    Args:
+        df_ranking: DataFrame de um único ano, já ordenado, com DESC_UND_FED, VLR_VAR e DESC_UND_MED
+
+    Returns:
+        dict: Figura pronta para o dcc.Graph
+    """
+    bases = _base_layouts()
+    ufs = df_ranking['DESC_UND_FED'].tolist()
+    valores = df_ranking['VLR_VAR'].tolist()
+    if 'DESC_UND_MED' in df_ranking.columns:
+        unidades = df_ranking['DESC_UND_MED'].tolist()
+    else:
+        unidades = ['N/D'] * len(ufs)
+
+    traces = []
+    for uf, valor, und_med in zip(ufs, valores, unidades):
+        text_value = format_br(valor)
+        traces.append({
+            **bases['bar_ranking'],
+            'y': [uf], 'x': [valor], 'name': uf,
+            'marker': {'color': COR_GOIAS if uf == 'Goiás' else COR_OUTRAS},
+            'text': text_value,
+            'hovertemplate': (
+                f"<b>{uf}</b><br>"
+                f"Valor: {text_value}<br>"
+                f"Unidade: {und_med}<extra></extra>"
+            )
+        })
+
+    layout = dict(bases['ranking'])
+    layout['yaxis'] = {**layout['yaxis'], 'categoryarray': ufs}
+    layout['xaxis'] = {**layout['xaxis'], 'range': [0, (max(valores) if valores else 0) * 1.15]}
+    return _figure(traces, layout)
+
+
+def choropleth_figure(df_map):
+    """
+    Mapa coroplético das UFs (GeoJSON compartilhado, carregado uma única vez).
+
+    Args:
+        df_map: DataFrame de um único ano com DESC_UND_FED, VLR_VAR e DESC_UND_MED
+
+    Returns:
+        dict: Figura pronta para o dcc.Graph
+    """
+    bases = _base_layouts()
+    unidades = df_map['DESC_UND_MED'].dropna()
+    und_med_map = unidades.iloc[0] if not unidades.empty else ''
+    trace = {
+        **bases['choropleth'],
+        'geojson': load_geojson(),
+        'locations': df_map['DESC_UND_FED'].values,
+        'z': df_map['VLR_VAR'].values,
+        'customdata': [[texto] for texto in df_map['VLR_VAR'].map(format_br)],
+        'hovertemplate': "<b>%{location}</b><br>Valor: %{customdata[0]}" + (
+            f" {und_med_map}" if und_med_map else "") + "<extra></extra>"
+    }
+    return _figure([trace], bases['map'])
@@ -0,0 +1,265 @@
+import logging
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger('filter_index')
+
+
+def normalize_codes(series):
+    """
+    Normaliza uma coluna de códigos para comparação como texto (mesma regra dos filtros do painel).
+
+    Valores ausentes continuam ausentes (NaN) em vez de virar o texto 'nan': não entram nas
+    opções dos filtros e nunca coincidem com uma seleção, como no dropna() dos filtros.
+    """
+    return series.astype(str).str.strip().where(series.notna())
+
+
+class FilterLattice:
+    """
+    Reticulado das combinações (variável, filtros) presentes nos dados de um indicador.
+
+    É calculado em uma única passagem (groupby) e guarda, para cada combinação, a quantidade
+    de linhas e se existe algum valor diferente de zero. As buscas pela seleção inicial e as
+    verificações de "combinação sem dados" viram consultas em dicionário.
+    """
+    def __init__(self, df_dados, filter_cols):
+        """
+        Constrói o reticulado.
+
+        Args:
+            df_dados: DataFrame com os dados do indicador
+            filter_cols: Lista de colunas que são filtros dinâmicos
+        """
+        self.filter_cols = [col for col in filter_cols if col in df_dados.columns]
+        self.has_var = 'CODG_VAR' in df_dados.columns
+        key_cols = ['CODG_VAR'] + self.filter_cols
+
+        keys = pd.DataFrame({
+            col: normalize_codes(df_dados[col]) if col in df_dados.columns else ''
+            for col in key_cols
+        }, index=df_dados.index)
+        # Sem VLR_VAR não há como distinguir zeros: toda linha conta como dado válido
+        if 'VLR_VAR' in df_dados.columns:
+            keys['_nao_zero'] = (df_dados['VLR_VAR'] != 0).values
+        else:
+            keys['_nao_zero'] = True
+
+        # dropna=False: linhas com filtro ausente contam nos totais, mas não viram opção (ver _aggregate)
+        grouped = keys.groupby(key_cols, sort=True, dropna=False).agg(
+            linhas=('_nao_zero', 'size'), nao_zero=('_nao_zero', 'any')
+        ).reset_index()
+        self._grouped = grouped
+
+        # Combinações completas (com e sem a variável)
+        self._combos = {
+            tuple(row[:-2]): (int(row[-2]), bool(row[-1]))
+            for row in grouped.itertuples(index=False, name=None)
+        }
+        self._combos_any_var = self._aggregate(self.filter_cols, lambda k: k)
+
+        # Marginais por variável e por (variável, filtro, valor)
+        self._by_var = self._aggregate(['CODG_VAR'], lambda k: k[0])
+        total = (int(grouped['linhas'].sum()), bool(grouped['nao_zero'].any()))
+        self._by_var[None] = total
+        self._by_value = {}
+        self._values = {}
+        for col in self.filter_cols:
+            for (var, val), stats in self._aggregate(['CODG_VAR', col], lambda k: k).items():
+                self._by_value[(var, col, val)] = stats
+                self._values.setdefault((var, col), []).append(val)
+            for val, stats in self._aggregate([col], lambda k: k[0]).items():
+                self._by_value[(None, col, val)] = stats
+                self._values.setdefault((None, col), []).append(val)
+
+        logger.debug("Reticulado de filtros: %d combinações, filtros=%s", len(self._combos), self.filter_cols)
+
+    def _aggregate(self, cols, make_key):
+        """Agrega linhas/valores não-zero das combinações pelas colunas informadas."""
+        if not cols:
+            return {(): (int(self._grouped['linhas'].sum()), bool(self._grouped['nao_zero'].any()))}
+        agg = self._grouped.groupby(cols, sort=True).agg(linhas=('linhas', 'sum'), nao_zero=('nao_zero', 'any'))
+        result = {}
+        for key, linhas, nao_zero in agg.itertuples(index=True, name=None):
+            key = key if isinstance(key, tuple) else (key,)
+            result[make_key(key)] = (int(linhas), bool(nao_zero))
+        return result
+
+    def _var_key(self, var_value):
+        if var_value is None or not self.has_var:
+            return None
+        return str(var_value).strip()
+
+    def stats(self, var_value=None, filters=None):
+        """
+        Retorna (linhas, tem_valor_nao_zero) para a variável e os filtros informados.
+
+        Args:
+            var_value: Código da variável (None considera todas as variáveis)
+            filters: Dicionário {coluna: valor}; colunas fora dos filtros do indicador são ignoradas
+
+        Returns:
+            Tupla (quantidade de linhas, se algum VLR_VAR é diferente de zero)
+        """
+        var_key = self._var_key(var_value)
+        active = {
+            col: str(val).strip() for col, val in (filters or {}).items()
+            if val is not None and col in self.filter_cols
+        }
+        if not active:
+            return self._by_var.get(var_key, (0, False))
+        if len(active) == 1:
+            (col, val), = active.items()
+            return self._by_value.get((var_key, col, val), (0, False))
+        if len(active) == len(self.filter_cols):
+            vals = tuple(active[col] for col in self.filter_cols)
+            if var_key is None:
+                return self._combos_any_var.get(vals, (0, False))
+            return self._combos.get((var_key,) + vals, (0, False))
+
+        # Combinação parcial com mais de um filtro: agrega sobre o reticulado (pequeno)
+        mask = pd.Series(True, index=self._grouped.index)
+        if var_key is not None:
+            mask &= self._grouped['CODG_VAR'] == var_key
+        for col, val in active.items():
+            mask &= self._grouped[col] == val
+        subset = self._grouped[mask]
+        return int(subset['linhas'].sum()), bool(subset['nao_zero'].any())
+
+    def has_data(self, var_value=None, filters=None):
+        """Indica se a combinação tem linhas e ao menos um valor diferente de zero."""
+        linhas, nao_zero = self.stats(var_value, filters)
+        return linhas > 0 and nao_zero
+
+    def values(self, col, var_value=None):
+        """Retorna os valores (ordenados) do filtro presentes nos dados da variável."""
+        return list(self._values.get((self._var_key(var_value), col), []))
+
+
+def _to_bitset(mask):
+    """Converte uma máscara booleana em um bitset (int do Python, bit i = linha i)."""
+    packed = np.packbits(np.asarray(mask, dtype=bool), bitorder='little')
+    return int.from_bytes(packed.tobytes(), 'little')
+
+
+class FilterBitmapIndex:
+    """
+    Índice invertido valor → conjunto de linhas (bitset) para a variável e os filtros de um indicador.
+
+    Permite calcular, com operações AND entre inteiros, quais opções de cada filtro continuam
+    tendo dados dadas as seleções atuais dos demais filtros, sem tocar no DataFrame.
+    """
+    def __init__(self, df_dados, filter_cols):
+        """
+        Constrói o índice.
+
+        Args:
+            df_dados: DataFrame com os dados do indicador
+            filter_cols: Lista de colunas que são filtros dinâmicos
+        """
+        self.filter_cols = [col for col in filter_cols if col in df_dados.columns]
+        self.n_rows = len(df_dados)
+        self.all_rows = (1 << self.n_rows) - 1
+
+        self.bitmaps = {}
+        index_cols = (['CODG_VAR'] if 'CODG_VAR' in df_dados.columns else []) + self.filter_cols
+        for col in index_cols:
+            codes, uniques = pd.factorize(normalize_codes(df_dados[col]), sort=True)
+            self.bitmaps[col] = {val: _to_bitset(codes == i) for i, val in enumerate(uniques)}
+
+        # Linhas com valor diferente de zero (sem VLR_VAR todas contam como válidas)
+        if 'VLR_VAR' in df_dados.columns:
+            self.nonzero = _to_bitset((df_dados['VLR_VAR'] != 0).values)
+        else:
+            self.nonzero = self.all_rows
+
+        logger.debug("Índice bitmap: %d linhas, colunas=%s", self.n_rows, index_cols)
+
+    def rows(self, var_value=None, filters=None):
+        """
+        Retorna o bitset das linhas que atendem à variável e aos filtros.
+
+        Args:
+            var_value: Código da variável (None considera todas as variáveis)
+            filters: Dicionário {coluna: valor}; colunas fora do índice são ignoradas
+
+        Returns:
+            Inteiro cujo bit i indica se a linha i foi selecionada
+        """
+        bits = self.all_rows
+        if var_value is not None and 'CODG_VAR' in self.bitmaps:
+            bits &= self.bitmaps['CODG_VAR'].get(str(var_value).strip(), 0)
+        for col, val in (filters or {}).items():
+            if val is None or col not in self.filter_cols:
+                continue
+            bits &= self.bitmaps[col].get(str(val).strip(), 0)
+        return bits
+
+    def positions(self, bits):
+        """Converte um bitset nas posições (ordenadas) das linhas selecionadas."""
+        if not bits:
+            return np.empty(0, dtype=np.intp)
+        raw = np.frombuffer(bits.to_bytes((self.n_rows + 7) // 8, 'little'), dtype=np.uint8)
+        return np.flatnonzero(np.unpackbits(raw, bitorder='little')[:self.n_rows])
+
+    def valid_values(self, col, var_value=None, selections=None):
+        """
+        Retorna os valores do filtro que ainda têm dados não-zeros dadas as demais seleções.
+
+        Args:
+            col: Coluna do filtro cujas opções serão avaliadas
+            var_value: Código da variável selecionada
+            selections: Dicionário {coluna: valor} com as seleções atuais (a própria coluna é ignorada)
+
+        Returns:
+            Conjunto com os valores (normalizados como texto) válidos
+        """
+        if col not in self.bitmaps:
+            return set()
+        others = {c: v for c, v in (selections or {}).items() if c != col}
+        base = self.rows(var_value, others) & self.nonzero
+        if not base:
+            return set()
+        return {val for val, bits in self.bitmaps[col].items() if bits & base}
+
+
+def select_rows(df_dados, selections, index=None):
+    """
+    Aplica seleções (coluna, valor) sem copiar o DataFrame, retornando as posições das linhas.
+
+    As comparações seguem a regra dos filtros do painel (texto sem espaços nas pontas). Colunas
+    presentes no índice bitmap são resolvidas com AND de bitsets; as demais com máscara booleana.
+
+    Args:
+        df_dados: DataFrame com os dados do indicador (não é modificado)
+        selections: Lista de pares (coluna, valor), aplicados em ordem
+        index: FilterBitmapIndex construído sobre df_dados (opcional)
+
+    Returns:
+        Tupla (posições das linhas selecionadas, coluna que esvaziou a seleção ou None)
+    """
+    empty = np.empty(0, dtype=np.intp)
+    if index is not None and index.n_rows != len(df_dados):
+        logger.warning("Índice bitmap desatualizado (%d linhas, DataFrame com %d); usando máscaras",
+                       index.n_rows, len(df_dados))
+        index = None
+
+    if index is not None:
+        bits = index.all_rows
+        for col, val in selections:
+            col_bitmaps = index.bitmaps.get(col)
+            if col_bitmaps is not None:
+                bits &= col_bitmaps.get(str(val).strip(), 0)
+            else:
+                bits &= _to_bitset((normalize_codes(df_dados[col]) == str(val).strip()).values)
+            if not bits:
+                return empty, col
+        return index.positions(bits), None
+
+    mask = np.ones(len(df_dados), dtype=bool)
+    for col, val in selections:
+        mask &= (normalize_codes(df_dados[col]) == str(val).strip()).values
+        if not mask.any():
+            return empty, col
+    return np.flatnonzero(mask), None
@@ -0,0 +1,119 @@
+import logging
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger('grid_rows')
+
+
+def _text_condition(series, condition):
+    """Máscara de uma condição do filtro de texto do AG Grid (sem diferenciar maiúsculas)."""
+    tipo = condition.get('type', 'contains')
+    if tipo == 'blank':
+        return series.isna() | (series.astype(str).str.strip() == '')
+    if tipo == 'notBlank':
+        return series.notna() & (series.astype(str).str.strip() != '')
+
+    valores = series.astype(str).str.lower()
+    termo = str(condition.get('filter') or '').lower()
+    if tipo == 'equals':
+        return valores == termo
+    if tipo == 'notEqual':
+        return valores != termo
+    if tipo == 'startsWith':
+        return valores.str.startswith(termo)
+    if tipo == 'endsWith':
+        return valores.str.endswith(termo)
+    if tipo == 'notContains':
+        return ~valores.str.contains(termo, regex=False)
+    return valores.str.contains(termo, regex=False)
+
+
+def _number_condition(series, condition):
+    """Máscara de uma condição do filtro numérico do AG Grid."""
+    tipo = condition.get('type', 'equals')
+    valores = pd.to_numeric(series, errors='coerce')
+    if tipo == 'blank':
+        return valores.isna()
+    if tipo == 'notBlank':
+        return valores.notna()
+
+    termo = condition.get('filter')
+    if termo is None:
+        return pd.Series(True, index=series.index)
+    if tipo == 'notEqual':
+        return valores != termo
+    if tipo == 'lessThan':
+        return valores < termo
+    if tipo == 'lessThanOrEqual':
+        return valores <= termo
+    if tipo == 'greaterThan':
+        return valores > termo
+    if tipo == 'greaterThanOrEqual':
+        return valores >= termo
+    if tipo == 'inRange':
+        limite = condition.get('filterTo')
+        return (valores >= termo) & (valores <= limite) if limite is not None else valores >= termo
+    return valores == termo
+
+
+def _column_mask(series, model):
+    """Máscara do filtro de uma coluna, incluindo condições combinadas (AND/OR)."""
+    condicao = _number_condition if model.get('filterType') == 'number' else _text_condition
+    if 'conditions' in model:
+        mascaras = [np.asarray(condicao(series, c), dtype=bool) for c in model['conditions']]
+        if not mascaras:
+            return pd.Series(True, index=series.index)
+        combinar = np.logical_or if model.get('operator') == 'OR' else np.logical_and
+        return combinar.reduce(mascaras)
+    return condicao(series, model)
+
+
+def apply_filter_model(df, filter_model):
+    """
+    Aplica o filterModel do AG Grid (filtros de texto e numéricos) ao DataFrame.
+
+    Args:
+        df: DataFrame da tabela
+        filter_model: Dicionário {coluna: modelo do filtro} enviado pelo AG Grid
+
+    Returns:
+        DataFrame filtrado (o original não é alterado)
+    """
+    if not filter_model:
+        return df
+    mask = np.ones(len(df), dtype=bool)
+    for col, model in filter_model.items():
+        if col not in df.columns:
+            logger.debug("Filtro ignorado para coluna inexistente: %s", col)
+            continue
+        mask &= np.asarray(_column_mask(df[col], model), dtype=bool)
+    return df[mask]
+
+
+def apply_sort_model(df, sort_model):
+    """
+    Aplica o sortModel do AG Grid (lista de {colId, sort}) ao DataFrame.
+
+    Args:
+        df: DataFrame da tabela
+        sort_model: Lista de ordenações na ordem de prioridade
+
+    Returns:
+        DataFrame ordenado (o original não é alterado)
+    """
+    sort_model = [s for s in (sort_model or []) if s.get('colId') in df.columns]
+    if not sort_model:
+        return df
+    return df.sort_values(
+        [s['colId'] for s in sort_model],
+        ascending=[s.get('sort') != 'desc' for s in sort_model],
+        kind='stable', na_position='last'
+    )
+
+
+def page_rows(df, start_row, end_row):
+    """Retorna as linhas [start_row, end_row) como lista de registros para o AG Grid."""
+    start_row = max(int(start_row or 0), 0)
+    end_row = max(int(end_row or start_row), start_row)
+    return df.iloc[start_row:end_row].to_dict('records')
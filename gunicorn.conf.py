@@ -0,0 +1,162 @@
+"""
+Configuração do gunicorn (carregada automaticamente de ./gunicorn.conf.py).
+
+O app é importado uma única vez no master (preload_app): tabelas de metadados, árvore de
+navegação, layout pré-renderizado e aquecimento do cache ficam prontos antes do fork e os
+workers compartilham essas páginas de memória (copy-on-write). Antes do fork os objetos
+existentes são congelados (gc.freeze) para que a coleta de lixo dos workers não os toque e
+não force a cópia das páginas.
+
+Quantidade e classe dos workers seguem a cota de CPU e o limite de memória do container
+(cgroup), com ajuste por variáveis de ambiente:
+
+    GUNICORN_WORKERS         quantidade de workers (padrão: calculado)
+    GUNICORN_WORKER_CLASS    sync ou gthread (padrão: gthread com menos de 2 CPUs)
+    GUNICORN_THREADS         threads por worker gthread (padrão: 4)
+    GUNICORN_WORKER_MEMORY   memória estimada por worker em MiB (padrão: 300; medir com
+                             `python benchmark.py rss`)
+    GUNICORN_PRELOAD         false para importar o app em cada worker
+    GUNICORN_TIMEOUT         timeout dos workers em segundos (padrão: 120)
+    OFFLOAD_PROCESSES        processos por worker para Excel/CSV/parquet (padrão: 1 com
+                             gthread, 0 com sync; ver offload.py)
+    PROMETHEUS_MULTIPROC_DIR diretório das métricas compartilhadas pelos workers (padrão:
+                             /dev/shm/painel-ods-metricas; esvaziado na inicialização)
+"""
+import gc
+import math
+import os
+import shutil
+import tempfile
+
+
+def _read_first_line(path):
+    try:
+        with open(path) as f:
+            return f.readline().strip()
+    except OSError:
+        return None
+
+
+def cpu_quota():
+    """
+    CPUs disponíveis para o container: cota do cgroup (v2 ou v1) ou, sem cota, as CPUs do processo.
+
+    Returns:
+        float: Quantidade de CPUs (pode ser fracionária, ex.: 0.5 para limite de 500m)
+    """
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else (os.cpu_count() or 1)
+    # cgroup v2: "max 100000" ou "<cota> <período>"
+    linha = _read_first_line('/sys/fs/cgroup/cpu.max')
+    if linha:
+        cota, _, periodo = linha.partition(' ')
+        if cota != 'max':
+            return min(cpus, int(cota) / int(periodo))
+        return cpus
+    # cgroup v1: cota -1 significa sem limite
+    cota = _read_first_line('/sys/fs/cgroup/cpu/cpu.cfs_quota_us')
+    periodo = _read_first_line('/sys/fs/cgroup/cpu/cpu.cfs_period_us')
+    if cota and periodo and int(cota) > 0:
+        return min(cpus, int(cota) / int(periodo))
+    return cpus
+
+
+def memory_limit():
+    """
+    Limite de memória do container em bytes (cgroup v2 ou v1), ou None sem limite.
+    """
+    for path in ('/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory/memory.limit_in_bytes'):
+        linha = _read_first_line(path)
+        if linha and linha != 'max' and int(linha) < 2 ** 60:  # v1 usa um valor enorme para "sem limite"
+            return int(linha)
+    return None
+
+
+def worker_settings():
+    """
+    Quantidade de workers, classe e threads a partir da CPU e da memória do container.
+
+    Com menos de 2 CPUs, processos extras só disputam a mesma CPU e somam memória: usa 2
+    workers gthread (as threads cobrem a espera por disco e rede). Com mais CPUs, usa o
+    clássico 2 × CPUs + 1 workers sync. Em ambos os casos a quantidade é limitada para que
+    GUNICORN_WORKER_MEMORY × workers caiba em 80% do limite de memória.
+
+    Returns:
+        Tupla (workers, classe, threads)
+    """
+    cpus = cpu_quota()
+    classe = os.getenv('GUNICORN_WORKER_CLASS') or ('gthread' if cpus < 2 else 'sync')
+    threads = int(os.getenv('GUNICORN_THREADS', 4)) if classe == 'gthread' else 1
+
+    if os.getenv('GUNICORN_WORKERS'):
+        return int(os.getenv('GUNICORN_WORKERS')), classe, threads
+
+    quantidade = 2 if cpus < 2 else 2 * math.ceil(cpus) + 1
+    limite = memory_limit()
+    if limite:
+        por_worker = int(os.getenv('GUNICORN_WORKER_MEMORY', 300)) * 1024 * 1024
+        quantidade = min(quantidade, max(1, int(0.8 * limite // por_worker)))
+    return quantidade, classe, threads
+
+
+bind = f"{os.getenv('HOST', '0.0.0.0')}:{os.getenv('PORT', 8050)}"
+workers, worker_class, threads = worker_settings()
+if worker_class == 'gthread':
+    # Com threads, as etapas que seguram o GIL vão para o pool de processos de cada worker
+    # (definido antes de o app ser importado, pois config.py lê o ambiente na importação)
+    os.environ.setdefault('OFFLOAD_PROCESSES', '1')
+preload_app = os.getenv('GUNICORN_PRELOAD', 'true').lower() == 'true'
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 120))
+graceful_timeout = 30
+# Workers são reciclados aos poucos para limitar o crescimento de memória (fragmentação do pandas)
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 2000))
+max_requests_jitter = max_requests // 10
+loglevel = os.getenv('GUNICORN_LOG_LEVEL', 'info')
+# Evita que o heartbeat dos workers escreva no disco do container (overlay)
+worker_tmp_dir = '/dev/shm' if os.path.isdir('/dev/shm') else None
+
+# Métricas do Prometheus somadas entre os workers (metrics.py): o diretório precisa existir, vazio,
+# antes de o app ser importado; valores de uma execução anterior seriam somados aos novos
+METRICS_DIR = os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', os.path.join(
+    '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir(), 'painel-ods-metricas'))
+shutil.rmtree(METRICS_DIR, ignore_errors=True)
+os.makedirs(METRICS_DIR, exist_ok=True)
+
+# Tempo máximo que o master espera o aquecimento do cache antes de criar os workers
+WARMUP_TIMEOUT = int(os.getenv('GUNICORN_WARMUP_TIMEOUT', 60))
+
+
+def when_ready(server):
+    """Master pronto (app já importado com preload_app): espera o aquecimento e congela o heap."""
+    server.log.info("Workers: %d × %s (threads: %d, CPUs: %.2f, limite de memória: %s)",
+                    workers, worker_class, threads, cpu_quota(), memory_limit())
+    if not server.cfg.preload_app:
+        return
+    import app as painel
+
+    if not painel.readiness.wait(WARMUP_TIMEOUT):
+        server.log.warning("Aquecimento não terminou em %d s; os workers vão completá-lo", WARMUP_TIMEOUT)
+    # Tudo que existe agora (módulos, DataFrames de metadados, layout, cache aquecido) é só
+    # leitura nos workers: fora das gerações do GC, as páginas não são copiadas pela coleta
+    gc.collect()
+    gc.freeze()
+    server.log.info("Objetos congelados antes do fork: %d", gc.get_freeze_count())
+
+
+def post_fork(server, worker):
+    """Worker criado: inicia o pool de processos e completa o aquecimento se o master não terminou a tempo."""
+    import offload
+
+    offload.start()
+    if not server.cfg.preload_app:
+        return
+    import app as painel
+
+    if not painel.readiness.is_ready():
+        painel.warm_up()
+
+
+def child_exit(server, worker):
+    """Worker encerrado: remove os valores "live" dele das métricas."""
+    import metrics
+
+    metrics.mark_process_dead(worker.pid)
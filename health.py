@@ -0,0 +1,146 @@
+import logging
+import os
+import threading
+import time
+
+try:
+    import psutil
+except ImportError:  # Sem psutil o relatório usa o pico de memória do processo (resource)
+    psutil = None
+
+logger = logging.getLogger('health')
+
+# Início do carregamento do app (no master do gunicorn, com preload_app) e do processo atual
+PROCESS_START = WORKER_START = time.time()
+
+
+def _reset_worker_start():
+    global WORKER_START
+    WORKER_START = time.time()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_worker_start)
+
+
+class Readiness:
+    """
+    Etapas da inicialização que precisam terminar antes de o worker receber tráfego.
+
+    Cada etapa é marcada como pronta uma única vez (tabelas de metadados, manifesto de assets, layout,
+    aquecimento do cache). O estado é só deste processo: cada worker do gunicorn responde pelo
+    próprio aquecimento.
+    """
+    def __init__(self, steps):
+        """
+        Args:
+            steps: Nomes das etapas obrigatórias
+        """
+        self.steps = tuple(steps)
+        self._done = {}  # etapa -> detalhes
+        self._tracked = {}  # etapa -> Future da tarefa em segundo plano ainda não concluída
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    def _reset_after_fork(self):
+        """
+        No processo filho, esquece as tarefas acompanhadas pelo master.
+
+        As threads que executariam essas tarefas não existem no filho: os Futures nunca
+        terminariam e as etapas ficariam pendentes para sempre. Sem elas em _tracked, as etapas
+        voltam a aparecer em pending() e podem ser reenviadas (warm_up no post_fork).
+        """
+        self._lock = threading.Lock()
+        self._tracked = {}
+        if not self._ready.is_set():
+            self._ready = threading.Event()
+
+    def mark(self, step, **details):
+        """
+        Marca uma etapa como concluída.
+
+        Args:
+            step: Nome da etapa
+            **details: Informações exibidas no relatório (ex.: quantidade de itens carregados)
+        """
+        with self._lock:
+            self._tracked.pop(step, None)
+            if step in self._done:
+                return
+            self._done[step] = {'ready_after_s': round(time.time() - PROCESS_START, 3), **details}
+            pendentes = [s for s in self.steps if s not in self._done]
+            if not pendentes:
+                self._ready.set()
+        logger.info("Etapa de inicialização concluída: %s (pendentes: %s)", step, ', '.join(pendentes) or 'nenhuma')
+
+    def track(self, step, future, **details):
+        """
+        Marca a etapa quando uma tarefa em segundo plano terminar.
+
+        Uma tarefa com erro também conclui a etapa (com o erro no relatório): o aquecimento é
+        uma otimização e não deve impedir o worker de atender.
+
+        Args:
+            step: Nome da etapa
+            future: concurrent.futures.Future da tarefa
+            **details: Informações exibidas no relatório
+        """
+        def concluir(f):
+            erro = f.exception()
+            if erro is not None:
+                logger.warning("Etapa %s terminou com erro: %s", step, erro)
+                self.mark(step, error=str(erro), **details)
+            else:
+                self.mark(step, **details)
+        with self._lock:
+            self._tracked[step] = future
+        future.add_done_callback(concluir)
+
+    def pending(self):
+        """Etapas não concluídas e sem tarefa em andamento neste processo."""
+        with self._lock:
+            return [s for s in self.steps if s not in self._done and s not in self._tracked]
+
+    def is_ready(self):
+        """True quando todas as etapas obrigatórias foram concluídas."""
+        return all(step in self._done for step in self.steps)
+
+    def wait(self, timeout=None):
+        """
+        Espera todas as etapas terminarem (usado pelo master do gunicorn antes de criar os workers).
+
+        Args:
+            timeout: Tempo máximo de espera em segundos
+
+        Returns:
+            bool: True se ficou pronto dentro do prazo
+        """
+        return self._ready.wait(timeout)
+
+    def report(self):
+        """Estado de cada etapa: {'etapa': {'ready': bool, ...detalhes}}."""
+        with self._lock:
+            return {step: {'ready': step in self._done, **self._done.get(step, {})} for step in self.steps}
+
+
+def worker_stats():
+    """
+    Estatísticas do processo atual (worker do gunicorn).
+
+    Returns:
+        dict: pid, tempo desde o início, threads e memória residente
+    """
+    stats = {
+        'pid': os.getpid(),
+        'uptime_s': round(time.time() - WORKER_START, 1),
+        'threads': threading.active_count(),
+    }
+    if psutil is not None:
+        stats['rss_bytes'] = psutil.Process().memory_info().rss
+    else:
+        import resource
+        # ru_maxrss é o pico (em KiB no Linux), não o uso atual
+        stats['max_rss_bytes'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return stats
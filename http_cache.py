@@ -0,0 +1,313 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from email.utils import formatdate
+
+from flask import Response, request, send_from_directory
+
+try:
+    import brotli
+except ImportError:  # Brotli é opcional; sem ele as respostas usam apenas gzip
+    brotli = None
+
+logger = logging.getLogger('http_cache')
+
+# Tipos de conteúdo que valem a pena comprimir (figuras, rowData do grid, layout, CSV)
+COMPRESSIBLE_MIMETYPES = {
+    'application/json',
+    'application/javascript',
+    'text/html',
+    'text/css',
+    'text/csv',
+    'text/plain',
+}
+
+
+def _accepted_encodings():
+    """Codificações aceitas pelo cliente (Accept-Encoding), sem as marcadas com q=0."""
+    aceitas = set()
+    for item in request.headers.get('Accept-Encoding', '').split(','):
+        partes = [p.strip() for p in item.split(';')]
+        if not partes[0]:
+            continue
+        if any(p.replace(' ', '') in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000') for p in partes[1:]):
+            continue
+        aceitas.add(partes[0].lower())
+    return aceitas
+
+
+def compress_response(response, min_size=1024, level=4):
+    """
+    Comprime a resposta com brotli (se disponível e aceito pelo cliente) ou gzip.
+
+    Só comprime respostas 200 de tipos textuais acima do tamanho mínimo que ainda não
+    estejam codificadas; arquivos servidos em streaming (send_file) são mantidos como estão.
+
+    Args:
+        response: Resposta do Flask
+        min_size: Tamanho mínimo (bytes) para comprimir
+        level: Nível do gzip (1-9); o brotli usa uma qualidade equivalente para conteúdo dinâmico
+
+    Returns:
+        A mesma resposta, com o corpo comprimido quando aplicável
+    """
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    aceitas = _accepted_encodings()
+    if 'br' in aceitas and brotli is not None:
+        codificacao = 'br'
+    elif 'gzip' in aceitas:
+        codificacao = 'gzip'
+    else:
+        return response
+
+    dados = response.get_data()
+    if len(dados) < min_size:
+        return response
+
+    if codificacao == 'br':
+        # Qualidade um ponto abaixo do nível do gzip: mesma taxa de compressão com menos CPU
+        comprimido = brotli.compress(dados, quality=min(max(level - 1, 1), 11))
+    else:
+        comprimido = gzip.compress(dados, compresslevel=level, mtime=0)
+
+    response.set_data(comprimido)
+    response.headers['Content-Encoding'] = codificacao
+    # ETag de conteúdo não comprimido não vale para o corpo comprimido
+    etag, fraca = response.get_etag()
+    if etag and not fraca:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+class ConditionalCache:
+    """
+    ETag/Last-Modified para respostas que só mudam quando os dados mudam.
+
+    A ETag é o hash do corpo da primeira resposta gerada para cada versão dos dados; como o
+    conteúdo é determinístico, todos os workers chegam à mesma ETag. Requisições seguintes com
+    If-None-Match igual recebem 304 sem gerar a resposta de novo.
+    """
+    def __init__(self, paths, version_func):
+        """
+        Args:
+            paths: Caminhos atendidos (ex.: '/_dash-layout', '/_dash-dependencies')
+            version_func: Função sem argumentos que retorna a versão dos dados (tupla de
+                timestamps em nanossegundos, como navigation.get_data_version)
+        """
+        self.paths = set(paths)
+        self.version_func = version_func
+        self._etags = {}  # (caminho, versão) -> ETag
+
+    @staticmethod
+    def _last_modified(version):
+        """Data da última modificação (HTTP-date) a partir da versão dos dados."""
+        timestamps = [t for t in version if t is not None]
+        return formatdate(max(timestamps) / 1e9, usegmt=True) if timestamps else None
+
+    def before_request(self):
+        """Responde 304 quando o cliente já tem a versão atual (registrar em before_request)."""
+        if request.method != 'GET' or request.path not in self.paths:
+            return None
+        etag = self._etags.get((request.path, self.version_func()))
+        if etag and request.if_none_match.contains_weak(etag):
+            logger.debug("304 para %s (ETag %s)", request.path, etag)
+            return '', 304, {'ETag': f'"{etag}"', 'Cache-Control': 'no-cache'}
+        return None
+
+    def after_request(self, response):
+        """Adiciona ETag e Last-Modified às respostas atendidas (registrar em after_request)."""
+        if (request.method != 'GET' or request.path not in self.paths
+                or response.status_code != 200 or response.direct_passthrough):
+            return response
+        version = self.version_func()
+        chave = (request.path, version)
+        etag = self._etags.get(chave)
+        if etag is None:
+            etag = hashlib.sha1(repr(version).encode() + response.get_data()).hexdigest()[:20]
+            # Descarta ETags de versões anteriores dos dados
+            self._etags = {k: v for k, v in self._etags.items() if k[1] == version}
+            self._etags[chave] = etag
+        response.set_etag(etag)
+        last_modified = self._last_modified(version)
+        if last_modified:
+            response.headers['Last-Modified'] = last_modified
+        # Sempre revalida: a mesma URL muda quando os dados são atualizados
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+
+
+class PrerenderedResponse:
+    """
+    Resposta GET pré-renderizada uma vez por versão dos dados e servida da memória.
+
+    Guarda o corpo já serializado e suas versões comprimidas (gzip e, se disponível, brotli),
+    cada uma com ETag forte própria. A requisição só escolhe a representação pelo
+    Accept-Encoding e copia os bytes; a renderização só se repete quando os dados mudam.
+    """
+    def __init__(self, path, render_func, version_func, mimetype='application/json', level=9):
+        """
+        Args:
+            path: Caminho atendido (ex.: '/_dash-layout')
+            render_func: Função sem argumentos que retorna o corpo (bytes ou str)
+            version_func: Função sem argumentos que retorna a versão dos dados
+            mimetype: Tipo do conteúdo
+            level: Nível do gzip e qualidade do brotli usados na pré-compressão (comprimido uma
+                vez, pode ser alto)
+        """
+        self.path = path
+        self.render_func = render_func
+        self.version_func = version_func
+        self.mimetype = mimetype
+        self.level = level
+        self._rendered = None  # (versão, {codificação: (corpo, ETag)}, Last-Modified)
+        self._lock = threading.Lock()
+        if hasattr(os, 'register_at_fork'):
+            # A renderização pode estar em andamento em outra thread (warm_up) no momento do fork
+            os.register_at_fork(after_in_child=self._reset_lock)
+
+    def _reset_lock(self):
+        self._lock = threading.Lock()
+
+    def clear(self):
+        """Descarta a renderização atual (a próxima requisição renderiza de novo)."""
+        self._rendered = None
+
+    def render(self, version=None):
+        """
+        Renderiza e comprime o corpo para a versão dos dados, se ainda não estiver pronto.
+
+        Args:
+            version: Versão dos dados (padrão: a atual)
+
+        Returns:
+            Tupla (versão, representações, Last-Modified)
+        """
+        version = self.version_func() if version is None else version
+        rendered = self._rendered
+        if rendered is not None and rendered[0] == version:
+            return rendered
+        with self._lock:
+            rendered = self._rendered
+            if rendered is not None and rendered[0] == version:
+                return rendered
+            inicio = time.perf_counter()
+            corpo = self.render_func()
+            if isinstance(corpo, str):
+                corpo = corpo.encode('utf-8')
+            digest = hashlib.sha1(repr(version).encode() + corpo).hexdigest()[:20]
+            representacoes = {
+                'identity': (corpo, digest),
+                'gzip': (gzip.compress(corpo, compresslevel=self.level, mtime=0), f'{digest}-gz'),
+            }
+            if brotli is not None:
+                # A qualidade 11 custa ~1 s no layout para ganhar pouco sobre a 9
+                representacoes['br'] = (brotli.compress(corpo, quality=min(self.level, 9)), f'{digest}-br')
+            rendered = (version, representacoes, ConditionalCache._last_modified(version))
+            self._rendered = rendered
+            logger.info("%s pré-renderizado em %.0f ms (%s)", self.path,
+                        (time.perf_counter() - inicio) * 1000,
+                        ', '.join(f'{cod}={len(rep[0])}B' for cod, rep in representacoes.items()))
+            return rendered
+
+    def before_request(self):
+        """Serve a representação adequada da memória (registrar em before_request)."""
+        if request.method != 'GET' or request.path != self.path:
+            return None
+        _, representacoes, last_modified = self.render()
+        aceitas = _accepted_encodings()
+        if 'br' in aceitas and 'br' in representacoes:
+            codificacao = 'br'
+        elif 'gzip' in aceitas:
+            codificacao = 'gzip'
+        else:
+            codificacao = 'identity'
+        corpo, etag = representacoes[codificacao]
+
+        headers = {'ETag': f'"{etag}"', 'Cache-Control': 'no-cache', 'Vary': 'Accept-Encoding'}
+        if last_modified:
+            headers['Last-Modified'] = last_modified
+        if etag in request.if_none_match:
+            return Response(status=304, headers=headers)
+        if codificacao != 'identity':
+            headers['Content-Encoding'] = codificacao
+        return Response(corpo, mimetype=self.mimetype, headers=headers)
+
+
+class AssetManifest:
+    """
+    Nomes com hash do conteúdo para os arquivos de assets/ (gerados por build_assets.py).
+
+    A página inicial passa a referenciar os nomes com hash, que nunca mudam de conteúdo e podem
+    ser guardados pelo navegador por um ano sem revalidação. Em produção o nginx serve esses
+    arquivos direto de STATIC_BUILD_DIR; o before_request é a alternativa quando o app roda sem
+    o nginx na frente. Sem o manifesto (build não executado) tudo continua como antes.
+    """
+    MANIFEST_NAME = 'assets-manifest.json'
+    # Links gerados pelo Dash: /assets//clientside.js?m=1700000000.0
+    ASSET_URL_RE = re.compile(r'/assets/+([^"?\s]+)(?:\?m=[0-9.]+)?')
+    IMMUTABLE = 'public, max-age=31536000, immutable'
+
+    def __init__(self, build_dir):
+        """
+        Args:
+            build_dir: Diretório gerado por build_assets.py
+        """
+        self.assets_dir = os.path.abspath(os.path.join(build_dir, 'assets'))
+        self.manifest = {}
+        try:
+            with open(os.path.join(build_dir, self.MANIFEST_NAME), encoding='utf-8') as f:
+                self.manifest = json.load(f)
+            logger.info("Manifesto de assets carregado: %d arquivos", len(self.manifest))
+        except FileNotFoundError:
+            logger.info("Manifesto de assets não encontrado em %s; assets servidos sem hash", build_dir)
+        except (OSError, ValueError) as e:
+            logger.warning("Erro ao ler o manifesto de assets: %s", e)
+        self._fingerprinted = set(self.manifest.values())
+
+    def url(self, path):
+        """
+        URL de um arquivo de assets/, com hash no nome quando disponível.
+
+        Args:
+            path: Caminho relativo a assets/ (ex.: 'img/sgg.png')
+
+        Returns:
+            str: URL absoluta do arquivo
+        """
+        return f"/assets/{self.manifest.get(path, path)}"
+
+    def before_request(self):
+        """Serve os arquivos com hash quando o nginx não está na frente (registrar em before_request)."""
+        if request.method not in ('GET', 'HEAD') or not request.path.startswith('/assets/'):
+            return None
+        nome = request.path[len('/assets/'):]
+        if nome not in self._fingerprinted:
+            return None
+        response = send_from_directory(self.assets_dir, nome, max_age=31536000)
+        response.headers['Cache-Control'] = self.IMMUTABLE
+        return response
+
+    def after_request(self, response):
+        """
+        Troca os links de assets/ da página inicial pelos nomes com hash (registrar em
+        after_request, depois de compress_response para rodar antes da compressão).
+        """
+        if (request.method != 'GET' or response.status_code != 200 or response.mimetype != 'text/html'
+                or response.direct_passthrough or 'Content-Encoding' in response.headers):
+            return response
+        if self.manifest:
+            html = response.get_data(as_text=True)
+            response.set_data(self.ASSET_URL_RE.sub(lambda m: self.url(m.group(1)), html))
+        # A página muda a cada build; os arquivos que ela referencia é que ficam em cache
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
@@ -8,5 +8,5 @@ if ! whoami &> /dev/null; then
   fi
 fi
 
-# Inicia o Gunicorn
-exec gunicorn -w 4 -b 0.0.0.0:8050 app:server --timeout 120 
\ No newline at end of file
+# Inicia o Gunicorn (workers, preload e timeouts em gunicorn.conf.py)
+exec gunicorn -c gunicorn.conf.py app:server 
\ No newline at end of file
@@ -0,0 +1,190 @@
+"""
+Configuração do logging: fila em memória entre quem registra e quem grava no disco.
+
+As threads que atendem requisições só criam o LogRecord e o colocam na fila (QueueHandler); a
+formatação da mensagem (inclusive dos argumentos %s, como listas de colunas) e a escrita no
+arquivo e no console ficam com a thread do QueueListener. Com a fila cheia os registros são
+descartados e contados, em vez de bloquear a requisição.
+
+Também:
+- níveis por módulo (LOG_LEVELS, ex.: "cache_manager=WARNING,tracing=INFO");
+- limite de registros DEBUG por linha de código (LOG_DEBUG_RATE por minuto), para que os
+  logs de depuração dos caminhos quentes (callbacks, create_visualization) não dominem o
+  arquivo; a quantidade suprimida é informada no próximo registro da mesma linha;
+- rotas: registros de um logger gravados só em um arquivo próprio, com a mensagem crua
+  (usado pelos traces de tracing.py).
+
+No gunicorn com preload_app a thread do listener fica no master: depois do fork cada worker
+cria a própria fila e o próprio listener.
+"""
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+
+logger = logging.getLogger('logging_setup')
+
+_queue_handler = None
+_listener = None
+_handlers = ()
+
+
+class RateLimitFilter(logging.Filter):
+    """Deixa passar no máximo `rate` registros por minuto de cada linha de código, até `level`."""
+
+    def __init__(self, rate, level=logging.DEBUG, period=60.0):
+        super().__init__()
+        self.rate = rate
+        self.level = level
+        self.period = period
+        self._janelas = {}  # (arquivo, linha) -> [início da janela, registros, suprimidos]
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno > self.level:
+            return True
+        agora = time.monotonic()
+        chave = (record.pathname, record.lineno)
+        with self._lock:
+            janela = self._janelas.get(chave)
+            if janela is None or agora - janela[0] >= self.period:
+                suprimidos = janela[2] if janela else 0
+                self._janelas[chave] = [agora, 1, 0]
+            elif janela[1] < self.rate:
+                janela[1] += 1
+                suprimidos = 0
+            else:
+                janela[2] += 1
+                return False
+        if suprimidos:
+            record.msg = f"{record.msg} (+{suprimidos} registros suprimidos desta linha)"
+        return True
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler que não formata na thread de quem registra e descarta com a fila cheia."""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self._reported = 0
+
+    def prepare(self, record):
+        # Mesmo processo: o registro vai inteiro para a fila e o listener formata
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            return
+        if self.dropped != self._reported:
+            descartados, self._reported = self.dropped - self._reported, self.dropped
+            aviso = logger.makeRecord(logger.name, logging.WARNING, __file__, 0,
+                                      "%d registros de log descartados (fila cheia)", (descartados,), None)
+            try:
+                self.queue.put_nowait(aviso)
+            except queue.Full:
+                pass
+
+
+class _RouteFilter(logging.Filter):
+    """Separa os registros dos loggers roteados para arquivos próprios (incluir=True) dos demais."""
+
+    def __init__(self, names, incluir):
+        super().__init__()
+        self.names = tuple(names)
+        self.incluir = incluir
+
+    def filter(self, record):
+        roteado = any(record.name == n or record.name.startswith(n + '.') for n in self.names)
+        return roteado == self.incluir
+
+
+def parse_levels(spec):
+    """
+    Níveis por módulo a partir de "modulo=NIVEL,outro=NIVEL".
+
+    Returns:
+        dict: {nome do logger: nível}
+    """
+    niveis = {}
+    for item in filter(None, (parte.strip() for parte in spec.split(','))):
+        nome, _, nivel = item.partition('=')
+        if not nivel:
+            logger.warning("LOG_LEVELS: item sem nível ignorado: %s", item)
+            continue
+        niveis[nome.strip()] = nivel.strip().upper()
+    return niveis
+
+
+def _start_listener(queue_size):
+    global _listener
+    _queue_handler.queue = queue.Queue(maxsize=queue_size)
+    _listener = logging.handlers.QueueListener(_queue_handler.queue, *_handlers, respect_handler_level=True)
+    _listener.start()
+
+
+def stop():
+    """Grava o que ainda está na fila e encerra o listener (chamado na saída do processo)."""
+    global _listener
+    listener, _listener = _listener, None
+    if listener is not None:
+        listener.stop()
+
+
+def setup_logging(level, filename, formatter, levels=None, debug_rate=0, queue_size=10000, routes=None):
+    """
+    Configura o logger raiz com a fila e o arquivo de log.
+
+    Args:
+        level: Nível do logger raiz
+        filename: Arquivo de log
+        formatter: logging.Formatter do arquivo
+        levels: {nome do logger: nível} (ver parse_levels)
+        debug_rate: Registros DEBUG por minuto por linha de código (0 = sem limite)
+        queue_size: Tamanho máximo da fila
+        routes: {nome do logger: arquivo}, gravados só nesse arquivo e sem formatação
+    """
+    global _queue_handler, _handlers
+    routes = {nome: path for nome, path in (routes or {}).items() if path}
+
+    root_logger = logging.getLogger()
+    file_handler = logging.FileHandler(filename, encoding='utf-8')
+    file_handler.setFormatter(formatter)
+    # Handlers já configurados no raiz (ex.: console do basicConfig) também passam a ser
+    # alimentados pela fila
+    handlers = [file_handler] + list(root_logger.handlers)
+    for handler in root_logger.handlers[:]:
+        root_logger.removeHandler(handler)
+    if routes:
+        for handler in handlers:
+            handler.addFilter(_RouteFilter(routes, incluir=False))
+        for nome, path in routes.items():
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            handler = logging.FileHandler(path, encoding='utf-8')
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            handler.addFilter(_RouteFilter((nome,), incluir=True))
+            handlers.append(handler)
+            # A rota grava mesmo com o raiz acima de INFO
+            logging.getLogger(nome).setLevel(logging.INFO)
+    _handlers = tuple(handlers)
+
+    _queue_handler = _QueueHandler(None)
+    if debug_rate:
+        _queue_handler.addFilter(RateLimitFilter(debug_rate))
+    _start_listener(queue_size)
+
+    root_logger.setLevel(level)
+    root_logger.addHandler(_queue_handler)
+    for nome, nivel in (levels or {}).items():
+        logging.getLogger(nome).setLevel(nivel)
+
+    atexit.register(stop)
+    if hasattr(os, 'register_at_fork'):
+        # A thread do listener não existe no processo filho: cria fila e listener novos
+        os.register_at_fork(after_in_child=lambda: _start_listener(queue_size))
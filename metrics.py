@@ -0,0 +1,186 @@
+"""
+Métricas no formato do Prometheus (/metrics): latência dos callbacks, cache, leitura de parquet,
+tamanho das respostas dos callbacks (figuras) e duração das exportações.
+
+Com o gunicorn, cada worker grava seus valores em arquivos no diretório PROMETHEUS_MULTIPROC_DIR
+(definido por gunicorn.conf.py antes da importação do app) e o /metrics de qualquer worker soma
+os valores de todos. Sem o diretório, as métricas são só do processo atual (servidor de
+desenvolvimento). Sem o pacote prometheus_client, as métricas são ignoradas.
+"""
+import logging
+import os
+import time
+from functools import wraps
+
+from flask import g, request
+
+try:
+    from prometheus_client import (
+        CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+    )
+except ImportError:  # prometheus_client é opcional
+    Counter = Gauge = Histogram = None
+
+logger = logging.getLogger('metrics')
+
+MULTIPROC_DIR = os.getenv('PROMETHEUS_MULTIPROC_DIR')
+
+# Callbacks vão de milissegundos (troca de ano) a segundos (exportação, primeira carga)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+SIZE_BUCKETS = (1e3, 1e4, 5e4, 1e5, 2.5e5, 5e5, 1e6, 2.5e6, 5e6, 1e7)
+
+
+class _NoOp:
+    """Métrica que ignora as chamadas (sem prometheus_client)."""
+    def labels(self, *args, **kwargs):
+        return self
+
+    def observe(self, *args):
+        pass
+
+    def inc(self, *args):
+        pass
+
+    def set(self, *args):
+        pass
+
+
+def _metric(cls, name, documentation, labelnames=(), **kwargs):
+    return _NoOp() if cls is None else cls(name, documentation, labelnames, **kwargs)
+
+
+CALLBACK_DURATION = _metric(
+    Histogram, 'painel_callback_duration_seconds', 'Duração dos callbacks do Dash',
+    ('callback', 'indicador'), buckets=LATENCY_BUCKETS)
+CALLBACK_RESPONSE_BYTES = _metric(
+    Histogram, 'painel_callback_response_bytes', 'Tamanho da resposta JSON dos callbacks (antes da compressão)',
+    ('callback',), buckets=SIZE_BUCKETS)
+CACHE_HITS = _metric(Counter, 'painel_cache_hits_total', 'Acertos do cache de dados por nível', ('tier',))
+CACHE_MISSES = _metric(Counter, 'painel_cache_misses_total', 'Itens não encontrados no cache de dados')
+CACHE_EVICTIONS = _metric(Counter, 'painel_cache_evictions_total', 'Itens removidos do cache em memória')
+CACHE_BYTES = _metric(
+    Counter, 'painel_cache_bytes_total', 'Bytes lidos/gravados no cache em disco', ('tier', 'operation'))
+CACHE_MEMORY_BYTES = _metric(
+    Gauge, 'painel_cache_memory_bytes', 'Memória ocupada pelos itens do cache em memória',
+    multiprocess_mode='livesum')
+PARQUET_LOAD = _metric(
+    Histogram, 'painel_parquet_load_seconds', 'Tempo de leitura dos arquivos parquet', buckets=LATENCY_BUCKETS)
+PARQUET_BYTES = _metric(Counter, 'painel_parquet_bytes_total', 'Bytes de parquet lidos')
+EXPORT_DURATION = _metric(
+    Histogram, 'painel_export_duration_seconds', 'Tempo de geração das exportações',
+    ('formato', 'escopo'), buckets=LATENCY_BUCKETS)
+EXPORT_BYTES = _metric(
+    Histogram, 'painel_export_bytes', 'Tamanho dos arquivos exportados', ('formato', 'escopo'), buckets=SIZE_BUCKETS)
+
+
+# Função que devolve os IDs de indicador válidos (definida por instrument_callbacks)
+_known_indicators = None
+
+
+def callback_indicator(outputs_list):
+    """
+    Indicador do callback a partir dos ids (pattern-matching) das saídas, ou '' se não houver.
+
+    Os ids vêm da requisição do navegador: um valor fora dos indicadores conhecidos vira '', para
+    que requisições forjadas não criem novas séries de métricas.
+    """
+    pendentes = [outputs_list]
+    while pendentes:
+        item = pendentes.pop()
+        if isinstance(item, list):
+            pendentes.extend(item)
+        elif isinstance(item, dict):
+            component_id = item.get('id')
+            if isinstance(component_id, dict) and isinstance(component_id.get('index'), str):
+                indicador = component_id['index']
+                if _known_indicators is not None and indicador not in _known_indicators():
+                    return ''
+                return indicador
+    return ''
+
+
+def _instrument(func):
+    """Mede a duração de um callback (nome da função e indicador das saídas)."""
+    nome = func.__name__
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        indicador = callback_indicator(kwargs.get('outputs_list'))
+        g.metrics_callback = nome
+        inicio = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            CALLBACK_DURATION.labels(nome, indicador).observe(time.perf_counter() - inicio)
+    return wrapper
+
+
+def instrument_callbacks(app, known_indicators=None):
+    """
+    Instrumenta os callbacks do servidor já registrados no app (chamar depois de todos os @app.callback).
+
+    Args:
+        app: Aplicativo Dash
+        known_indicators: Função sem argumentos que devolve os IDs de indicador válidos (usados
+            no rótulo 'indicador'); sem ela, qualquer id das saídas é aceito
+    """
+    global _known_indicators
+    _known_indicators = known_indicators
+    if Histogram is None:
+        return
+    quantidade = 0
+    for entrada in app.callback_map.values():
+        # Callbacks clientside não têm função no servidor
+        if 'callback' in entrada and not getattr(entrada['callback'], '_metricas', False):
+            entrada['callback'] = _instrument(entrada['callback'])
+            entrada['callback']._metricas = True
+            quantidade += 1
+    logger.info("Métricas: %d callbacks instrumentados", quantidade)
+
+
+def after_request(response):
+    """
+    Registra o tamanho das respostas dos callbacks (registrar em after_request depois da
+    compressão, para rodar antes dela).
+    """
+    nome = g.get('metrics_callback')
+    if nome and request.path.endswith('/_dash-update-component') and not response.direct_passthrough:
+        CALLBACK_RESPONSE_BYTES.labels(nome).observe(response.calculate_content_length() or 0)
+    return response
+
+
+def observe_export(formato, escopo, inicio, content):
+    """
+    Registra a duração e o tamanho de uma exportação gerada.
+
+    Args:
+        formato: 'csv' ou 'xlsx'
+        escopo: 'selecao' ou 'completo'
+        inicio: time.perf_counter() do início da geração
+        content: bytes gerados
+    """
+    EXPORT_DURATION.labels(formato, escopo).observe(time.perf_counter() - inicio)
+    EXPORT_BYTES.labels(formato, escopo).observe(len(content))
+
+
+def render():
+    """
+    Conteúdo do /metrics.
+
+    Returns:
+        Tupla (corpo, status, content type)
+    """
+    if Histogram is None:
+        return 'prometheus_client não instalado\n', 503, 'text/plain; charset=utf-8'
+    if MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), 200, CONTENT_TYPE_LATEST
+
+
+def mark_process_dead(pid):
+    """Descarta as métricas "live" de um worker encerrado (hook child_exit do gunicorn)."""
+    if Histogram is not None and MULTIPROC_DIR:
+        multiprocess.mark_process_dead(pid)
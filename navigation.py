@@ -0,0 +1,142 @@
+import logging
+import os
+
+import dash_bootstrap_components as dbc
+from dash import dcc, html
+
+logger = logging.getLogger('navigation')
+
+RESULTADOS_DIR = 'db/resultados'
+# Arquivos que definem a estrutura objetivo → meta → indicador
+NAVIGATION_FILES = ('db/objetivos.csv', 'db/metas.csv', 'db/indicadores.csv')
+
+
+def indicator_parquet_path(indicador_id):
+    """Caminho do arquivo parquet com os dados do indicador."""
+    nome_arquivo = indicador_id.lower().replace("indicador ", "")
+    return f'{RESULTADOS_DIR}/indicador{nome_arquivo}.parquet'
+
+
+def get_data_version():
+    """
+    Versão dos dados do painel: datas de modificação dos CSVs de navegação, do diretório de
+    resultados (parquets criados ou removidos) e do parquet alterado mais recentemente.
+
+    Returns:
+        Tupla de timestamps (None para caminhos inexistentes)
+    """
+    version = []
+    for path in NAVIGATION_FILES + (RESULTADOS_DIR,):
+        try:
+            version.append(os.stat(path).st_mtime_ns)
+        except OSError:
+            version.append(None)
+    try:
+        with os.scandir(RESULTADOS_DIR) as entries:
+            version.append(max((entry.stat().st_mtime_ns for entry in entries
+                                if entry.name.endswith('.parquet')), default=None))
+    except OSError:
+        version.append(None)
+    return tuple(version)
+
+
+def _lazy_tab(indicador):
+    """Aba de um indicador carregado sob demanda (conteúdo preenchido por load_indicator_on_demand)."""
+    indicador_id = indicador['ID_INDICADOR']
+    tab_content = [
+        # Coloca o spinner ao lado do título para economizar espaço
+        html.Div([
+            html.P(indicador['DESC_INDICADOR'], className="textJustify",
+                   style={'display': 'inline-block', 'marginRight': '10px'}),
+            dbc.Spinner(color="primary", size="sm", type="grow",
+                        spinner_style={'display': 'inline-block'},
+                        id={'type': 'spinner-indicator', 'index': indicador_id})
+        ], className="p-3"),
+        # Div oculta que será substituída pelo conteúdo quando carregado
+        html.Div(id={'type': 'lazy-load-container', 'index': indicador_id}, style={'minHeight': '50px'}),
+        # O store é preenchido com a seleção inicial quando a aba é carregada
+        dcc.Store(id={'type': 'visualization-state-store', 'index': indicador_id},
+                  data={'selected_var': None, 'selected_filters': {}})
+    ]
+    return dbc.Tab(tab_content, label=indicador_id, tab_id=f"tab-{indicador_id}",
+                   id={'type': 'tab-indicador', 'index': indicador_id})
+
+
+class NavigationTree:
+    """
+    Estrutura objetivo → meta → indicador compilada uma vez, com os componentes prontos para servir.
+
+    Guarda, para cada objetivo, o cabeçalho, a descrição e as metas com dados; para cada meta,
+    a descrição, os indicadores com arquivo de dados, a barra de metas com ela marcada como ativa
+    e as abas (sob demanda) dos indicadores que não são o primeiro; e a meta de cada indicador. Os componentes são
+    compartilhados entre requisições e não devem ser alterados.
+    """
+    def __init__(self, df_objetivos, df_metas, df_indicadores, intro_content=None):
+        """
+        Compila a árvore de navegação.
+
+        Args:
+            df_objetivos: DataFrame dos objetivos (a posição da linha é o índice do botão)
+            df_metas: DataFrame das metas
+            df_indicadores: DataFrame dos indicadores
+            intro_content: Conteúdo exibido no objetivo 0 (no lugar de DESC_OBJETIVO)
+        """
+        # Indicadores com arquivo de dados, agrupados por meta (ordem do CSV)
+        indicadores_por_meta = {}
+        cols = [col for col in ('ID_INDICADOR', 'ID_META', 'DESC_INDICADOR', 'VARIAVEIS')
+                if col in df_indicadores.columns]
+        for indicador in df_indicadores[cols].to_dict('records'):
+            if os.path.exists(indicator_parquet_path(indicador['ID_INDICADOR'])):
+                indicadores_por_meta.setdefault(indicador['ID_META'], []).append(indicador)
+
+        # Metas com indicadores disponíveis, agrupadas por objetivo (ordem do CSV)
+        metas_por_objetivo = {}
+        descricoes_metas = {}
+        if not df_metas.empty:
+            for meta in df_metas[['ID_META', 'ID_OBJETIVO', 'DESC_META']].to_dict('records'):
+                if meta['ID_META'] in indicadores_por_meta:
+                    metas_por_objetivo.setdefault(meta['ID_OBJETIVO'], []).append(meta['ID_META'])
+                    descricoes_metas[meta['ID_META']] = meta['DESC_META']
+
+        self.objetivos = []
+        self.objetivos_por_id = {}
+        for index, row_obj in enumerate(df_objetivos.to_dict('records')):
+            objetivo_id = row_obj['ID_OBJETIVO']
+            header = f"{objetivo_id} - {row_obj['RES_OBJETIVO']}"
+            objetivo = {
+                'id': objetivo_id,
+                'header': header if index > 0 else row_obj['RES_OBJETIVO'],
+                'content': intro_content if index == 0 and intro_content is not None else row_obj['DESC_OBJETIVO'],
+                'meta_ids': metas_por_objetivo.get(objetivo_id, []),
+            }
+            self.objetivos.append(objetivo)
+            # O clique em uma meta sempre mostra o cabeçalho completo do objetivo
+            self.objetivos_por_id.setdefault(objetivo_id, {**objetivo, 'header': header,
+                                                           'content': row_obj['DESC_OBJETIVO']})
+
+        self.metas = {}
+        self.meta_por_indicador = {}
+        for objetivo_id, meta_ids in metas_por_objetivo.items():
+            for meta_id in meta_ids:
+                indicadores = indicadores_por_meta[meta_id]
+                for indicador in indicadores:
+                    self.meta_por_indicador[indicador['ID_INDICADOR']] = meta_id
+                self.metas[meta_id] = {
+                    'objetivo_id': objetivo_id,
+                    'desc': descricoes_metas[meta_id],
+                    'indicadores': indicadores,
+                    'nav': [
+                        dbc.NavLink(
+                            outra_meta,
+                            id={'type': 'meta-button', 'index': outra_meta},
+                            href="#",
+                            active=(outra_meta == meta_id),
+                            className="nav-link",
+                            n_clicks=0  # Reset n_clicks
+                        ) for outra_meta in meta_ids
+                    ],
+                    'lazy_tabs': [_lazy_tab(indicador) for indicador in indicadores[1:]],
+                }
+
+        logger.info("Árvore de navegação compilada: %d objetivos, %d metas com dados",
+                    len(self.objetivos), len(self.metas))
@@ -0,0 +1,101 @@
+"""
+Pool de processos para as etapas que ocupam a CPU segurando o GIL (codificação do Excel/CSV,
+leitura de parquet).
+
+Com workers gthread, uma exportação Excel de 1-2 s em uma thread segura o GIL e atrasa as
+demais requisições do mesmo worker (layout, estáticos, callbacks leves). Executadas em um
+processo à parte, essas etapas deixam o worker livre; o custo é serializar a entrada e o
+resultado (DataFrames e bytes são baratos de serializar; figuras com GeoJSON não, por isso
+continuam na thread).
+
+O pool é de cada worker, criado por start() depois do fork (gunicorn.conf.py) e compartilhado
+pelas threads do worker. Sem start() (ou com OFFLOAD_PROCESSES=0) run() executa na própria
+thread, como antes. Os processos do pool nascem de um forkserver que já importou pandas e
+pyarrow, então a primeira tarefa não paga essas importações.
+"""
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import pandas as pd
+
+from config import OFFLOAD_PROCESSES
+
+logger = logging.getLogger('offload')
+
+_pool = None
+_lock = threading.Lock()
+
+
+def read_parquet(path):
+    """Lê o parquet (função de módulo: pode ser executada no pool)."""
+    return pd.read_parquet(path)
+
+
+def start(processes=None):
+    """
+    Cria o pool deste processo (chamar no worker, depois do fork).
+
+    Args:
+        processes: Quantidade de processos (padrão: OFFLOAD_PROCESSES; 0 desativa)
+    """
+    global _pool
+    processes = OFFLOAD_PROCESSES if processes is None else processes
+    if processes <= 0:
+        return
+    with _lock:
+        if _pool is not None:
+            return
+        contexto = multiprocessing.get_context('forkserver')
+        contexto.set_forkserver_preload(['offload', 'exports'])
+        _pool = ProcessPoolExecutor(max_workers=processes, mp_context=contexto)
+    logger.info("Pool de processos iniciado no worker %d: %d processos", os.getpid(), processes)
+
+
+def shutdown():
+    """Encerra o pool deste processo (as próximas tarefas rodam na própria thread)."""
+    global _pool
+    with _lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def run(func, *args):
+    """
+    Executa func(*args) no pool de processos, ou na própria thread sem pool.
+
+    Se o pool quebrar (processo morto por falta de memória, por exemplo), a tarefa é refeita na
+    thread e o pool é recriado na próxima chamada.
+
+    Args:
+        func: Função de módulo (precisa ser importável pelos processos do pool)
+        *args: Argumentos serializáveis
+
+    Returns:
+        O resultado de func(*args)
+    """
+    pool = _pool
+    if pool is None:
+        return func(*args)
+    try:
+        return pool.submit(func, *args).result()
+    except BrokenProcessPool:
+        logger.warning("Pool de processos quebrado; executando %s na thread e recriando o pool", func.__name__)
+        shutdown()
+        start()
+        return func(*args)
+
+
+def _reset_after_fork():
+    # O pool pertence ao processo pai: o filho cria o próprio com start()
+    global _pool, _lock
+    _pool = None
+    _lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
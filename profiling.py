@@ -0,0 +1,138 @@
+"""
+Diagnóstico sob demanda de um worker em produção (rotas /admin/profile/* do app.py).
+
+- sample_stacks(): amostra, a intervalos regulares, a pilha de todas as threads do processo
+  (exceto a que está amostrando) e devolve as pilhas no formato "collapsed" (uma linha
+  "thread;quadro;quadro;... contagem"), aceito por flamegraph.pl, speedscope e inferno.
+  É tempo de parede: threads paradas esperando (lock, socket) também aparecem. Com workers
+  sync a própria requisição ocupa o worker, então só as threads de segundo plano (preload,
+  prefetch) são vistas; com gthread as demais threads atendem normalmente e são amostradas.
+- memory_diff(): liga o tracemalloc por alguns segundos e compara duas fotografias das
+  alocações (o que foi alocado e continua vivo na janela, por linha de código), junto das
+  estatísticas do cache antes e depois.
+
+Um diagnóstico por vez em cada processo; os processos do pool de offload não são amostrados.
+"""
+import collections
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+logger = logging.getLogger('profiling')
+
+_running = threading.Lock()
+
+
+class ProfilerBusy(RuntimeError):
+    """Já existe um diagnóstico em andamento neste processo."""
+
+
+def _collapse(frame, thread_name):
+    """Pilha de um quadro no formato collapsed (raiz primeiro, separada por ';')."""
+    quadros = []
+    while frame is not None:
+        code = frame.f_code
+        quadros.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    quadros.append(thread_name)
+    return ';'.join(reversed(quadros))
+
+
+def sample_stacks(seconds, interval=0.01):
+    """
+    Amostra as pilhas das threads do processo durante alguns segundos.
+
+    Args:
+        seconds: Duração da amostragem
+        interval: Intervalo entre amostras em segundos
+
+    Returns:
+        str: Pilhas no formato collapsed, uma por linha ("pilha contagem"), mais frequentes primeiro
+
+    Raises:
+        ProfilerBusy: Se outro diagnóstico estiver em andamento
+    """
+    if not _running.acquire(blocking=False):
+        raise ProfilerBusy()
+    try:
+        propria = threading.get_ident()
+        contagens = collections.Counter()
+        amostras = 0
+        fim = time.monotonic() + seconds
+        while time.monotonic() < fim:
+            nomes = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident != propria:
+                    contagens[_collapse(frame, nomes.get(ident, f'thread-{ident}'))] += 1
+            amostras += 1
+            time.sleep(interval)
+    finally:
+        _running.release()
+    logger.info("Perfil de CPU do processo %d: %d amostras em %.1f s, %d pilhas distintas",
+                os.getpid(), amostras, seconds, len(contagens))
+    return ''.join(f"{pilha} {quantidade}\n" for pilha, quantidade in contagens.most_common())
+
+
+def memory_diff(seconds, stats_func=None, limit=30, frames=1):
+    """
+    Alocações feitas (e ainda vivas) durante alguns segundos, agrupadas por linha de código.
+
+    Só o que é alocado com o tracemalloc ligado é rastreado: a primeira fotografia é tirada
+    logo depois de ligá-lo e a segunda ao fim da janela, então a diferença mostra o que a
+    carga no período (ex.: itens que entraram no cache) deixou na memória.
+
+    Args:
+        seconds: Duração da janela
+        stats_func: Função que devolve estatísticas (ex.: cache_manager.get_stats) antes e depois
+        limit: Quantidade de linhas do relatório
+        frames: Quadros guardados por alocação (mais quadros = mais contexto e mais custo)
+
+    Returns:
+        str: Relatório em texto
+
+    Raises:
+        ProfilerBusy: Se outro diagnóstico estiver em andamento
+    """
+    if not _running.acquire(blocking=False):
+        raise ProfilerBusy()
+    ja_ligado = tracemalloc.is_tracing()
+    try:
+        if not ja_ligado:
+            tracemalloc.start(frames)
+        antes_stats = stats_func() if stats_func else None
+        antes = tracemalloc.take_snapshot()
+        time.sleep(seconds)
+        depois = tracemalloc.take_snapshot()
+        depois_stats = stats_func() if stats_func else None
+        atual, pico = tracemalloc.get_traced_memory()
+    finally:
+        if not ja_ligado:
+            tracemalloc.stop()
+        _running.release()
+
+    # As próprias estruturas do tracemalloc não interessam
+    filtros = [tracemalloc.Filter(False, tracemalloc.__file__)]
+    agrupamento = 'traceback' if frames > 1 else 'lineno'
+    diferencas = depois.filter_traces(filtros).compare_to(antes.filter_traces(filtros), agrupamento)
+    total = sum(d.size_diff for d in diferencas)
+
+    linhas = [
+        f"Processo {os.getpid()}: alocações em {seconds:.1f} s",
+        f"Diferença total: {total / 1024:+.1f} KiB (rastreado: {atual / 1024:.1f} KiB, pico: {pico / 1024:.1f} KiB)",
+    ]
+    if antes_stats is not None:
+        linhas.append("")
+        linhas.append("Estatísticas (antes -> depois):")
+        for chave, valor in antes_stats.items():
+            novo = depois_stats.get(chave)
+            linhas.append(f"  {chave}: {valor} -> {novo}" if novo != valor else f"  {chave}: {valor}")
+    linhas.append("")
+    linhas.append(f"Maiores diferenças (de {len(diferencas)}):")
+    for diferenca in diferencas[:limit]:
+        linhas.append(f"  {diferenca.size_diff / 1024:+10.1f} KiB {diferenca.count_diff:+8d} blocos")
+        linhas.extend(f"      {linha.strip()}" for linha in diferenca.traceback.format(most_recent_first=True))
+    logger.info("Diferença de memória do processo %d: %+.1f KiB em %.1f s", os.getpid(), total / 1024, seconds)
+    return '\n'.join(linhas) + '\n'
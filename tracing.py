@@ -0,0 +1,267 @@
+"""
+Rastreamento (spans) dos callbacks do Dash e das etapas internas das visualizações.
+
+Cada callback do servidor abre um trace; funções decoradas com @traced abrem spans filhos e
+stage() divide o span atual em etapas sequenciais (carga, filtro, merges, figura...), sem
+precisar reindentar o código: cada etapa termina quando a próxima começa ou quando o span termina.
+A serialização da resposta pelo Dash é a última etapa.
+
+Ao final do callback:
+- se TRACE_FILE estiver definido, o trace é gravado em uma linha JSON no formato OTLP/JSON do
+  OpenTelemetry (ExportTraceServiceRequest), legível pelo collector (receiver otlpjsonfile);
+- se durar mais que SLOW_REQUEST_MS, um log estruturado (JSON) com as etapas e os atributos da
+  seleção é emitido no logger 'tracing'.
+
+Fora de um callback (scripts, benchmark) as funções não fazem nada.
+"""
+import contextvars
+import json
+import logging
+import os
+import time
+from functools import wraps
+
+from dash.exceptions import PreventUpdate
+
+from config import SLOW_REQUEST_MS, TRACE_FILE
+from metrics import callback_indicator
+
+logger = logging.getLogger('tracing')
+# Logger dos traces exportados: roteado para TRACE_FILE pelo logging_setup, que grava em outra thread
+SPANS_LOGGER = 'tracing.spans'
+_spans_logger = logging.getLogger(SPANS_LOGGER)
+
+SERVICE_NAME = 'painel-ods'
+# Tipos de span do OTLP
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+# Status do OTLP
+STATUS_ERROR = 2
+
+_current = contextvars.ContextVar('tracing_span', default=None)
+
+
+def _new_id(n_bytes):
+    return os.urandom(n_bytes).hex()
+
+
+class Span:
+    """Intervalo de tempo nomeado, com atributos e uma etapa (stage) aberta."""
+    __slots__ = ('trace', 'name', 'span_id', 'parent', 'kind', 'start_ns', 'end_ns', 'attributes', 'status',
+                 '_stage')
+
+    def __init__(self, trace, name, parent=None, kind=SPAN_KIND_INTERNAL):
+        self.trace = trace
+        self.name = name
+        self.span_id = _new_id(8)
+        self.parent = parent
+        self.kind = kind
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = {}
+        self.status = None  # None, ou (código, mensagem)
+        self._stage = None
+        trace.spans.append(self)
+
+    def end_stage(self):
+        if self._stage is not None:
+            self._stage.end()
+            self._stage = None
+
+    def end(self):
+        if self.end_ns is None:
+            self.end_stage()
+            self.end_ns = time.time_ns()
+
+    @property
+    def duration_ms(self):
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+    def path(self):
+        """Nome com os spans ancestrais (sem a raiz), ex.: 'create_visualization/filtro'."""
+        nomes = []
+        span = self
+        while span.parent is not None:
+            nomes.append(span.name)
+            span = span.parent
+        return '/'.join(reversed(nomes))
+
+
+class Trace:
+    """Spans de uma execução de callback."""
+    __slots__ = ('trace_id', 'spans')
+
+    def __init__(self):
+        self.trace_id = _new_id(16)
+        self.spans = []
+
+
+def _attribute_value(valor):
+    """Valor de atributo no formato OTLP/JSON (AnyValue)."""
+    if isinstance(valor, bool):
+        return {'boolValue': valor}
+    if isinstance(valor, int):
+        return {'intValue': str(valor)}
+    if isinstance(valor, float):
+        return {'doubleValue': valor}
+    return {'stringValue': str(valor)}
+
+
+def _to_otlp(trace):
+    """Trace no formato OTLP/JSON (um ExportTraceServiceRequest)."""
+    spans = []
+    for span in trace.spans:
+        otlp = {
+            'traceId': trace.trace_id,
+            'spanId': span.span_id,
+            'parentSpanId': span.parent.span_id if span.parent is not None else '',
+            'name': span.name,
+            'kind': span.kind,
+            'startTimeUnixNano': str(span.start_ns),
+            'endTimeUnixNano': str(span.end_ns or span.start_ns),
+            'attributes': [{'key': k, 'value': _attribute_value(v)} for k, v in span.attributes.items()],
+        }
+        if span.status is not None:
+            otlp['status'] = {'code': span.status[0], 'message': span.status[1]}
+        spans.append(otlp)
+    return {'resourceSpans': [{
+        'resource': {'attributes': [
+            {'key': 'service.name', 'value': {'stringValue': SERVICE_NAME}},
+            {'key': 'process.pid', 'value': {'intValue': str(os.getpid())}},
+        ]},
+        'scopeSpans': [{'scope': {'name': 'tracing'}, 'spans': spans}],
+    }]}
+
+
+class _OtlpLine:
+    """Trace serializado só quando o registro de log é formatado (na thread de escrita do log)."""
+    __slots__ = ('trace',)
+
+    def __init__(self, trace):
+        self.trace = trace
+
+    def __str__(self):
+        return json.dumps(_to_otlp(self.trace), ensure_ascii=False, separators=(',', ':'))
+
+
+def _export(trace):
+    """Envia o trace para TRACE_FILE (uma linha JSON por trace)."""
+    _spans_logger.info('%s', _OtlpLine(trace))
+
+
+def _log_slow(root):
+    """Log estruturado de uma requisição lenta: duração, atributos da seleção e etapas."""
+    atributos = {}
+    for span in root.trace.spans:
+        for chave, valor in span.attributes.items():
+            atributos.setdefault(chave, valor)
+    etapas = [{'etapa': span.path(), 'ms': round(span.duration_ms, 1)}
+              for span in root.trace.spans if span.parent is not None]
+    logger.warning("Requisição lenta: %s", json.dumps({
+        'callback': root.name,
+        'duracao_ms': round(root.duration_ms, 1),
+        'trace_id': root.trace.trace_id,
+        'atributos': atributos,
+        'etapas': etapas,
+    }, ensure_ascii=False, default=str))
+
+
+def set_attributes(**attributes):
+    """Adiciona atributos ao span atual (ex.: indicador, variável e filtros da seleção)."""
+    span = _current.get()
+    if span is not None:
+        span.attributes.update({k: v for k, v in attributes.items() if v is not None})
+
+
+def stage(name):
+    """
+    Inicia uma etapa do span atual, terminando a etapa anterior.
+
+    Args:
+        name: Nome da etapa (ex.: 'carga', 'filtro', 'figura')
+    """
+    span = _current.get()
+    if span is not None:
+        span.end_stage()
+        span._stage = Span(span.trace, name, parent=span)
+
+
+def traced(name):
+    """Decorador: executa a função em um span filho do span atual (nada muda fora de um trace)."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            pai = _current.get()
+            if pai is None:
+                return func(*args, **kwargs)
+            span = Span(pai.trace, name, parent=pai._stage or pai)
+            token = _current.set(span)
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                span.status = (STATUS_ERROR, f"{type(e).__name__}: {e}")
+                raise
+            finally:
+                _current.reset(token)
+                span.end()
+        return wrapper
+    return decorator
+
+
+def _trace_callback(func):
+    """Abre um trace para cada execução do callback."""
+    nome = func.__name__
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        root = Span(Trace(), nome, kind=SPAN_KIND_SERVER)
+        root.attributes['callback'] = nome
+        indicador = callback_indicator(kwargs.get('outputs_list'))
+        if indicador:
+            root.attributes['indicador'] = indicador
+        token = _current.set(root)
+        try:
+            return func(*args, **kwargs)
+        except PreventUpdate:
+            root.attributes['dash.prevent_update'] = True
+            raise
+        except Exception as e:
+            root.status = (STATUS_ERROR, f"{type(e).__name__}: {e}")
+            raise
+        finally:
+            _current.reset(token)
+            root.end()
+            if TRACE_FILE:
+                _export(root.trace)
+            if SLOW_REQUEST_MS and root.duration_ms >= SLOW_REQUEST_MS:
+                _log_slow(root)
+    return wrapper
+
+
+def instrument_callbacks(app):
+    """
+    Abre um trace por execução de cada callback do servidor e mede a serialização da resposta.
+
+    Args:
+        app: Aplicativo Dash (chamar depois de todos os @app.callback)
+    """
+    import dash._callback
+
+    quantidade = 0
+    for entrada in app.callback_map.values():
+        if 'callback' in entrada and not getattr(entrada['callback'], '_tracing', False):
+            entrada['callback'] = _trace_callback(entrada['callback'])
+            entrada['callback']._tracing = True
+            quantidade += 1
+
+    # O Dash serializa a resposta dentro do callback registrado: a serialização vira a última etapa
+    to_json = dash._callback.to_json
+    if not getattr(to_json, '_tracing', False):
+        @wraps(to_json)
+        def traced_to_json(*args, **kwargs):
+            stage('serializacao')
+            return to_json(*args, **kwargs)
+        traced_to_json._tracing = True
+        dash._callback.to_json = traced_to_json
+    logger.info("Rastreamento: %d callbacks instrumentados (arquivo: %s, lento acima de %s ms)",
+                quantidade, TRACE_FILE or 'desativado', SLOW_REQUEST_MS or '-')